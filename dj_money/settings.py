@@ -145,6 +145,10 @@ LOGIN_REDIRECT_URL = '/'
 
 FIXER_API_URL = env('FIXER_API_URL')
 FIXER_API_KEY = env('FIXER_API_KEY')
+# Fetch date ranges with the timeseries endpoint. Off by default: it needs a paid plan
+FIXER_USE_TIMESERIES = env.bool('FIXER_USE_TIMESERIES', default=False)
+# Date ranges are fetched with the timeseries endpoint in chunks of up to this many days.
+FIXER_TIMESERIES_MAX_DAYS = 365
 
 DOWNLOAD_API_TOKEN = env('DOWNLOAD_API_TOKEN')
 YANDEX_ACCESS_KEY = env('YANDEX_ACCESS_KEY')
@@ -152,6 +156,15 @@ YANDEX_SECRET_KEY = env('YANDEX_SECRET_KEY')
 YANDEX_BUCKET = env('YANDEX_BUCKET')
 YANDEX_ENDPOINT= env('YANDEX_ENDPOINT')
 
+# Directory of a filesystem-backed S3 stand-in (local development and benchmarks), empty for real S3
+LOCAL_S3_ROOT = env('LOCAL_S3_ROOT', default=None)
+# Connections kept by the shared S3 client of a worker process
+S3_MAX_POOL_CONNECTIONS = env.int('S3_MAX_POOL_CONNECTIONS', default=20)
+# Uploads above the threshold are sent in parts of S3_MULTIPART_CHUNKSIZE by S3_MAX_CONCURRENCY threads
+S3_MULTIPART_THRESHOLD = env.int('S3_MULTIPART_THRESHOLD', default=8 * 1024 * 1024)
+S3_MULTIPART_CHUNKSIZE = env.int('S3_MULTIPART_CHUNKSIZE', default=8 * 1024 * 1024)
+S3_MAX_CONCURRENCY = env.int('S3_MAX_CONCURRENCY', default=4)
+
 YANDEX_GPT_SECRET_KEY= env('YANDEX_GPT_SECRET_KEY')
 YANDEX_ID_FOLDER= env('YANDEX_ID_FOLDER')
 
@@ -170,5 +183,49 @@ OPENAI_API_KEY = env('OPENAI_API_KEY')
 
 BATCH_CATEGORIZATION_SIZE = 10
 
+# Model backend of the categorization job: yandexgpt, gpt-4o or fake (offline)
+CATEGORIZATION_BACKEND = env('CATEGORIZATION_BACKEND', default='yandexgpt')
+# Prompts of one categorization job sent at the same time
+CATEGORIZATION_CONCURRENCY = env.int('CATEGORIZATION_CONCURRENCY', default=8)
+# Prompts per second sent by one categorization job (0 disables the limit)
+CATEGORIZATION_RATE_LIMIT = env.float('CATEGORIZATION_RATE_LIMIT', default=5.0)
+
+# A place becomes an EXACT rule when at least PLACE_RULES_MIN_SUPPORT of its categorized
+# transactions exist and at least PLACE_RULES_MIN_SHARE of them agree on the category
+PLACE_RULES_MIN_SUPPORT = 3
+PLACE_RULES_MIN_SHARE = 0.9
+
+# Transactions per page of the transaction list and the maximum `limit` of the JSON API
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTIONS_PAGE_SIZE_MAX = 500
+
+# Number of parsed rows inserted with a single bulk_create during statement import
+IMPORT_BULK_BATCH_SIZE = 1000
+# Row errors stored per statement file, the rest are only counted
+IMPORT_MAX_ERRORS = env.int('IMPORT_MAX_ERRORS', default=1000)
+# A PROCESSING statement file without progress for this many seconds is claimed again,
+# so a file whose worker died is not stuck. Keep it above the Celery queue wait
+STATEMENT_CLAIM_TIMEOUT = env.int('STATEMENT_CLAIM_TIMEOUT', default=60 * 60)
+
 # Directory for temporary files shared between containers
-SHARED_TMP_DIR = BASE_DIR / "tmp"
\ No newline at end of file
+SHARED_TMP_DIR = BASE_DIR / "tmp"
+
+# Downloaded statement files are cached here (utils/object_cache.py), the least recently
+# used ones are removed above STATEMENT_CACHE_MAX_BYTES, 0 disables the cache
+STATEMENT_CACHE_DIR = env('STATEMENT_CACHE_DIR', default=str(SHARED_TMP_DIR / 'statement_cache'))
+STATEMENT_CACHE_MAX_BYTES = env.int('STATEMENT_CACHE_MAX_BYTES', default=1024 * 1024 * 1024)
+
+# Local place -> category classifier (train_place_classifier) and the confidence above
+# which its prediction is used instead of asking the model. Places with fewer known
+# n-grams than PLACE_CLASSIFIER_MIN_NGRAMS always go to the model
+PLACE_CLASSIFIER_PATH = env('PLACE_CLASSIFIER_PATH', default=str(SHARED_TMP_DIR / 'place_classifier.npz'))
+PLACE_CLASSIFIER_THRESHOLD = env.float('PLACE_CLASSIFIER_THRESHOLD', default=0.9)
+PLACE_CLASSIFIER_MIN_NGRAMS = env.int('PLACE_CLASSIFIER_MIN_NGRAMS', default=3)
+
+# The file-based cache lives in the shared directory, so web and Celery containers see the same entries
+CACHES = {
+    'default': env.cache('CACHE_URL', default=f'filecache://{SHARED_TMP_DIR / "cache"}')
+}
+
+# How long a compiled set of place -> category rules is kept in the cache (seconds)
+CATEGORY_MATCHER_CACHE_TIMEOUT = 60 * 60 * 24
\ No newline at end of file
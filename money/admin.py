@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django import forms
+from django.forms.models import construct_instance
 
 from .widgets import HierarchicalSelect
+from .utils.exchange_rates import MissingExchangeRate
 
 from .models import IncomeCategory
 from .models import ExpenseCategory
@@ -17,6 +19,9 @@ from .models import GptLog
 from .models import PlaceCategoryMapping
 from .models import BankSource
 from .models import TransactionCategoryLog
+from .models import TaskRunLog
+from .models import PlaceCategoryCache
+from .models import MonthlyAggregate
 
 admin.site.register(Currency)
 admin.site.register(BankCard)
@@ -56,6 +61,31 @@ class TransactionAdminForm(HierarchicalCategoryFormMixin):
         model = Transaction
         fields = '__all__'
 
+    allow_missing_rate = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            # The transaction can't be built without its fields, their errors are shown first
+            return cleaned_data
+        # A transaction stored unconverted can still be edited (e.g. its category)
+        # as long as the currency, amount and date that need the rate stay the same
+        self.allow_missing_rate = (
+            self.instance.pk is not None and self.instance.exchange_rate is None
+            and not {'currency', 'amount', 'date'} & set(self.changed_data)
+        )
+        # The transaction as save() will store it, with the derived amounts, the rate and the hash
+        transaction = construct_instance(self, Transaction(pk=self.instance.pk))
+        try:
+            transaction.prepare_for_save(allow_missing_rate=self.allow_missing_rate)
+        except MissingExchangeRate as e:
+            # A missing rate is shown as a form error instead of failing on save
+            raise forms.ValidationError(str(e))
+        # dedup_hash is not a form field, so the unique constraint is checked here
+        if transaction.dedup_hash and Transaction.objects.filter(dedup_hash=transaction.dedup_hash).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError("A transaction with the same account, type, dates, amounts, currencies and comment already exists.")
+        return cleaned_data
+
 class PlaceCategoryMappingAdminForm(HierarchicalCategoryFormMixin):
      class Meta:
          model = PlaceCategoryMapping
@@ -71,10 +101,37 @@ class PlaceCategoryMappingAdmin(admin.ModelAdmin):
 
 @admin.register(GptLog)
 class GptLogAdmin(admin.ModelAdmin):
-    list_display = ('celery_task_id', 'model_name', 'status', 'created_at', 'updated_at')
+    list_display = ('celery_task_id', 'model_name', 'status', 'cache_hits', 'cache_misses', 'get_cache_hit_rate', 'created_at', 'updated_at')
     list_filter = ('status', 'model_name', 'created_at')
     search_fields = ('celery_task_id', 'prompt', 'result')
-    readonly_fields = ('celery_task_id', 'model_name', 'prompt', 'result', 'status', 'error_message', 'created_at', 'updated_at')
+    readonly_fields = ('celery_task_id', 'model_name', 'prompt', 'result', 'status', 'error_message', 'cache_hits', 'cache_misses', 'created_at', 'updated_at')
+
+    @admin.display(description='Cache hit rate')
+    def get_cache_hit_rate(self, obj):
+        if obj.cache_hit_rate is None:
+            return None
+        return f"{obj.cache_hit_rate:.0%}"
+
+@admin.register(MonthlyAggregate)
+class MonthlyAggregateAdmin(admin.ModelAdmin):
+    list_display = ('month', 'user', 'account', 'category', 'transaction_type', 'amount', 'currency', 'count')
+    list_filter = ('month', 'transaction_type', 'user', 'account')
+    list_select_related = ('user', 'account', 'category', 'currency')
+    readonly_fields = ('user', 'account', 'category', 'transaction_type', 'month', 'currency', 'amount', 'count')
+
+@admin.register(PlaceCategoryCache)
+class PlaceCategoryCacheAdmin(admin.ModelAdmin):
+    list_display = ('place', 'user', 'category', 'prompt_version', 'category_log', 'created_at')
+    list_filter = ('prompt_version', 'user')
+    search_fields = ('place', 'category_log')
+    list_select_related = ('category',)
+
+@admin.register(TaskRunLog)
+class TaskRunLogAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'task_name', 'status', 'wall_time', 'cpu_time', 'db_queries', 'db_time', 'external_calls', 'rows')
+    list_filter = ('task_name', 'status', 'created_at')
+    search_fields = ('celery_task_id', 'error_message')
+    readonly_fields = ('celery_task_id', 'task_name', 'status', 'wall_time', 'cpu_time', 'db_queries', 'db_time', 'external_calls', 'rows', 'error_message', 'created_at')
 
 @admin.register(TransactionCategoryLog)
 class TransactionCategoryLogAdmin(admin.ModelAdmin):
@@ -90,7 +147,7 @@ class TransactionCategoryLogAdmin(admin.ModelAdmin):
 
 @admin.register(BankSource)
 class BankSourceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'code')
+    list_display = ('name', 'code', 'parser')
     search_fields = ('name', 'code')
 
 class ExpenseCategoryInLine(admin.TabularInline):
@@ -102,6 +159,9 @@ class TransactionAdmin(admin.ModelAdmin):
     form = TransactionAdminForm
     #raw_id_fields = ['category', ]
 
+    def save_model(self, request, obj, form, change):
+        obj.save(allow_missing_rate=form.allow_missing_rate)
+
 class IncomeCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'parent_category', 'user',)
     list_filter = ('name', 'parent_category')
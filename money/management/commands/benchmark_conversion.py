@@ -0,0 +1,50 @@
+# money/management/commands/benchmark_conversion.py
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+import numpy as np
+from django.core.management.base import BaseCommand
+from money.utils.currency_conversion import convert
+from money.utils.exchange_rates import ExchangeRateTable
+
+# Synthetic currency ids: 1 is the base currency (USD)
+BASE_ID = 1
+CURRENCY_IDS = [1, 2, 3, 4]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the vectorized currency conversion on synthetic transactions and rates. "
+        "Runs offline, without the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per size, the best one is reported.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = np.random.default_rng(options['seed'])
+        start = date(2020, 1, 1)
+        # Five years of daily rates with every tenth day missing, so the fallback is exercised
+        rows = [
+            (currency_id, start + timedelta(days=day), 100.0 * currency_id + day / 100)
+            for day in range(5 * 365) if day % 10
+            for currency_id in CURRENCY_IDS[1:]
+        ]
+        table = ExchangeRateTable(rows)
+        target = SimpleNamespace(id=2, code='KZT')
+
+        self.stdout.write(f"{'rows':>10}{'seconds':>10}{'rows/sec':>14}")
+        for size in options['sizes']:
+            amounts = rnd.integers(-10 ** 7, 10 ** 7, size) / 100
+            currency_ids = rnd.choice(CURRENCY_IDS, size)
+            dates = np.datetime64(start) + rnd.integers(0, 5 * 365, size).astype('timedelta64[D]')
+
+            timings = []
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                convert(amounts, currency_ids, dates, target, rates=table, base_currency_id=BASE_ID)
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            self.stdout.write(f"{size:>10}{best:>10.3f}{size / best:>14.0f}")
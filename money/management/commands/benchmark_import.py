@@ -0,0 +1,119 @@
+# money/management/commands/benchmark_import.py
+import os
+import tempfile
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from dj_money.celery import app as celery_app
+from money.models import (
+    Account, AccountType, BankExportFiles, BankSource, Currency, ExchangeRate, ExpenseCategory,
+    PlaceCategoryMapping, Transaction, User,
+)
+from money.tasks import upload_files, process_statement_import
+from money.utils import synthetic_statements
+from money.utils.synthetic_statements import GENERATORS
+
+BUCKET = 'benchmark'
+
+# Parser -> (file suffix, account number used in the statements, account currency)
+STATEMENTS = {
+    'BccStatementParser': ('html', synthetic_statements.BCC_ACCOUNT_NUMBER, 'KZT'),
+    'BccLxmlStatementParser': ('html', synthetic_statements.BCC_ACCOUNT_NUMBER, 'KZT'),
+    'FFStatementParser': ('csv', synthetic_statements.CSV_ACCOUNT_NUMBER, 'KZT'),
+    'CommbankStatementParser': ('csv', synthetic_statements.CSV_ACCOUNT_NUMBER, 'AUD'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the whole upload_files -> process_statement_import chain on synthetic "
+        "statements. Runs against a throwaway test database, a filesystem-backed S3 stand-in "
+        "and Celery in eager mode, and reports wall time, queries and rows/sec per stage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000],
+                            help="Numbers of rows to generate.")
+        parser.add_argument('--parsers', nargs='+', choices=sorted(STATEMENTS), default=sorted(STATEMENTS),
+                            help="Parsers (bank sources) to benchmark.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_eager_propagates = True
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir, \
+                    override_settings(LOCAL_S3_ROOT=os.path.join(tmp_dir, 's3'), SHARED_TMP_DIR=tmp_dir,
+                                      STATEMENT_CACHE_DIR=os.path.join(tmp_dir, 'statement_cache')):
+                self._run(tmp_dir, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _setup_user(self):
+        user = User.objects.create(username='benchmark')
+        account_type = AccountType.objects.create(name='Benchmark')
+        currencies = {code: Currency.objects.get_or_create(code=code, defaults={'name': code})[0] for code in ('USD', 'KZT', 'AUD')}
+        # Rates from before the first synthetic transaction, every row falls back to them
+        for code, rate in (('KZT', '450'), ('AUD', '1.5')):
+            ExchangeRate.objects.create(source_currency=currencies['USD'], target_currency=currencies[code], exchange_rate=rate, date=date(2019, 1, 1))
+        for parser_name, (_, account_number, currency_code) in STATEMENTS.items():
+            Account.objects.get_or_create(
+                user=user, account_number=account_number, currency=currencies[currency_code],
+                defaults={'name': f'Benchmark {account_number}', 'account_type': account_type, 'balance': 0},
+            )
+            BankSource.objects.get_or_create(code=f'bench-{parser_name.lower()[:14]}', defaults={'name': f'Benchmark {parser_name}', 'parser': parser_name})
+        Account.objects.create(user=user, name='Benchmark transfers', account_type=account_type, currency=currencies['KZT'],
+                               account_number=synthetic_statements.TRANSFER_ACCOUNT_NUMBER, balance=0)
+
+        category = ExpenseCategory.objects.create(name='Benchmark', user=user)
+        for place in synthetic_statements.PLACES[::2]:
+            PlaceCategoryMapping.objects.create(user=user, place_keyword=place.split()[0], category=category)
+        return user
+
+    def _measure(self, func):
+        """Runs func and returns (result, seconds, number of queries)."""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        return result, elapsed, len(queries.captured_queries)
+
+    def _report(self, parser_name, size, stage, elapsed, queries, rows):
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f"{parser_name:<26}{size:>9}  {stage:<9}{elapsed:>9.3f}{queries:>9}{rows:>9}{rate:>11.0f}")
+
+    def _run(self, tmp_dir, options):
+        user = self._setup_user()
+        self.stdout.write(f"{'parser':<26}{'rows':>9}  {'stage':<9}{'seconds':>9}{'queries':>9}{'inserted':>9}{'rows/sec':>11}")
+
+        for parser_name in options['parsers']:
+            suffix, _, _ = STATEMENTS[parser_name]
+            source = BankSource.objects.get(parser=parser_name, code__startswith='bench-')
+            for size in options['sizes']:
+                filename = f'{parser_name}-{size}.{suffix}'
+                file_path = os.path.join(tmp_dir, filename)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(GENERATORS[parser_name](size, seed=options['seed']))
+
+                _, elapsed, queries = self._measure(lambda: upload_files.delay(
+                    user_id=user.id, filename=filename, bucket_name=BUCKET, file_path=file_path, source_code=source.code,
+                ))
+                self._report(parser_name, size, 'upload', elapsed, queries, 0)
+
+                statement = BankExportFiles.objects.get(user=user, source=source, s3_file_key=f'statement/{filename}')
+                for stage in ('import', 'reimport'):
+                    if stage == 'reimport':
+                        statement.status = BankExportFiles.Status.PENDING
+                        statement.save()
+                    before = Transaction.objects.count()
+                    _, elapsed, queries = self._measure(lambda: process_statement_import.delay(BUCKET, statement.id))
+                    statement.refresh_from_db()
+                    if statement.status != BankExportFiles.Status.COMPLETED:
+                        self.stderr.write(f"{parser_name} {size}: import finished with status {statement.status}: {statement.notes[:500]}")
+                    self._report(parser_name, size, stage, elapsed, queries, Transaction.objects.count() - before)
+
+                # Every size starts from an empty ledger
+                Transaction.objects.filter(user=user).delete()
@@ -0,0 +1,80 @@
+# money/management/commands/benchmark_parsers.py
+import gc
+import io
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from money.parsers.bcc_parser import BccStatementParser
+from money.parsers.bcc_lxml_parser import BccLxmlStatementParser
+from money.parsers.generic_csv_parser import GenericCsvParser
+from money.parsers.ff_parser import FFStatementParser
+from money.parsers.commbank_parser import CommbankStatementParser
+from money.utils.synthetic_statements import GENERATORS
+
+PARSERS = {
+    'BccStatementParser': BccStatementParser,
+    'BccLxmlStatementParser': BccLxmlStatementParser,
+    'GenericCsvParser': GenericCsvParser,
+    'FFStatementParser': FFStatementParser,
+    'CommbankStatementParser': CommbankStatementParser,
+}
+
+
+def _run_parser(parser_class, content):
+    """Parses the content the way the import does and returns the number of rows."""
+    if parser_class.streaming:
+        parser = parser_class(io.StringIO(content))
+    else:
+        parser = parser_class(content)
+    parser.header()
+    count = 0
+    for _ in parser.iter_transactions():
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the statement parsers on synthetic statements. "
+        "Reports rows/sec and peak Python heap memory (tracemalloc, memory allocated "
+        "inside C libraries such as lxml is not included) for every parser and size. Runs offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000, 100000],
+                            help="Numbers of rows to generate (up to 1000000).")
+        parser.add_argument('--parsers', nargs='+', choices=sorted(PARSERS), default=sorted(PARSERS),
+                            help="Parsers to benchmark.")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Timed runs per case, the best one is reported.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        self.stdout.write(f"{'parser':<26}{'rows':>10}{'parsed':>10}{'seconds':>10}{'rows/sec':>12}{'py peak MiB':>13}")
+        for parser_name in options['parsers']:
+            parser_class = PARSERS[parser_name]
+            for size in options['sizes']:
+                content = GENERATORS[parser_name](size, seed=options['seed'])
+
+                timings = []
+                for _ in range(options['repeat']):
+                    gc.collect()
+                    started = time.perf_counter()
+                    parsed = _run_parser(parser_class, content)
+                    timings.append(time.perf_counter() - started)
+                best = min(timings)
+
+                # A separate run for memory, tracing slows the parser down
+                gc.collect()
+                tracemalloc.start()
+                _run_parser(parser_class, content)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                rate = parsed / best if best else 0
+                self.stdout.write(
+                    f"{parser_name:<26}{size:>10}{parsed:>10}{best:>10.3f}{rate:>12.0f}{peak / 2 ** 20:>13.1f}"
+                )
@@ -0,0 +1,48 @@
+# money/management/commands/learn_place_rules.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from money.models import ExpenseCategory, User
+from money.utils.place_rules import create_place_rules, mine_place_rules
+
+
+class Command(BaseCommand):
+    help = (
+        "Proposes EXACT place -> category rules for places that past categorizations "
+        "(model answers and manual corrections) consistently put into one category. "
+        "Only prints the proposals unless --apply is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username, all users by default.")
+        parser.add_argument('--min-support', type=int, default=settings.PLACE_RULES_MIN_SUPPORT,
+                            help="Minimum number of categorized transactions with the place.")
+        parser.add_argument('--min-share', type=float, default=settings.PLACE_RULES_MIN_SHARE,
+                            help="Minimum part of them that must agree on the category (0-1).")
+        parser.add_argument('--apply', action='store_true', help="Create the proposed rules.")
+
+    def handle(self, *args, **options):
+        if not 0 < options['min_share'] <= 1:
+            raise CommandError("--min-share must be in (0, 1].")
+
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} not found.")
+
+        for user in users:
+            proposals = mine_place_rules(user, options['min_support'], options['min_share'])
+            if not proposals:
+                continue
+            categories = ExpenseCategory.objects.in_bulk({proposal.category_id for proposal in proposals})
+
+            self.stdout.write(f"{user.username}: {len(proposals)} rules proposed")
+            for proposal in proposals:
+                category = categories.get(proposal.category_id)
+                self.stdout.write(
+                    f"  '{proposal.place}' -> {category.name if category else proposal.category_id}"
+                    f"  support {proposal.support}, share {proposal.share:.0%}, corrections {proposal.corrections}"
+                )
+            if options['apply']:
+                created = create_place_rules(user, proposals)
+                self.stdout.write(self.style.SUCCESS(f"{user.username}: {created} rules created"))
@@ -0,0 +1,24 @@
+# money/management/commands/rebuild_monthly_aggregates.py
+from django.core.management.base import BaseCommand, CommandError
+from money.models import User
+from money.utils.monthly_aggregates import rebuild_monthly_aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes MonthlyAggregate from the transactions. Use it to backfill the table "
+        "and after changes that bypass the incremental updates (e.g. QuerySet.update())."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username, all users by default.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} not found.")
+
+        groups = rebuild_monthly_aggregates(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {groups} monthly aggregates."))
@@ -0,0 +1,64 @@
+# money/management/commands/train_place_classifier.py
+import random
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from money.models import Transaction
+from money.utils.place_classifier import CLASSIFIER_MODEL_NAME, PlaceClassifier
+
+
+class Command(BaseCommand):
+    help = (
+        "Trains the local place -> category classifier on already categorized expenses and "
+        "saves it to PLACE_CLASSIFIER_PATH. Reports coverage and accuracy above the confidence "
+        "threshold on a held-out part of the data first. Runs offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help="Part of the data used only for the report (0 skips it).")
+        parser.add_argument('--threshold', type=float, default=settings.PLACE_CLASSIFIER_THRESHOLD,
+                            help="Confidence threshold to report on.")
+        parser.add_argument('--alpha', type=float, default=0.1, help="Smoothing of the n-gram counts.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['holdout'] < 1:
+            raise CommandError("--holdout must be in [0, 1).")
+
+        # Categories given by the classifier itself are not learned from again
+        pairs = list(
+            Transaction.objects.filter(transaction_type='expense', category__isnull=False, place__isnull=False)
+            .exclude(place='')
+            .exclude(transactioncategorylog__gpt_log__model_name=CLASSIFIER_MODEL_NAME)
+            .values_list('place', 'category_id')
+        )
+        if not pairs:
+            raise CommandError("No categorized transactions to train on.")
+
+        if options['holdout']:
+            random.Random(options['seed']).shuffle(pairs)
+            split = int(len(pairs) * (1 - options['holdout']))
+            train, test = pairs[:split], pairs[split:]
+            if train and test:
+                self._report(PlaceClassifier.train(*zip(*train), alpha=options['alpha']), test, options['threshold'])
+
+        classifier = PlaceClassifier.train(*zip(*pairs), alpha=options['alpha'])
+        classifier.save(str(settings.PLACE_CLASSIFIER_PATH))
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {len(pairs)} transactions, {len(classifier.category_ids)} categories, "
+            f"{len(classifier.vocabulary)} n-grams. Saved to {settings.PLACE_CLASSIFIER_PATH}"
+        ))
+
+    def _report(self, classifier, test, threshold):
+        places, expected = zip(*test)
+        predicted, confidences = classifier.predict(places, min_ngrams=settings.PLACE_CLASSIFIER_MIN_NGRAMS)
+        correct = predicted == np.asarray(expected)
+        covered = confidences >= threshold
+        self.stdout.write(f"Held-out transactions: {len(test)}, accuracy: {correct.mean():.1%}")
+        if covered.any():
+            self.stdout.write(
+                f"Above threshold {threshold}: {covered.mean():.1%} of them, accuracy {correct[covered].mean():.1%}"
+            )
+        else:
+            self.stdout.write(f"Above threshold {threshold}: none")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0029_alter_transaction_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRunLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('celery_task_id', models.CharField(db_index=True, help_text='Celery task ID, the same for all retries', max_length=255)),
+                ('task_name', models.CharField(db_index=True, max_length=255)),
+                ('status', models.CharField(choices=[('SUCCESS', 'Успешно'), ('RETRY', 'Повтор'), ('FAILED', 'Ошибка')], max_length=20)),
+                ('wall_time', models.FloatField(help_text='Wall time, seconds')),
+                ('cpu_time', models.FloatField(help_text='CPU time of the worker thread, seconds')),
+                ('db_queries', models.PositiveIntegerField(help_text='Number of SQL queries')),
+                ('db_time', models.FloatField(help_text='Time spent in SQL queries, seconds')),
+                ('external_calls', models.JSONField(blank=True, default=dict, help_text='Calls to external services: {name: {count, time}}')),
+                ('rows', models.JSONField(blank=True, default=dict, help_text='Row counters reported by the task')),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
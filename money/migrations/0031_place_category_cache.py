@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0030_taskrunlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gptlog',
+            name='cache_hits',
+            field=models.PositiveIntegerField(default=0, help_text='Unique places categorized from the cache'),
+        ),
+        migrations.AddField(
+            model_name='gptlog',
+            name='cache_misses',
+            field=models.PositiveIntegerField(default=0, help_text='Unique places sent to the model'),
+        ),
+        migrations.CreateModel(
+            name='PlaceCategoryCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('place', models.TextField(help_text='Normalized place')),
+                ('prompt_version', models.PositiveIntegerField(help_text='Version of the categorization prompt template')),
+                ('category_log', models.CharField(help_text='The answer of the model', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='money.expensecategory')),
+                ('gpt_log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='money.gptlog')),
+            ],
+            options={
+                'unique_together': {('place', 'prompt_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+def delete_duplicate_rates(apps, schema_editor):
+    """Re-fetched ranges left several rows per day, the most recently fetched one is kept."""
+    ExchangeRate = apps.get_model('money', 'ExchangeRate')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = (
+        ExchangeRate.objects.using(db_alias)
+        .values('source_currency', 'target_currency', 'date')
+        .annotate(latest_id=models.Max('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        ExchangeRate.objects.using(db_alias).filter(
+            source_currency=duplicate['source_currency'],
+            target_currency=duplicate['target_currency'],
+            date=duplicate['date'],
+        ).exclude(id=duplicate['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0031_place_category_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_rates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangerate',
+            constraint=models.UniqueConstraint(fields=('source_currency', 'target_currency', 'date'), name='unique_exchange_rate_per_day'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:39
+
+from django.db import migrations, models, transaction
+
+from money.utils.transaction_hash import DEDUP_FIELDS, transaction_dedup_hash
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def backfill_dedup_hash(apps, schema_editor):
+    """
+    Computes the hash of the existing rows in batches by id. The migration is
+    not atomic, so every batch is committed on its own and the table is never
+    locked for the whole backfill.
+    """
+    Transaction = apps.get_model('money', 'Transaction')
+    db_alias = schema_editor.connection.alias
+    attnames = [Transaction._meta.get_field(name).attname for name in DEDUP_FIELDS]
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            rows = list(
+                Transaction.objects.using(db_alias)
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', *attnames)[:BACKFILL_BATCH_SIZE]
+            )
+            if not rows:
+                break
+            for row in rows:
+                row.dedup_hash = transaction_dedup_hash(row)
+            Transaction.objects.using(db_alias).bulk_update(rows, ['dedup_hash'])
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('money', '0034_transaction_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='dedup_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_dedup_hash, migrations.RunPython.noop),
+    ]
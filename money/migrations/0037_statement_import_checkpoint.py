@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0036_transaction_dedup_constraint_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='created_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='import_errors',
+            field=models.TextField(blank=True, help_text='Errors of the imported rows, one per line'),
+        ),
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='processed_rows',
+            field=models.PositiveIntegerField(default=0, help_text='Parsed rows already imported, a retry resumes after them'),
+        ),
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='skipped_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_user_from_category(apps, schema_editor):
+    """A cached answer belongs to the owner of its category."""
+    PlaceCategoryCache = apps.get_model('money', 'PlaceCategoryCache')
+    ExpenseCategory = apps.get_model('money', 'ExpenseCategory')
+    db_alias = schema_editor.connection.alias
+
+    PlaceCategoryCache.objects.using(db_alias).update(
+        user=models.Subquery(
+            ExpenseCategory.objects.using(db_alias).filter(id=models.OuterRef('category_id')).values('user_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0037_statement_import_checkpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placecategorycache',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_user_from_category, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='placecategorycache',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='placecategorycache',
+            unique_together={('user', 'place', 'prompt_version')},
+        ),
+    ]
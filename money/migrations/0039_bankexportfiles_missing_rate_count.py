@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0038_placecategorycache_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='missing_rate_count',
+            field=models.PositiveIntegerField(default=0, help_text='Rows imported without conversion, there was no exchange rate'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+def fill_claimed_at(apps, schema_editor):
+    """Files already in PROCESSING count as claimed on upload, the stuck ones are claimed again."""
+    BankExportFiles = apps.get_model('money', 'BankExportFiles')
+    BankExportFiles.objects.using(schema_editor.connection.alias).filter(status='PROCESSING').update(
+        claimed_at=models.F('uploaded_at'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0039_bankexportfiles_missing_rate_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_claimed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('money', '0040_bankexportfiles_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankexportfiles',
+            name='omitted_errors',
+            field=models.PositiveIntegerField(default=0, help_text='Errors beyond IMPORT_MAX_ERRORS, counted but not stored'),
+        ),
+    ]
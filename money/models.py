@@ -3,8 +3,10 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.db.models.signals import post_save
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 from .validators import validate_file_extension
+from .utils.transaction_hash import transaction_dedup_hash
 
 
 class ExpenseCategory(models.Model):
@@ -39,6 +41,11 @@ class ExchangeRate(models.Model):
     exchange_rate = models.DecimalField(max_digits=10, decimal_places=6)
     date = models.DateField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source_currency', 'target_currency', 'date'], name='unique_exchange_rate_per_day'),
+        ]
+
     def __str__(self):
         return f"{self.date}: 1 {self.source_currency.code} = {self.exchange_rate} {self.target_currency.code}"
 
@@ -98,9 +105,18 @@ class BankExportFiles(models.Model):
     source = models.ForeignKey(BankSource, on_delete=models.PROTECT, help_text="Source bank")
     uploaded_at = models.DateTimeField(auto_now_add=True, help_text="Date and time of file upload")
     processed_at = models.DateTimeField(null=True, blank=True)
+    # Set when the file is claimed for import and on every committed chunk, see utils/import_locks.py
+    claimed_at = models.DateTimeField(null=True, blank=True)
     s3_file_key = models.CharField(max_length=1024, help_text="Files key in S3", blank=True, null=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     notes = models.TextField(blank=True, help_text="Notes or comments about the import process")
+    # Checkpoint of the import, committed together with every chunk of rows
+    processed_rows = models.PositiveIntegerField(default=0, help_text="Parsed rows already imported, a retry resumes after them")
+    created_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    missing_rate_count = models.PositiveIntegerField(default=0, help_text="Rows imported without conversion, there was no exchange rate")
+    import_errors = models.TextField(blank=True, help_text="Errors of the imported rows, one per line")
+    omitted_errors = models.PositiveIntegerField(default=0, help_text="Errors beyond IMPORT_MAX_ERRORS, counted but not stored")
 
     class Meta:
         unique_together = ('user', 's3_file_key', 'source')
@@ -132,17 +148,42 @@ class Transaction(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE, default=1)
     to_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='%(class)s_to_account', null=True, blank=True)
     statement_import = models.ForeignKey(BankExportFiles, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions')
+    # SHA-256 of the dedup fields (utils/transaction_hash.py), filled in by prepare_for_save()
+    dedup_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
 
     class Meta:
         # Этот уникальный индекс предотвратит создание дубликатов транзакций
         # при повторной загрузке одного и того же файла.
-        unique_together = ('account', 'transaction_type', 'date', 'date_processing', 'amount', 'currency', 'original_amount', 'original_currency', 'comment')
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_hash'], name='unique_transaction_dedup_hash'),
+        ]
+        indexes = [
+            # Keyset pagination of the transaction list, see utils/transaction_listing.py
+            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_id'),
+            models.Index(fields=['account', '-date', '-id'], name='transaction_account_date_id'),
+            # Admin list ordered by date over all users
+            models.Index(fields=['-date', '-id'], name='transaction_date_id'),
+            # Uncategorized transactions picked up by the categorization views
+            models.Index(fields=['transaction_type', 'id'], condition=models.Q(category__isnull=True), name='transaction_uncategorized'),
+        ]
         ordering = ['-date']
 
     def __str__(self):
         return f"{self.user} - {self.transaction_type} - {self.amount}"
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, allow_missing_rate=False, **kwargs):
+        self.prepare_for_save(allow_missing_rate=allow_missing_rate)
+        super(Transaction, self).save(*args, **kwargs)
+
+    def prepare_for_save(self, rates=None, allow_missing_rate=False):
+        """
+        Fills in the derived amount and exchange rate fields and the dedup hash
+        and validates the transaction. Called by save() and by bulk imports,
+        which bypass save(). `rates` is the ExchangeRateTable to take a missing
+        rate from, the shared one by default. Raises MissingExchangeRate if
+        there is no rate, unless `allow_missing_rate` is set: then the
+        transaction is left unconverted, with an empty exchange rate.
+        """
         if self.original_amount and self.amount:
             self.exchange_rate = abs(float(self.amount) / float(self.original_amount))
         elif self.exchange_rate:
@@ -157,17 +198,25 @@ class Transaction(models.Model):
                 else:
                     self.amount = float(self.original_amount) / float(self.exchange_rate)
         else:
-            # Find the exchange rate safely
-            rate_obj = ExchangeRate.objects.filter(target_currency = self.currency, date = self.date).first()
-            if rate_obj:
-                self.exchange_rate = rate_obj.exchange_rate
-            else:
-                self.exchange_rate = 1 # @todo change to default value
-
-            if self.amount:
-                self.original_amount = float(self.amount) / float(self.exchange_rate)
-            elif self.original_amount:
-                self.amount = float(self.original_amount) * float(self.exchange_rate)
+            # Курс на дату транзакции или ближайшую предыдущую, из таблицы в памяти
+            from .utils.exchange_rates import MissingExchangeRate, get_exchange_rate_table
+            if rates is None:
+                rates = get_exchange_rate_table()
+            try:
+                self.exchange_rate = rates.rate(self.currency, self.date)
+            except MissingExchangeRate:
+                if not allow_missing_rate:
+                    raise
+                # Оставляем без конвертации, курс можно будет добавить позже
+                self.exchange_rate = None
+
+            if self.exchange_rate is not None:
+                if self.amount:
+                    self.original_amount = float(self.amount) / float(self.exchange_rate)
+                elif self.original_amount:
+                    self.amount = float(self.original_amount) * float(self.exchange_rate)
+
+        self.dedup_hash = transaction_dedup_hash(self)
 
         if self.transaction_type == 'transfer':
             if not self.to_account:
@@ -178,8 +227,37 @@ class Transaction(models.Model):
             
             #if self.account.balance < self.amount:
             #    raise ValidationError('Insufficient funds on the sender\'s account')
-        
-        super(Transaction, self).save(*args, **kwargs)
+
+class MonthlyAggregate(models.Model):
+    """
+    Sum and number of transactions per user, account, category, type, month
+    and currency. Kept up to date by imports, categorization and edits
+    (money/utils/monthly_aggregates.py), rebuilt by rebuild_monthly_aggregates.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE, null=True, blank=True)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPE)
+    month = models.DateField(help_text="First day of the month")
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, null=True, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL category/currency are one group, so they are compared as 0
+            models.UniqueConstraint(
+                'account', Coalesce('category', 0), 'transaction_type', 'month', Coalesce('currency', 0),
+                name='unique_monthly_aggregate',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month']),
+        ]
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.account} {self.category} {self.transaction_type}: {self.amount} ({self.count})"
 
 class TransactionCashback(models.Model):
     transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE)
@@ -211,11 +289,18 @@ class GptLog(models.Model):
     result = models.TextField(blank=True, help_text="The full result received from the model")
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     error_message = models.TextField(blank=True)
+    cache_hits = models.PositiveIntegerField(default=0, help_text="Unique places categorized from the cache")
+    cache_misses = models.PositiveIntegerField(default=0, help_text="Unique places sent to the model")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Log for task {self.celery_task_id} - {self.status}"
+
+    @property
+    def cache_hit_rate(self):
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else None
     
 class TransactionCategoryLog(models.Model):
     """Model for logging categories assigned to GPT models."""
@@ -228,6 +313,49 @@ class TransactionCategoryLog(models.Model):
         return f'{self.created_at} - {self.transaction.id} - {self.category_log}'
 
 
+class TaskRunLog(models.Model):
+    """Timings and counters of a single Celery task run."""
+    class Status(models.TextChoices):
+        SUCCESS = 'SUCCESS', 'Успешно'
+        RETRY = 'RETRY', 'Повтор'
+        FAILED = 'FAILED', 'Ошибка'
+
+    celery_task_id = models.CharField(max_length=255, db_index=True, help_text="Celery task ID, the same for all retries")
+    task_name = models.CharField(max_length=255, db_index=True)
+    status = models.CharField(max_length=20, choices=Status.choices)
+    wall_time = models.FloatField(help_text="Wall time, seconds")
+    cpu_time = models.FloatField(help_text="CPU time of the worker thread, seconds")
+    db_queries = models.PositiveIntegerField(help_text="Number of SQL queries")
+    db_time = models.FloatField(help_text="Time spent in SQL queries, seconds")
+    external_calls = models.JSONField(default=dict, blank=True, help_text="Calls to external services: {name: {count, time}}")
+    rows = models.JSONField(default=dict, blank=True, help_text="Row counters reported by the task")
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.task_name} {self.celery_task_id} - {self.status} ({self.wall_time:.2f}s)"
+
+
+class PlaceCategoryCache(models.Model):
+    """Category the model gave to a normalized place of a user, per prompt template version."""
+    # Categories belong to a user, so an answer is only reused for the same user
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    place = models.TextField(help_text="Normalized place")
+    prompt_version = models.PositiveIntegerField(help_text="Version of the categorization prompt template")
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE)
+    category_log = models.CharField(max_length=255, help_text="The answer of the model")
+    gpt_log = models.ForeignKey(GptLog, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'place', 'prompt_version')
+
+    def __str__(self):
+        return f"{self.user_id}: '{self.place}' -> {self.category_id} (v{self.prompt_version})"
+
 class PlaceCategoryMapping(models.Model):
     """A dictionary to automatically map a place/keyword to a category."""
     class MatchType(models.TextChoices):
@@ -1,10 +1,35 @@
 # money/parsers/base_parser.py
+from datetime import date
 from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+
+
+class TransactionRecord(NamedTuple):
+    """A single parsed statement row. Fields a parser doesn't provide stay None."""
+    trans_date: Optional[date]
+    real_date: Optional[date]
+    amount: Optional[Decimal]
+    type: str
+    description: str
+    place: Optional[str] = None
+    account_id: Optional[str] = None  # Account number for CSV statements with an account per row
+    to_account: Optional[str] = None  # Beneficiary account number for transfers
+    currency: Optional[str] = None  # Conversion pair 'XXX-YYY' for BCC statements
+    rate: Optional[Decimal] = None
+    balance: Optional[Decimal] = None
+
 
 class BaseParser:
     """
     A base class for statement parsers, providing common utility methods.
+
+    Subclasses implement header() and iter_transactions(). The latter yields
+    TransactionRecord objects one by one, so callers can start working on
+    rows before the whole statement is parsed.
     """
+    # True if the parser accepts an iterable of lines instead of the whole file content
+    streaming = False
+
     def _clean_text(self, text):
         """Removes leading/trailing whitespace from a string."""
         if text is None:
@@ -26,7 +51,20 @@ class BaseParser:
             # Обработка случаев, когда строка не является валидным числом
             return None
 
-    def parse(self):
+    def header(self):
+        """Returns the statement header: account_number, currency, etc."""
+        return self.data['header']
+
+    def iter_transactions(self):
         """Each subclass must implement its own parsing logic."""
-        raise NotImplementedError("The 'parse' method must be implemented by subclasses.")
+        raise NotImplementedError("The 'iter_transactions' method must be implemented by subclasses.")
+
+    def parse(self):
+        """
+        Compatibility wrapper: parses the whole statement and returns
+        the data dict with transactions as a list of dicts.
+        """
+        self.header()
+        self.data['transactions'] = [record._asdict() for record in self.iter_transactions()]
+        return self.data
 
@@ -3,7 +3,18 @@ import re
 from datetime import datetime
 from decimal import Decimal
 from bs4 import BeautifulSoup
-from .base_parser import BaseParser
+from .base_parser import BaseParser, TransactionRecord
+
+# Регулярное выражение для разбора строки транзакции, компилируется один раз
+TRANSACTION_LINE_PATTERN = re.compile(
+    r"Retail\. Номер устройства в ПЦ, "
+    r"(?P<date>\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}),\s*"
+    r"(?P<place>.*?)"  # Нежадный захват Места
+    r",\s*Карта:\s*[^ ]+"  # Разделитель: ", Карта: НОМЕР_КАРТЫ "
+    # Необязательная группа для Валют и IPS
+    r"(?:\s+Валюты:(?P<currency>[A-Z]{3}-[A-Z]{3})\|\s*IPS:\s*(?P<rate>\d+\.\d+))?"
+    r"(?:.*)"  # Соответствует оставшейся части строки
+)
 
 class BccStatementParser(BaseParser):
     def __init__(self, file_content):
@@ -15,15 +26,31 @@ class BccStatementParser(BaseParser):
             'balances': {}
         }
 
-    def _parse_header(self):
-        header_data = {}
+    def _header_rows(self):
+        """Yields the texts of the cells of every header table row."""
         # Находим все строки таблицы с заголовком
         rows = self.soup.find('table', {'width': '90%'}).find_all('tr', recursive=False)
         for row in rows:
-            cols = row.find_all('td')
+            yield [col.text for col in row.find_all('td')]
+
+    def _transaction_rows(self):
+        """Yields the texts of the cells of every transaction table row."""
+        # Находим таблицу с транзакциями. Она идет после таблицы с входящим остатком.
+        transaction_table = self.soup.find_all('table', {'cellpadding': '2', 'cellspacing': '1'})[1]
+        if not transaction_table:
+            raise ValueError("Таблица транзакций не найдена в файле.")
+        
+        rows = transaction_table.find_all('tr')
+        # Пропускаем заголовок (th) и итоговую строку
+        for row in rows[1:]: # Пропускаем заголовок и итоговую строку пока нет, потому что в верстке ошибка и table закрывактся раньше времени
+            yield [col.text for col in row.find_all('td')]
+
+    def _parse_header(self):
+        header_data = {}
+        for cols in self._header_rows():
             if len(cols) == 2:
-                key = self._clean_text(cols[0].text).replace(':', '')
-                value = self._clean_text(cols[1].text)
+                key = self._clean_text(cols[0]).replace(':', '')
+                value = self._clean_text(cols[1])
                 header_data[key] = value
         
         self.data['header'] = {
@@ -37,18 +64,7 @@ class BccStatementParser(BaseParser):
         Разбирает строку транзакции для извлечения Даты, Места, 
         и опционально Валют и IPS.
         """
-        # Регулярное выражение для разбора строки транзакции
-        pattern = re.compile(
-            r"Retail\. Номер устройства в ПЦ, "
-            r"(?P<date>\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}),\s*"
-            r"(?P<place>.*?)"  # Нежадный захват Места
-            r",\s*Карта:\s*[^ ]+"  # Разделитель: ", Карта: НОМЕР_КАРТЫ "
-            # Необязательная группа для Валют и IPS
-            r"(?:\s+Валюты:(?P<currency>[A-Z]{3}-[A-Z]{3})\|\s*IPS:\s*(?P<rate>\d+\.\d+))?"
-            r"(?:.*)"  # Соответствует оставшейся части строки
-        )
-
-        match = pattern.match(line.strip()) # Используем .match(), так как шаблон описывает начало строки
+        match = TRANSACTION_LINE_PATTERN.match(line.strip()) # Используем .match(), так как шаблон описывает начало строки
         if match:
             data = match.groupdict()
             # Очищаем пробелы по краям для "Места"
@@ -58,26 +74,18 @@ class BccStatementParser(BaseParser):
         return None
 
 
-    def _parse_transactions(self):
-        # Находим таблицу с транзакциями. Она идет после таблицы с входящим остатком.
-        transaction_table = self.soup.find_all('table', {'cellpadding': '2', 'cellspacing': '1'})[1]
-        if not transaction_table:
-            raise ValueError("Таблица транзакций не найдена в файле.")
-        
-        rows = transaction_table.find_all('tr')
-        # Пропускаем заголовок (th) и итоговую строку
-        for row in rows[1:]: # Пропускаем заголовок и итоговую строку пока нет, потому что в верстке ошибка и table закрывактся раньше времени
+    def _iter_transactions(self):
+        for cols in self._transaction_rows():
             real_date = None
             place = None
             currency = None
             rate = None
             
-            cols = row.find_all('td')
             if len(cols) != 5:
                 continue
 
             # Парсим дополнительные данные из колонки с описанием
-            parse_data = self._parse_transaction_line(cols[4].text)
+            parse_data = self._parse_transaction_line(cols[4])
             if parse_data:
                 real_date =  datetime.strptime(parse_data.get('date'), '%d.%m.%Y %H:%M:%S').date()
                 place = parse_data.get('place')
@@ -86,8 +94,8 @@ class BccStatementParser(BaseParser):
             else:
                 continue
 
-            debit = self._parse_amount(cols[2].text)
-            credit = self._parse_amount(cols[3].text)
+            debit = self._parse_amount(cols[2])
+            credit = self._parse_amount(cols[3])
             
             # Определяем тип и сумму
             if debit:
@@ -100,26 +108,31 @@ class BccStatementParser(BaseParser):
                 continue # Пропускаем, если нет ни дебета ни кредита
 
             # Парсим дату. В HTML она в формате dd.mm.yyyy
-            date_str = self._clean_text(cols[1].text)
+            date_str = self._clean_text(cols[1])
             trans_date = datetime.strptime(date_str, '%d.%m.%Y').date()
 
-            self.data['transactions'].append({
-                'trans_date': trans_date,
-                'real_date': real_date,
-                'place': place,
-                'currency': currency,
-                'rate': self._parse_amount(rate),
-                'description': self._clean_text(cols[4].text),
-                'amount': amount,
-                'type': trans_type,
-            })
+            yield TransactionRecord(
+                trans_date=trans_date,
+                real_date=real_date,
+                place=place,
+                currency=currency,
+                rate=self._parse_amount(rate),
+                description=self._clean_text(cols[4]),
+                amount=amount,
+                type=trans_type,
+            )
+
+    def header(self):
+        if not self.data['header']:
+            try:
+                self._parse_header()
+            except Exception as e:
+                raise ValueError(f"Ошибка при парсинге файла: {e}")
+        return self.data['header']
 
-    def parse(self):
-        """Основной метод, запускающий парсинг всего документа."""
+    def iter_transactions(self):
         try:
-            self._parse_header()
-            self._parse_transactions()
-            return self.data
+            yield from self._iter_transactions()
         except Exception as e:
             # Логируем или пробрасываем ошибку выше
             raise ValueError(f"Ошибка при парсинге файла: {e}")
\ No newline at end of file
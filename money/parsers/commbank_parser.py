@@ -1,7 +1,7 @@
 # money/parsers/commbank_parser.py
 import csv
 import re
-from .base_parser import BaseParser
+from .base_parser import BaseParser, TransactionRecord
 from io import StringIO
 from datetime import datetime
 from decimal import Decimal
@@ -12,11 +12,18 @@ class CommbankStatementParser(BaseParser):
     Parser for Comm Bank statements.
     Parses CSV files with columns: Date, Transaction details, Amount, Balance
     """
+    streaming = True
+
     def __init__(self, file_content):
-        # Call the parent's constructor to correctly initialize
+        # file_content is either the whole file as a string or an iterable of lines
         self.file_content = file_content
         self.data = {
-            'header': {},  # CSV might not have a header, but we keep the structure
+            # Since a generic CSV doesn't have a clear header, we can set placeholders.
+            # The main processing task will use the account_id from each row.
+            'header': {
+                'account_number': 'FROM_CSV',
+                'currency': 'AUD' # Currency should be determined by the account
+            },
             'transactions': [],
             'errors': []  # Add a list to store parsing errors
         }
@@ -59,12 +66,13 @@ class CommbankStatementParser(BaseParser):
             place = description.split('Value Date:')[0].strip()
         return place, real_date
 
-    def parse(self):
+    def iter_transactions(self):
         """
-        Main method to parse the CSV file and extract transactions.
+        Yields transactions one by one while reading the CSV content.
+        Parsing errors are collected in self.data['errors'].
         """
         try:
-            csv_file = StringIO(self.file_content)
+            csv_file = StringIO(self.file_content) if isinstance(self.file_content, str) else self.file_content
             reader = csv.reader(csv_file, delimiter=';')
 
             for row_num, row in enumerate(reader, 1):
@@ -86,23 +94,15 @@ class CommbankStatementParser(BaseParser):
                 # Determine type
                 trans_type = 'income' if amount and amount > 0 else 'expense'
                 place, real_date = self._parse_description(comment_str)
-                self.data['transactions'].append({
-                    'trans_date': trans_date,
-                    'real_date': real_date if real_date else trans_date,
-                    'account_id': self._clean_text(account_id),
-                    'place': place,
-                    'description': comment_str,
-                    'amount': amount,
-                    'balance': balance,
-                    'type': trans_type
-                })
-            
-            # Since a generic CSV doesn't have a clear header, we can set placeholders.
-            # The main processing task will use the account_id from each row.
-            self.data['header'] = {
-                'account_number': 'FROM_CSV',
-                'currency': 'AUD' # Currency should be determined by the account
-            }
-            return self.data
+                yield TransactionRecord(
+                    trans_date=trans_date,
+                    real_date=real_date if real_date else trans_date,
+                    account_id=self._clean_text(account_id),
+                    place=place,
+                    description=comment_str,
+                    amount=amount,
+                    balance=balance,
+                    type=trans_type
+                )
         except Exception as e:
             raise ValueError(f"Error parsing CommBank CSV: {e}")
\ No newline at end of file
@@ -9,16 +9,12 @@ class FFStatementParser(GenericCsvParser):
     def __init__(self, file_content):
         # Call the parent's constructor to correctly initialize
         super().__init__(file_content)
+        self.data['header']['currency'] = 'KZT'
 
-    def parse(self):
-        # Call the parent's (GenericCsvParser) parse method to do the actual work.
-        parsed_data = super().parse()
-
-        for transaction in parsed_data['transactions']:
-            transaction['place'] = ''
-            if transaction.get('to_account'):
-                transaction['type'] = 'transfer'
-
-        parsed_data['header']['currency'] = 'KZT'
-        
-        return parsed_data
\ No newline at end of file
+    def iter_transactions(self):
+        # Call the parent's (GenericCsvParser) generator to do the actual work.
+        for transaction in super().iter_transactions():
+            transaction = transaction._replace(place='')
+            if transaction.to_account:
+                transaction = transaction._replace(type='transfer')
+            yield transaction
@@ -2,27 +2,37 @@
 import csv
 from io import StringIO
 from datetime import datetime
-from .base_parser import BaseParser
+from .base_parser import BaseParser, TransactionRecord
 
 class GenericCsvParser(BaseParser):
     """
     Parses a generic CSV file with a specific format:
     date;account_id;debit;credit;comment;to_account
     """
+    streaming = True
+
     def __init__(self, file_content):
+        # file_content is either the whole file as a string or an iterable of lines
         self.file_content = file_content
         self.data = {
-            'header': {},  # CSV might not have a header, but we keep the structure
+            # Since a generic CSV doesn't have a clear header, we can set placeholders.
+            # The main processing task will use the account_id from each row.
+            'header': {
+                'account_number': 'FROM_CSV',
+                'currency': 'UNKNOWN' # Currency should be determined by the account
+            },
             'transactions': [],
             'errors': []  # Add a list to store parsing errors
         }
 
-    def parse(self):
+    def iter_transactions(self):
         """
-        Main method to parse the CSV content.
+        Yields transactions one by one while reading the CSV content,
+        so a large file never has to be held in memory as a whole.
+        Parsing errors are collected in self.data['errors'].
         """
         # Use StringIO to treat the string content as a file-like object
-        csv_file = StringIO(self.file_content)
+        csv_file = StringIO(self.file_content) if isinstance(self.file_content, str) else self.file_content
         reader = csv.reader(csv_file, delimiter=';')
 
         # You can uncomment the next line if your CSV has a header row to skip
@@ -58,28 +68,20 @@ class GenericCsvParser(BaseParser):
                     self.data['errors'].append(f"Row {row_num}: Invalid date format for '{date_str}'. Expected DD.MM.YYYY.")
                     continue # Skip this row
 
-                # Append transaction data in a standardized format
-                self.data['transactions'].append({
-                    'trans_date': trans_date,
-                    'real_date': trans_date,
-                    'place': comment,
-                    'description': comment,
-                    'amount': amount,
-                    'type': trans_type,
+                # Yield transaction data in a standardized format
+                transaction = TransactionRecord(
+                    trans_date=trans_date,
+                    real_date=trans_date,
+                    place=comment,
+                    description=comment,
+                    amount=amount,
+                    type=trans_type,
                     # We can pass raw IDs to be resolved later
-                    'account_id': self._clean_text(account_id_str),
-                    'to_account': self._clean_text(to_account_str),
-                })
+                    account_id=self._clean_text(account_id_str),
+                    to_account=self._clean_text(to_account_str),
+                )
             except Exception as e:
                 # Catch any other unexpected errors during row processing
                 self.data['errors'].append(f"Row {row_num}: An unexpected error occurred: {e}. Row content: {row}")
                 continue
-
-        # Since a generic CSV doesn't have a clear header, we can set placeholders.
-        # The main processing task will use the account_id from each row.
-        self.data['header'] = {
-            'account_number': 'FROM_CSV',
-            'currency': 'UNKNOWN' # Currency should be determined by the account
-        }
-
-        return self.data
\ No newline at end of file
+            yield transaction
@@ -0,0 +1,70 @@
+# money/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.dispatch import receiver
+from .models import ExchangeRate, ExpenseCategory, MonthlyAggregate, PlaceCategoryMapping, Transaction
+from .utils.category_matcher import invalidate_category_matcher
+from .utils.exchange_rates import invalidate_exchange_rates
+from .utils.monthly_aggregates import AggregateDelta, aggregate_key
+
+
+@receiver([post_save, post_delete], sender=PlaceCategoryMapping)
+def invalidate_matcher_on_mapping_change(sender, instance, **kwargs):
+    # Invalidate after commit, otherwise another process could cache the old rules again
+    transaction.on_commit(lambda: invalidate_category_matcher(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=ExpenseCategory)
+def invalidate_matcher_on_category_change(sender, instance, **kwargs):
+    user_ids = set(PlaceCategoryMapping.objects.filter(category_id=instance.id).values_list('user_id', flat=True))
+    user_ids.add(instance.user_id)
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_category_matcher(user_id)
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def invalidate_rates_on_change(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_exchange_rates)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_aggregate_group(sender, instance, **kwargs):
+    # The stored row tells which monthly group the transaction is leaving
+    instance._aggregate_old = None
+    if instance.pk is not None:
+        old = Transaction.objects.filter(pk=instance.pk).first()
+        if old is not None:
+            instance._aggregate_old = (aggregate_key(old), old.amount)
+
+
+@receiver(post_save, sender=Transaction)
+def update_aggregates_on_save(sender, instance, **kwargs):
+    aggregates = AggregateDelta()
+    old = getattr(instance, '_aggregate_old', None)
+    if old is not None:
+        aggregates.move(instance, *old)
+    else:
+        aggregates.add(instance)
+    aggregates.apply()
+
+
+@receiver(post_delete, sender=Transaction)
+def update_aggregates_on_delete(sender, instance, **kwargs):
+    aggregates = AggregateDelta()
+    aggregates.add(instance, sign=-1)
+    aggregates.apply()
+
+
+@receiver(pre_delete, sender=ExpenseCategory)
+def move_aggregates_to_uncategorized(sender, instance, **kwargs):
+    # Transactions of a deleted category become uncategorized (SET_NULL), its groups are cascade-deleted
+    aggregates = AggregateDelta()
+    for row in MonthlyAggregate.objects.filter(category=instance):
+        aggregates.add_key(
+            (row.user_id, row.account_id, None, row.transaction_type, row.month, row.currency_id),
+            row.amount, row.count,
+        )
+    aggregates.apply()
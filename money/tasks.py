@@ -1,25 +1,42 @@
 # finance/tasks.py
+import itertools
 import requests
 import tempfile
 import os
 from celery import shared_task
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction as db_transaction, IntegrityError
+from django.db import transaction as db_transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
 from openai import OpenAI
 
 from datetime import date, datetime
-from .models import Transaction, BankExportFiles, Account, User, Currency, ExpenseCategory, GptLog, PlaceCategoryMapping, BankSource, TransactionCategoryLog
+from .models import Transaction, BankExportFiles, User, GptLog, BankSource
 from .parsers.bcc_parser import BccStatementParser
+from .parsers.bcc_lxml_parser import BccLxmlStatementParser
 from .parsers.ff_parser import FFStatementParser
 from .parsers.commbank_parser import CommbankStatementParser
-from .utils.s3_utils import get_s3_client
-from .utils.fixed_api import fetch_exchange_rates_for_date, date_range
+from .utils.s3_utils import get_s3_client, iter_object_lines, upload_fileobj
+from .utils.object_cache import get_object_body
+from .utils.fixed_api import fetch_exchange_rates_for_date, fetch_exchange_rates_range, date_range
+from .utils.bulk_import import TransactionBulkImporter
+from .utils.import_resolver import ImportResolver
+from .utils.import_locks import lock_import_accounts
+from .utils.category_matcher import get_category_matcher
+from .utils.task_metrics import track_task_metrics, external_call, record_rows
+from .utils.place_rules import create_place_rules, mine_place_rules
+from .utils.place_classifier import categorize_confident
+from .utils.categorization import (
+    CategorizationEngine, FakeBackend, ThreadedBackend, apply_answers, build_prompt, cached_answers, cached_places,
+    categories_for_prompt, group_by_place, parse_answers, place_answers,
+)
 
 from yandex_cloud_ml_sdk import YCloudML
 
 PARSER_MAP = {
     'BccStatementParser': BccStatementParser,
+    'BccLxmlStatementParser': BccLxmlStatementParser,
     'FFStatementParser': FFStatementParser,
     'CommbankStatementParser': CommbankStatementParser,
 }
@@ -28,6 +45,7 @@ oai_client = OpenAI(api_key = settings.OPENAI_API_KEY)
 ya_sdk = YCloudML(folder_id=settings.YANDEX_ID_FOLDER, auth=settings.YANDEX_GPT_SECRET_KEY)
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60) # bind=True для доступа к self (для retry)
+@track_task_metrics
 def upload_files(self, user_id, filename, bucket_name, signed_url=None, file_path=None, source_code='bcc'):
     """
     Uploads a file to S3. The file can be sourced from a URL or a local file path.
@@ -45,13 +63,14 @@ def upload_files(self, user_id, filename, bucket_name, signed_url=None, file_pat
 
         if signed_url:
             # Case 1: Download from URL into a temporary file.
-            response = requests.get(signed_url, stream=True, timeout=60)
-            response.raise_for_status()
-
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                for chunk in response.iter_content(chunk_size=8192):
-                    tmp.write(chunk)
-                path_to_process = tmp.name
+            with external_call('download'):
+                response = requests.get(signed_url, stream=True, timeout=60)
+                response.raise_for_status()
+
+                with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        tmp.write(chunk)
+                    path_to_process = tmp.name
         else:
             # Case 2: A path to a local (temporary) file was provided.
             path_to_process = file_path
@@ -59,7 +78,7 @@ def upload_files(self, user_id, filename, bucket_name, signed_url=None, file_pat
         full_s3_path = f'statement/{filename}'
 
         with open(path_to_process, 'rb') as data_file:
-            s3_client.upload_fileobj(data_file, bucket_name, full_s3_path)
+            upload_fileobj(s3_client, data_file, bucket_name, full_s3_path)
 
         # Creating an import record
         lookup_params = {
@@ -83,180 +102,238 @@ def upload_files(self, user_id, filename, bucket_name, signed_url=None, file_pat
         if path_to_process and os.path.exists(path_to_process):
             os.remove(path_to_process)
 
-def _find_category_for_place(place, user):
+def _chunked(iterable, size):
+    """Yields lists of up to `size` items from any iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _cap_errors(errors, max_errors):
+    """Drops the errors beyond the first `max_errors` in place and returns how many were dropped."""
+    omitted = max(0, len(errors) - max_errors)
+    del errors[max_errors:]
+    return omitted
+
+def _build_transaction(tx_data, bank_statement, resolver, bank_account_from_header, place_categories):
     """
-    Finds a pre-defined category for a given place based on user's mapping rules.
+    Builds an unsaved Transaction from a parsed statement row.
+    Returns None if the account of the row can't be found.
     """
-    if not place:
+    user = bank_statement.user
+    amount = 0
+    original_amount = float(tx_data.amount)
+
+    # 1. Определяем счет для текущей транзакции
+    transaction_account = None
+    if tx_data.account_id:
+        # Для CSV-парсеров, где счет указан в каждой строке
+        transaction_account = resolver.get_account(tx_data.account_id)
+    else:
+        # Для остальных используем счет из заголовка
+        transaction_account = bank_account_from_header
+
+    if not transaction_account:
         return None
 
-    # 1. Check for an exact match first (more specific)
-    exact_match = PlaceCategoryMapping.objects.filter(
-        user=user,
-        place_keyword__iexact=place,
-        match_type=PlaceCategoryMapping.MatchType.EXACT
-    ).first()
-    if exact_match:
-        return exact_match.category
-
-    # 2. Check for 'contains' matches
-    contains_rules = PlaceCategoryMapping.objects.filter(
-        user=user,
-        match_type=PlaceCategoryMapping.MatchType.CONTAINS
-    )
-    for rule in contains_rules:
-        # Case-insensitive check
-        if rule.place_keyword.lower() in place.lower():
-            return rule.category
-
-    return None
+    # 2. Определяем валюты
+    currency = transaction_account.currency
+    original_currency = resolver.get_currency('USD') # Deffault USD
+
+    if tx_data.currency and isinstance(tx_data.currency, str):
+        # Для парсеров, которые предоставляют информацию о конвертации (например, BCC)
+        curr_codes = tx_data.currency.split('-')
+        if len(curr_codes) == 2:
+            currency = resolver.get_currency(curr_codes[0]) or currency
+            original_currency = resolver.get_currency(curr_codes[1]) or original_currency
+    else:
+        amount = original_amount
+        original_amount = 0
+
+
+    # 3. Ищем категорию по справочнику правил
+    expense_category = None
+    income_category = None
+    # Ищем категорию по справочнику, если это расход и есть место
+    if tx_data.type == 'expense' and tx_data.place:
+        expense_category = place_categories[tx_data.place]
+
+    exchange_rate_value = None
+    if tx_data.rate is not None:
+        try:
+            exchange_rate_value = 1 / float(tx_data.rate)
+        except (ValueError, TypeError, ZeroDivisionError): # Обработка если rate не число или 0
+            exchange_rate_value = 1.55
+
+    # 4. Определяем счет-получатель для переводов
+    to_account = None
+    if tx_data.type == 'transfer' and tx_data.to_account:
+        to_account = resolver.get_account(tx_data.to_account)
+        income_category = None
+        expense_category = None
+        original_currency = resolver.get_currency('KZT')
+        original_amount = (-1) * amount
+
+    # Поля для поиска существующей транзакции (поля dedup_hash + user)
+    lookup_params = {
+        'user': user,
+        'account': transaction_account,
+        'transaction_type': tx_data.type,
+        'date': tx_data.real_date,
+        'date_processing': tx_data.trans_date,
+        'amount': amount, 
+        'currency': currency,
+        'original_amount': original_amount,
+        'original_currency': original_currency,
+        'comment': tx_data.description,
+    }
+    # Поля, которые будут установлены, если транзакция создается
+    defaults_params = {
+        'category_id': expense_category,
+        'income_category': income_category,
+        'exchange_rate': exchange_rate_value,
+        'place': tx_data.place,
+        'to_account': to_account,
+        'statement_import': bank_statement
+    }
+    return Transaction(**lookup_params, **defaults_params)
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60) # bind=True для доступа к self (для retry)
+@track_task_metrics
 def process_statement_import(self, bucket_name, object_key):
+    """
+    Imports a statement file in chunks of IMPORT_BULK_BATCH_SIZE parsed rows.
+    Every chunk is committed in its own transaction together with the
+    checkpoint on BankExportFiles (rows done, counts, errors), so a retry
+    skips the rows a failed attempt has already imported.
+    """
     try:
         bank_statement = BankExportFiles.objects.get(id=object_key)
+        if not self.request.retries:
+            # A new import starts from the first row, retries continue from the checkpoint
+            bank_statement.processed_rows = 0
+            bank_statement.created_count = 0
+            bank_statement.skipped_count = 0
+            bank_statement.missing_rate_count = 0
+            bank_statement.import_errors = ''
+            bank_statement.omitted_errors = 0
         bank_statement.status = BankExportFiles.Status.PROCESSING
+        bank_statement.claimed_at = timezone.now()
         bank_statement.save()
 
-        s3_client = get_s3_client()
-
-        response = s3_client.get_object(Bucket=bucket_name, Key=bank_statement.s3_file_key)
-        file_content = response['Body'].read().decode('utf-8')
-
         # Вызываем наш парсер
         #parser = BccStatementParser(html_content)
         parser_name = bank_statement.source.parser
         parser_class = PARSER_MAP.get(parser_name)
         if not parser_class:
             raise ValueError(f"Parser '{parser_name}' not found in PARSER_MAP for source '{bank_statement.source.code}'")
-        
-        parser = parser_class(file_content)
-        parsed_data = parser.parse()
-
-        header = parsed_data['header']
-        transactions_data = parsed_data['transactions']
-        errors = parsed_data.get('errors', [])
-
-        with db_transaction.atomic():
-  
-            user = bank_statement.user
-
-            bank_account_from_header = None
-            if header.get('account_number') and header['account_number'] != 'FROM_CSV':
-                bank_account_from_header = Account.objects.filter(user = user, currency__code = header.get('currency'), account_number__startswith = header['account_number']).first()
-            
-            created_count = 0
-            skipped_count = 0
-            print(transactions_data)
-            for i, tx_data in enumerate(transactions_data):
-                amount = 0
-                original_amount = float(tx_data['amount'])
-
-                # 1. Определяем счет для текущей транзакции
-                transaction_account = None
-                if tx_data.get('account_id'):
-                    # Для CSV-парсеров, где счет указан в каждой строке
-                    transaction_account = Account.objects.filter(user = user, account_number__startswith = tx_data['account_id']).first()
-                else:
-                    # Для остальных используем счет из заголовка
-                    transaction_account = bank_account_from_header
-
-                if not transaction_account:
-                    errors.append(f"Could not find account for transaction: {tx_data}. Skipping.")
-                    skipped_count += 1
-                    continue
-
-                # 2. Определяем валюты
-                currency = transaction_account.currency
-                original_currency =  Currency.objects.filter(code = 'USD').first() # Deffault USD
-
-                if tx_data.get('currency') and isinstance(tx_data['currency'], str):
-                    # Для парсеров, которые предоставляют информацию о конвертации (например, BCC)
-                    curr_codes = tx_data['currency'].split('-')
-                    if len(curr_codes) == 2:
-                        currency = Currency.objects.filter(code=curr_codes[0]).first() or currency
-                        original_currency = Currency.objects.filter(code=curr_codes[1]).first() or original_currency
-                else:
-                    amount = original_amount
-                    original_amount = 0
-
-
-                # 3. Ищем категорию по справочнику правил
-                expense_category = None
-                income_category = None
-                # Ищем категорию по справочнику, если это расход и есть место
-                if tx_data['type'] == 'expense' and tx_data.get('place'):
-                    expense_category = _find_category_for_place(tx_data['place'], user)
-
-                exchange_rate_value = None
-                if tx_data.get('rate') is not None:
-                    try:
-                        exchange_rate_value = 1 / float(tx_data['rate'])
-                    except (ValueError, TypeError, ZeroDivisionError): # Обработка если rate не число или 0
-                        exchange_rate_value = 1.55
-
-                # 4. Определяем счет-получатель для переводов
-                to_account = None
-                if tx_data['type'] == 'transfer' and tx_data.get('to_account'):
-                    to_account = Account.objects.filter(user = user, account_number__startswith = tx_data['to_account']).first()
-                    income_category = None
-                    expense_category = None
-                    original_currency = Currency.objects.filter(code = 'KZT').first()
-                    original_amount = (-1) * amount
-
-                # Поля для поиска существующей транзакции (согласно unique_together + user)
-                lookup_params = {
-                    'user': user,
-                    'account': transaction_account,
-                    'transaction_type': tx_data['type'],
-                    'date': tx_data['real_date'],
-                    'date_processing': tx_data.get('trans_date', tx_data['real_date']),
-                    'amount': amount, 
-                    'currency': currency,
-                    'original_amount': original_amount,
-                    'original_currency': original_currency,
-                    'comment': tx_data['description'],
-                }
-                # Поля, которые будут установлены, если транзакция создается
-                defaults_params = {
-                    'category': expense_category,
-                    'income_category': income_category,
-                    'exchange_rate': exchange_rate_value,
-                    'place': tx_data['place'],
-                    'to_account': to_account,
-                    'statement_import': bank_statement
+
+        s3_client = get_s3_client()
+
+        # Retries and re-runs read the file from the local cache if it is unchanged in S3
+        body = get_object_body(s3_client, bucket_name, bank_statement.s3_file_key)
+
+        if parser_class.streaming:
+            # Streaming mode: the body is decoded and parsed line by line,
+            # rows are consumed in fixed-size chunks, so memory stays flat.
+            parser = parser_class(iter_object_lines(body))
+        else:
+            parser = parser_class(body.read().decode('utf-8'))
+            body.close()
+
+        header = parser.header()
+        transactions_data = parser.iter_transactions()
+
+        user = bank_statement.user
+
+        # Accounts and currencies are resolved in memory for the whole import
+        resolver = ImportResolver(user)
+        category_matcher = get_category_matcher(user)
+
+        bank_account_from_header = None
+        if header.get('account_number') and header['account_number'] != 'FROM_CSV':
+            bank_account_from_header = resolver.get_account(header['account_number'], currency_code=header.get('currency'))
+        lock_account_id = bank_account_from_header.id if bank_account_from_header else None
+
+        importer = TransactionBulkImporter(
+            errors=bank_statement.import_errors.splitlines(),
+            batch_size=settings.IMPORT_BULK_BATCH_SIZE,
+            max_errors=settings.IMPORT_MAX_ERRORS,
+        )
+        # Totals of the previous attempts, the importer counts only this one
+        created_before = bank_statement.created_count
+        skipped_before = bank_statement.skipped_count
+        missing_rate_before = bank_statement.missing_rate_count
+        omitted_errors_before = bank_statement.omitted_errors
+        # Rows before the checkpoint were committed by a previous attempt, they are only parsed
+        remaining_data = itertools.islice(transactions_data, bank_statement.processed_rows, None)
+        # The parser collects its errors while it reads, they are capped like the import errors
+        parse_errors = parser.data.setdefault('errors', [])
+        omitted_parse_errors = 0
+        for chunk in _chunked(remaining_data, settings.IMPORT_BULK_BATCH_SIZE):
+            omitted_parse_errors += _cap_errors(parse_errors, settings.IMPORT_MAX_ERRORS)
+            errors_before = len(importer.errors)
+            with db_transaction.atomic():
+                # Chunks of imports into the same account wait for each other, other accounts run in parallel
+                lock_import_accounts(user.id, lock_account_id)
+
+                # Categories by place are matched once per distinct place with the cached compiled rules
+                place_categories = category_matcher.match_many(
+                    tx_data.place for tx_data in chunk
+                    if tx_data.type == 'expense' and tx_data.place
+                )
+                for tx_data in chunk:
+                    transaction = _build_transaction(tx_data, bank_statement, resolver, bank_account_from_header, place_categories)
+                    if transaction is None:
+                        importer.skip(f"Could not find account for transaction: {tx_data}. Skipping.")
+                        continue
+                    importer.add(transaction, tx_data)
+                importer.flush()
+                importer.aggregates.apply()
+
+                checkpoint = {
+                    'processed_rows': bank_statement.processed_rows + len(chunk),
+                    'created_count': created_before + importer.created_count,
+                    'skipped_count': skipped_before + importer.skipped_count,
+                    'missing_rate_count': missing_rate_before + importer.missing_rate_count,
+                    'omitted_errors': omitted_errors_before + importer.omitted_errors,
+                    # Progress keeps the file from being claimed again as stale
+                    'claimed_at': timezone.now(),
                 }
-                
-                # Robustly handle creation to avoid race conditions with get_or_create
-                created = False
-                try:
-                    # Each creation attempt is wrapped in its own atomic block.
-                    # If this fails, only this inner transaction is rolled back,
-                    # not the entire loop.
-                    with db_transaction.atomic():
-                        Transaction.objects.create(**lookup_params, **defaults_params)
-                        created = True
-                except IntegrityError:
-                    # This means the transaction already exists. We can safely ignore this
-                    # and move on to the next one.
-                    pass
-
-                if created:
-                    created_count += 1
-                else:
-                    skipped_count += 1
-                    errors.append(f"Transaction already exists: {tx_data}. Skipping.")
-
-        
+                new_errors = ''.join(f'{error}\n' for error in importer.errors[errors_before:])
+                # Errors are appended in SQL until IMPORT_MAX_ERRORS of them are stored, later ones are only counted
+                BankExportFiles.objects.filter(id=bank_statement.id).update(
+                    import_errors=Concat('import_errors', Value(new_errors)) if new_errors else F('import_errors'),
+                    **checkpoint,
+                )
+            for name, value in checkpoint.items():
+                setattr(bank_statement, name, value)
+        record_rows(created=importer.created_count, skipped=importer.skipped_count, missing_rate=importer.missing_rate_count)
+
+        body.close()
+
+        # Parsing errors go first, as they did when the whole file was parsed upfront
+        omitted_parse_errors += _cap_errors(parse_errors, settings.IMPORT_MAX_ERRORS)
+        errors = parse_errors + importer.errors
+        omitted_errors = bank_statement.omitted_errors + omitted_parse_errors
+
         # Обновляем статус импорта
         bank_statement.status = BankExportFiles.Status.COMPLETED
         bank_statement.processed_at = timezone.now()
-        notes = f"Successfully processed. New transactions: {created_count}. Skipped duplicates: {skipped_count}."
+        notes = f"Successfully processed. New transactions: {bank_statement.created_count}. Skipped duplicates: {bank_statement.skipped_count}."
+        if bank_statement.missing_rate_count:
+            notes += f" Imported without exchange rate: {bank_statement.missing_rate_count}."
         if errors:
             notes += "\n\nErrors during processing:\n" + "\n".join(errors)
+        if omitted_errors:
+            notes += f"\n... and {omitted_errors} more errors."
         bank_statement.notes = notes
-        bank_statement.save()
+        bank_statement.save(update_fields=['status', 'processed_at', 'notes'])
 
     except Exception as e:
         # В случае любой ошибки, помечаем задачу как проваленную и записываем ошибку
@@ -264,7 +341,8 @@ def process_statement_import(self, bucket_name, object_key):
             bank_statement.status = BankExportFiles.Status.FAILED
             bank_statement.notes = str(e)
             bank_statement.processed_at = timezone.now()
-            bank_statement.save()
+            # The checkpoint is left as the last committed chunk wrote it
+            bank_statement.save(update_fields=['status', 'notes', 'processed_at'])
         raise self.retry(exc=e) # Повторить задачу в случае ошибки
 
 def _gpt_model(prompt):
@@ -293,6 +371,7 @@ def _ya_model(prompt):
     return result.alternatives[0].text.strip()
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
+@track_task_metrics
 def categorize_transactions_batch(self, transaction_ids):
     log_entry = GptLog.objects.create(
         celery_task_id=self.request.id,
@@ -300,6 +379,8 @@ def categorize_transactions_batch(self, transaction_ids):
     )
     
     try:
+        # The local classifier categorizes what it is sure about, only the rest goes to the model
+        transaction_ids = categorize_confident(transaction_ids)
         transactions = Transaction.objects.filter(category__isnull=True, id__in=transaction_ids)
         if not transactions.exists():
             result_message = "No transactions to categorize in this batch (they might have been processed already)."
@@ -308,61 +389,41 @@ def categorize_transactions_batch(self, transaction_ids):
             log_entry.save()
             return result_message
 
-        categories = ExpenseCategory.objects.filter(for_categorized=True)
-
-        categories_list = []
-
-        for category in categories:
-            if category.parent_category:
-                parent_category = ExpenseCategory.objects.filter(id = category.parent_category.id).first()
-                categories_list.append(f'{category.id}-{parent_category.name}:{category.name}')
-            else:
-                categories_list.append(f'{category.id}-Main:{category.name}')
-
-
-        categories_str = ';'.join(categories_list)
+        # Одинаковые места отправляем один раз, уже известные берем из кеша
+        groups = group_by_place(transactions)
+        cache = cached_places(groups)
+        missing = [place for place in groups if place not in cache]
+        answers = cached_answers(groups, cache, log_entry)
+        place_results = []
+        log_entry.cache_hits = len(cache)
+        log_entry.cache_misses = len(missing)
+
+        if missing:
+            # Готовим батч для GPT
+            prompt = build_prompt(categories_for_prompt(), [groups[place][0].place for place in missing])
+
+            # Сохраняем промпт в лог
+            log_entry.prompt = prompt
+            log_entry.save(update_fields=['prompt', 'cache_hits', 'cache_misses'])
+
+            # Отправляем в OpenAI
+            with external_call('gpt'):
+                result = _ya_model(prompt)
+
+            # Разбираем ответ модели, результат места получают все его транзакции
+            parsed = parse_answers(result, missing)
+            answers += place_answers(parsed, groups, log_entry)
+            place_results = [(place, category_id, category_log, log_entry) for place, category_id, category_log in parsed]
+        else:
+            result = "Answered from the cache, the model was not called."
 
-        # Готовим батч для GPT
-        prompt = (
-            f"Вот список категорий транзакций разделенных знаком \";\" каждая и в формате <id категории>-<название родительсой категории>:<название категории>: {categories_str}.\n"
-            f"Для каждой строки определи, к какой категории из списка она относится. "
-            "Ответ верни в формате: <номер строки>. <категория>.\n\n"
-        )
-        for i, t in enumerate(transactions, 1):
-            prompt += f"{i}. {t.place} \n"
-       
-        prompt += "\nТолько категории, никаких комментариев."
-        
-        # Сохраняем промпт в лог
-        log_entry.prompt = prompt
-        log_entry.save(update_fields=['prompt'])
-
-        # Отправляем в OpenAI
-        result = _ya_model(prompt)
-        
         # Сохраняем результат в лог
         log_entry.result = result
         log_entry.status = GptLog.Status.SUCCESS
-        log_entry.save(update_fields=['result', 'status', 'updated_at'])
-
-        with db_transaction.atomic():
-            lines = result.splitlines()
-            for line, transaction in zip(lines, transactions):
-                expense_category = ExpenseCategory.objects.filter(id = 1).first()
-                parts = line.split('.')
-                if len(parts) >= 2:
-                    category_id = parts[1].strip().split('-')[0].strip()
-                    if category_id:
-                        expense_category = ExpenseCategory.objects.filter(id = int(category_id)).first()
-
-                transaction.category = expense_category
-                transaction.save(update_fields=["category"])
-                TransactionCategoryLog.objects.create(
-                    transaction=transaction,
-                    category_log=parts[1].strip(),
-                    gpt_log=log_entry
-                )
-            
+        log_entry.save(update_fields=['result', 'status', 'cache_hits', 'cache_misses', 'updated_at'])
+
+        # Записываем категории одним набором запросов
+        apply_answers(answers, place_results)
                 
         return f"Categorized {transactions.count()} transactions successfully."
     except Exception as e:
@@ -372,7 +433,52 @@ def categorize_transactions_batch(self, transaction_ids):
         log_entry.save(update_fields=['status', 'error_message', 'updated_at'])
         raise self.retry(exc=e)
 
+# settings.CATEGORIZATION_BACKEND -> factory of the model backend used by categorize_transactions_job
+CATEGORIZATION_BACKENDS = {
+    'yandexgpt': lambda: ThreadedBackend('yandexgpt', _ya_model),
+    'gpt-4o': lambda: ThreadedBackend('gpt-4o', _gpt_model),
+    'fake': FakeBackend,
+}
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+@track_task_metrics
+def categorize_transactions_job(self, transaction_ids):
+    """
+    Categorizes many transactions in one task: the prompts are sent concurrently
+    with the concurrency and rate limits from the settings, results are written in bulk.
+    """
+    engine = CategorizationEngine(
+        backend=CATEGORIZATION_BACKENDS[settings.CATEGORIZATION_BACKEND](),
+        concurrency=settings.CATEGORIZATION_CONCURRENCY,
+        rate_limit=settings.CATEGORIZATION_RATE_LIMIT,
+        batch_size=settings.BATCH_CATEGORIZATION_SIZE,
+    )
+    try:
+        # The local classifier categorizes what it is sure about, only the rest goes to the model
+        remaining = categorize_confident(transaction_ids)
+        # Every retry gets its own GptLog names, the task id stays the same
+        categorized, failed = engine.run(remaining, log_prefix=f'{self.request.id}-{self.request.retries}')
+    except Exception as e:
+        raise self.retry(exc=e)
+    return f"Categorized {categorized} transactions. Failed prompts: {failed}."
+
+@shared_task(bind=True)
+@track_task_metrics
+def learn_place_rules_task(self):
+    """
+    Turns places that past categorizations consistently put into one category
+    into EXACT rules for every user. Meant to be scheduled with Celery Beat.
+    """
+    created = 0
+    for user in User.objects.all():
+        proposals = mine_place_rules(user, settings.PLACE_RULES_MIN_SUPPORT, settings.PLACE_RULES_MIN_SHARE)
+        if proposals:
+            created += create_place_rules(user, proposals)
+    record_rows(rules_created=created)
+    return f"Created {created} place rules."
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=180)
+@track_task_metrics
 def fetch_exchange_rates_task(self, start_date_str=None, end_date_str=None, extra_currency=None, only_extra=False):
     """
     Fetches exchange rates for a given date range in the background.
@@ -387,12 +493,15 @@ def fetch_exchange_rates_task(self, start_date_str=None, end_date_str=None, extr
         else:
             end_date = date.fromisoformat(end_date_str)
 
-        for single_date in date_range(start_date, end_date):
-            fetch_exchange_rates_for_date(
-                single_date,
-                extra_currency=extra_currency,
-                only_extra=only_extra
-            )
+        if settings.FIXER_USE_TIMESERIES and start_date < end_date:
+            fetch_exchange_rates_range(start_date, end_date, extra_currency=extra_currency, only_extra=only_extra)
+        else:
+            for single_date in date_range(start_date, end_date):
+                fetch_exchange_rates_for_date(
+                    single_date,
+                    extra_currency=extra_currency,
+                    only_extra=only_extra
+                )
         return f"Successfully fetched exchange rates from {start_date_str} to {end_date_str}."
     except Exception as e:
         raise self.retry(exc=e)
\ No newline at end of file
@@ -1,3 +1,1013 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import os
+import tempfile
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from boto3.s3.transfer import TransferConfig
+from django.contrib import admin
+from django.db import IntegrityError, OperationalError, connection, transaction as db_transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import tasks
+from .admin import TransactionAdminForm
+from .parsers.bcc_lxml_parser import BccLxmlStatementParser
+from .parsers.bcc_parser import BccStatementParser
+from .models import (
+    Account, AccountType, BankExportFiles, BankSource, Currency, ExchangeRate, ExpenseCategory, GptLog, MonthlyAggregate,
+    PlaceCategoryCache, PlaceCategoryMapping, TaskRunLog, Transaction, TransactionCategoryLog, User,
+)
+from .utils import s3_utils
+from .utils.bulk_import import TransactionBulkImporter
+from .utils.category_matcher import CategoryMatcher, get_category_matcher, invalidate_category_matcher
+from .utils.categorization import PROMPT_TEMPLATE_VERSION, CategorizationEngine, FakeBackend, TokenBucket, apply_answers
+from .utils.currency_conversion import convert
+from .utils.exchange_rates import ExchangeRateTable, invalidate_exchange_rates
+from .utils.fixed_api import FixerAPIError, fetch_exchange_rates_range
+from .utils.import_locks import claim_pending_statement_files
+from .utils.import_resolver import ImportResolver
+from .utils.local_s3 import LocalS3Client
+from .utils.monthly_aggregates import AggregateDelta, rebuild_monthly_aggregates
+from .utils.object_cache import ObjectCache
+from .utils.place_classifier import CLASSIFIER_MODEL_NAME, PlaceClassifier, categorize_confident
+from .utils.place_rules import mine_place_rules
+from .utils.s3_utils import get_s3_client, iter_object_lines, upload_fileobj
+from .utils.synthetic_statements import BCC_ACCOUNT_NUMBER, CSV_ACCOUNT_NUMBER, generate_bcc_html, generate_commbank_csv
+from .utils.transaction_listing import transaction_page
+
+
+class MoneyTestCase(TestCase):
+    """A user with a USD account and helpers to create transactions."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.usd = Currency.objects.create(code='USD', name='US Dollar')
+        cls.account_type = AccountType.objects.create(name='Card')
+        cls.user = User.objects.create(username='alice')
+        cls.account = cls.make_account(cls.user)
+        # The fallback category (id 1) of the categorization
+        cls.fallback_category = ExpenseCategory.objects.create(id=1, name='Other', user=cls.user)
+
+    @classmethod
+    def make_account(cls, user, currency=None, account_number='0001'):
+        return Account.objects.create(
+            user=user, name=f'{user.username} {account_number}', account_type=cls.account_type,
+            currency=currency or cls.usd, account_number=account_number, balance=0,
+        )
+
+    def make_transaction(self, account=None, amount='-10.00', date=datetime.date(2025, 1, 2), **kwargs):
+        account = account or self.account
+        values = {
+            'user': account.user, 'account': account, 'transaction_type': 'expense',
+            'amount': Decimal(amount), 'original_amount': Decimal(amount),
+            'currency': account.currency, 'original_currency': self.usd,
+            'date': date, 'date_processing': date, 'comment': '',
+        }
+        values.update(kwargs)
+        return Transaction.objects.create(**values)
+
+
+class PlaceCategoryCacheTests(MoneyTestCase):
+    def test_cached_answer_is_not_reused_for_another_user(self):
+        bob = User.objects.create(username='bob')
+        bob_account = self.make_account(bob, account_number='0002')
+        alice_category = ExpenseCategory.objects.create(name='Food', user=self.user)
+        bob_category = ExpenseCategory.objects.create(name='Groceries', user=bob)
+
+        alice_transaction = self.make_transaction(place='WOOLWORTHS 123')
+        CategorizationEngine(FakeBackend(alice_category.id)).run([alice_transaction.id], 'alice')
+        self.assertEqual(PlaceCategoryCache.objects.get().user, self.user)
+
+        bob_transaction = self.make_transaction(bob_account, place='WOOLWORTHS 456')
+        CategorizationEngine(FakeBackend(bob_category.id)).run([bob_transaction.id], 'bob')
+
+        bob_transaction.refresh_from_db()
+        self.assertEqual(bob_transaction.category, bob_category)
+        self.assertEqual(
+            set(PlaceCategoryCache.objects.values_list('user_id', 'category_id')),
+            {(self.user.id, alice_category.id), (bob.id, bob_category.id)},
+        )
+
+    def test_other_users_category_is_not_cached(self):
+        bob = User.objects.create(username='bob')
+        bob_category = ExpenseCategory.objects.create(name='Groceries', user=bob)
+
+        transaction = self.make_transaction(place='COLES')
+        CategorizationEngine(FakeBackend(bob_category.id)).run([transaction.id], 'alice')
+
+        self.assertFalse(PlaceCategoryCache.objects.exists())
+
+
+class RecordingBackend(FakeBackend):
+    """FakeBackend that records when each prompt starts and how many are in flight."""
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.started = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def complete(self, prompt):
+        self.started.append(time.monotonic())
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().complete(prompt)
+        finally:
+            self.in_flight -= 1
+
+
+PLACES = ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot', 'Golf', 'Hotel', 'India', 'Juliett', 'Kilo', 'Lima']
+
+
+class CategorizationEngineTests(MoneyTestCase):
+    def make_transactions(self):
+        return [self.make_transaction(place=f'{place} market', comment=place) for place in PLACES]
+
+    def test_concurrency_limit_is_respected(self):
+        ids = [transaction.id for transaction in self.make_transactions()]
+        backend = RecordingBackend(latency=0.01)
+
+        categorized, failed = CategorizationEngine(backend, concurrency=3, batch_size=1).run(ids, 'test')
+
+        self.assertEqual((categorized, failed), (len(PLACES), 0))
+        self.assertEqual(len(backend.started), len(PLACES))
+        self.assertEqual(backend.peak, 3)
+
+    def test_token_bucket_limits_the_rate(self):
+        ids = [transaction.id for transaction in self.make_transactions()]
+        backend = RecordingBackend()
+        rate = 50
+
+        CategorizationEngine(backend, concurrency=len(PLACES), rate_limit=rate, batch_size=2).run(ids, 'test')
+
+        # Six prompts: the first goes at once, every next one waits for a token
+        self.assertEqual(len(backend.started), 6)
+        intervals = [later - earlier for earlier, later in zip(backend.started, backend.started[1:])]
+        self.assertGreaterEqual(min(intervals), 0.9 / rate)
+        self.assertGreaterEqual(backend.started[-1] - backend.started[0], 0.9 * 5 / rate)
+
+    def test_token_bucket_allows_bursts_up_to_its_capacity(self):
+        async def acquire_times(bucket, count):
+            times = []
+            for _ in range(count):
+                await bucket.acquire()
+                times.append(time.monotonic())
+            return times
+
+        times = asyncio.run(acquire_times(TokenBucket(rate=20, capacity=3), 4))
+
+        self.assertLess(times[2] - times[0], 0.9 / 20)
+        self.assertGreaterEqual(times[3] - times[2], 0.9 / 20)
+
+
+@override_settings(CATEGORIZATION_BACKEND='yandexgpt', BATCH_CATEGORIZATION_SIZE=10, CATEGORIZATION_RATE_LIMIT=None)
+class CategorizationJobTests(MoneyTestCase):
+    def setUp(self):
+        self.food = ExpenseCategory.objects.create(name='Food', user=self.user, for_categorized=True)
+        self.prompts = []
+        self.failures = 0
+        patcher = mock.patch.object(tasks, '_ya_model', self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def model(self, prompt):
+        """Stands in for the GPT call: answers every place of the prompt with Food."""
+        places = [line.split('. ', 1)[1].strip() for line in prompt.splitlines() if line[:1].isdigit()]
+        self.prompts.append(places)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Model is unavailable")
+        return "\n".join(f"{n}. {self.food.id}-Main:Food" for n in range(1, len(places) + 1))
+
+    def run_job(self, transactions):
+        return tasks.categorize_transactions_job.apply(args=[[transaction.id for transaction in transactions]])
+
+    def assert_categorized(self, transactions):
+        self.assertEqual(
+            set(Transaction.objects.filter(id__in=[t.id for t in transactions]).values_list('category_id', flat=True)),
+            {self.food.id},
+        )
+
+    def test_cached_places_are_not_sent_again(self):
+        PlaceCategoryCache.objects.create(
+            user=self.user, place='bravo market', prompt_version=PROMPT_TEMPLATE_VERSION,
+            category=self.food, category_log=f'{self.food.id}-Main:Food',
+        )
+        first = [self.make_transaction(place=place, comment=f'{n}') for n, place in enumerate(
+            ['Alpha market', 'ALPHA MARKET 42', 'Bravo market', 'Charlie market'])]
+
+        self.run_job(first)
+
+        # One prompt for the two missing places, Alpha is sent once for both its transactions
+        self.assertEqual(self.prompts, [['Alpha market', 'Charlie market']])
+        self.assert_categorized(first)
+        logs = GptLog.objects.order_by('celery_task_id')
+        self.assertEqual([(log.cache_hits, log.cache_misses) for log in logs], [(0, 2), (1, 0)])
+
+        second = [self.make_transaction(place=place, comment=f'second {place}') for place in ['Alpha market', 'Charlie market']]
+        self.run_job(second)
+
+        self.assertEqual(len(self.prompts), 1)
+        self.assert_categorized(second)
+
+    def test_failed_prompt_is_sent_again_by_the_next_job(self):
+        transactions = [self.make_transaction(place=f'{place} market', comment=place) for place in PLACES[:3]]
+        self.failures = 1
+
+        result = self.run_job(transactions)
+
+        self.assertEqual(result.get(), "Categorized 0 transactions. Failed prompts: 1.")
+        self.assertEqual(GptLog.objects.get().status, GptLog.Status.FAILED)
+        self.assertFalse(Transaction.objects.filter(category__isnull=False).exists())
+
+        self.run_job(transactions)
+
+        self.assertEqual(len(self.prompts), 2)
+        self.assert_categorized(transactions)
+
+    def test_job_is_retried_when_writing_fails(self):
+        transactions = [self.make_transaction(place=f'{place} market', comment=place) for place in PLACES[:3]]
+
+        calls = []
+
+        def flaky_apply_answers(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return apply_answers(*args)
+
+        with mock.patch('money.utils.categorization.apply_answers', flaky_apply_answers):
+            self.run_job(transactions)
+
+        self.assert_categorized(transactions)
+        # The logs of the failed attempt were rolled back with its answers, the retry logs under its own name
+        self.assertEqual([log.celery_task_id.rsplit('-', 2)[1:] for log in GptLog.objects.all()], [['1', '0']])
+        self.assertEqual(len(self.prompts), 2)
+
+
+class PlaceRulesTests(MoneyTestCase):
+    def test_fallback_answers_are_not_votes(self):
+        food = ExpenseCategory.objects.create(name='Food', user=self.user)
+        for n in range(3):
+            self.make_transaction(place='Unknown shop', category=self.fallback_category, comment=f'shop {n}')
+        for n in range(3):
+            self.make_transaction(place='Bakery', category=food, comment=f'bakery {n}')
+        # One fallback answer doesn't dilute the agreement on a known place
+        self.make_transaction(place='Bakery', category=self.fallback_category, comment='bakery 3')
+
+        proposals = mine_place_rules(self.user, min_support=3, min_share=1.0)
+
+        self.assertEqual([(p.place, p.category_id, p.support) for p in proposals], [('bakery', food.id, 3)])
+
+
+class PlaceClassifierTests(MoneyTestCase):
+    def setUp(self):
+        self.food = ExpenseCategory.objects.create(name='Food', user=self.user)
+        self.books = ExpenseCategory.objects.create(name='Books', user=self.user)
+        # A 95/5 split: the prior alone would be 0.95 sure of Food
+        places = ['Coffee house'] * 95 + ['Book store'] * 5
+        category_ids = [self.food.id] * 95 + [self.books.id] * 5
+        self.classifier = PlaceClassifier.train(places, category_ids)
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, 'place_classifier.npz')
+        self.classifier.save(path)
+        settings_override = override_settings(PLACE_CLASSIFIER_PATH=path, PLACE_CLASSIFIER_MIN_NGRAMS=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_unknown_place_has_no_confidence(self):
+        category_ids, confidences = self.classifier.predict(['Coffee house', 'Zyxw', ''], min_ngrams=3)
+
+        self.assertEqual(category_ids[0], self.food.id)
+        self.assertGreater(confidences[0], 0.9)
+        self.assertEqual(confidences[1:].tolist(), [0, 0])
+
+    def test_only_confident_known_places_are_categorized(self):
+        known = self.make_transaction(place='Coffee house', comment='known')
+        unknown = self.make_transaction(place='Zyxw', comment='unknown')
+
+        remaining = categorize_confident([known.id, unknown.id], threshold=0.9)
+
+        self.assertEqual(remaining, [unknown.id])
+        known.refresh_from_db()
+        self.assertEqual(known.category, self.food)
+
+    def test_other_users_categories_are_not_assigned(self):
+        bob = User.objects.create(username='bob')
+        transaction = self.make_transaction(self.make_account(bob, account_number='0002'), place='Coffee house')
+
+        remaining = categorize_confident([transaction.id], threshold=0.9)
+
+        self.assertEqual(remaining, [transaction.id])
+        transaction.refresh_from_db()
+        self.assertIsNone(transaction.category)
+
+    @override_settings(DOWNLOAD_API_TOKEN='token')
+    def test_view_only_queues_the_job(self):
+        transaction = self.make_transaction(place='Coffee house')
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Token token'
+
+        with mock.patch.object(tasks.categorize_transactions_job, 'delay') as delay:
+            delay.return_value.id = 'task-id'
+            self.client.post(reverse('money:run_categorization_job'))
+
+        delay.assert_called_once_with([transaction.id])
+        transaction.refresh_from_db()
+        self.assertIsNone(transaction.category)
+
+    @override_settings(CATEGORIZATION_BACKEND='fake', PLACE_CLASSIFIER_THRESHOLD=0.9)
+    def test_job_categorizes_confident_transactions_locally(self):
+        known = self.make_transaction(place='Coffee house', comment='known')
+        unknown = self.make_transaction(place='Zyxw', comment='unknown')
+
+        tasks.categorize_transactions_job.apply(args=[[known.id, unknown.id]])
+
+        known.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual(known.category, self.food)
+        models = dict(TransactionCategoryLog.objects.values_list('transaction_id', 'gpt_log__model_name'))
+        self.assertEqual(models, {known.id: CLASSIFIER_MODEL_NAME, unknown.id: 'fake'})
+
+
+@override_settings(FIXER_API_URL='https://fixer.test/', FIXER_API_KEY='key', FIXER_TIMESERIES_MAX_DAYS=365)
+class FixerTimeseriesTests(MoneyTestCase):
+    def fixer_response(self, data):
+        response = mock.Mock()
+        response.json.return_value = data
+        return response
+
+    def test_rates_are_saved(self):
+        aud = Currency.objects.create(code='AUD', name='Australian Dollar')
+        data = {'success': True, 'rates': {'2025-01-01': {'AUD': 1.6}, '2025-01-02': {'AUD': 1.61}}}
+        with mock.patch('money.utils.fixed_api.requests.get', return_value=self.fixer_response(data)):
+            fetch_exchange_rates_range(datetime.date(2025, 1, 1), datetime.date(2025, 1, 2), extra_currency='AUD', only_extra=True)
+
+        self.assertEqual(
+            list(ExchangeRate.objects.filter(target_currency=aud).order_by('date').values_list('date', 'exchange_rate')),
+            [(datetime.date(2025, 1, 1), Decimal('1.6')), (datetime.date(2025, 1, 2), Decimal('1.61'))],
+        )
+
+    def test_unsuccessful_response_raises(self):
+        data = {'success': False, 'error': {'code': 106, 'type': 'function_access_restricted'}}
+        with mock.patch('money.utils.fixed_api.requests.get', return_value=self.fixer_response(data)):
+            with self.assertRaises(FixerAPIError) as raised:
+                fetch_exchange_rates_range(datetime.date(2025, 1, 1), datetime.date(2025, 1, 2))
+
+        self.assertEqual(raised.exception.error['code'], 106)
+        self.assertFalse(ExchangeRate.objects.exists())
+
+
+class CategoryMatcherTests(MoneyTestCase):
+    def setUp(self):
+        # The shared cache outlives the test database, start from a fresh version
+        invalidate_category_matcher(self.user.id)
+        self.categories = {
+            name: ExpenseCategory.objects.create(name=name, user=self.user) for name in ['Cafe', 'Food', 'Home', 'Other']
+        }
+
+    def rule(self, keyword, category, match_type=PlaceCategoryMapping.MatchType.CONTAINS):
+        return PlaceCategoryMapping.objects.create(
+            user=self.user, place_keyword=keyword, category=self.categories[category], match_type=match_type,
+        )
+
+    def test_exact_rules_go_before_contains_and_newer_rules_first(self):
+        self.rule('Coffee house', 'Cafe', PlaceCategoryMapping.MatchType.EXACT)
+        self.rule('coffee', 'Food')
+        self.rule('house', 'Home')
+        self.rule('HOUSE', 'Other')
+        matcher = CategoryMatcher.for_user(self.user)
+
+        expected = {
+            'coffee HOUSE': 'Cafe',
+            # The newer 'house' rules win even though 'coffee' comes first in the place
+            'Big coffee house shop': 'Other',
+            'Coffee shop': 'Food',
+            # Two rules for one keyword: the newer one (higher id) wins
+            'Full house': 'Other',
+            'Tea': None,
+            '': None,
+        }
+        for place, category in expected.items():
+            with self.subTest(place=place):
+                self.assertEqual(matcher.match(place), self.categories[category].id if category else None)
+
+    def test_rule_changes_invalidate_the_cached_matcher_after_commit(self):
+        self.assertIsNone(get_category_matcher(self.user).match('Coffee shop'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            rule = self.rule('coffee', 'Cafe')
+        # Until the commit the cached matcher is kept
+        self.assertIsNone(get_category_matcher(self.user).match('Coffee shop'))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_category_matcher(self.user).match('Coffee shop'), self.categories['Cafe'].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertIsNone(get_category_matcher(self.user).match('Coffee shop'))
+
+
+class ImportResolverTests(MoneyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.kzt = Currency.objects.create(code='KZT', name='Tenge')
+        cls.make_account(cls.user, account_number='1234567')
+        cls.make_account(cls.user, currency=cls.kzt, account_number='1234')
+        cls.make_account(cls.user, currency=cls.kzt, account_number='12')
+        cls.make_account(User.objects.create(username='bob'), account_number='1299')
+
+    def baseline(self, prefix, **currency):
+        """The query the resolver replaced."""
+        return Account.objects.filter(user=self.user, account_number__startswith=prefix, **currency).order_by('id').first()
+
+    def test_prefix_resolves_to_the_lowest_id_account(self):
+        resolver = ImportResolver(self.user)
+
+        for prefix in ['1', '12', '123', '1234', '12345', '1234567']:
+            with self.subTest(prefix=prefix):
+                self.assertEqual(resolver.get_account(prefix), self.baseline(prefix))
+                self.assertEqual(resolver.get_account(prefix, currency_code='KZT'), self.baseline(prefix, currency__code='KZT'))
+        self.assertEqual(resolver.get_account('12').account_number, '1234567')
+        self.assertEqual(resolver.get_account('12', currency_code='KZT').account_number, '1234')
+
+    def test_no_match(self):
+        resolver = ImportResolver(self.user)
+
+        # Longer than any number, another user's account, no account in the currency
+        for prefix, currency in [('12345678', {}), ('1299', {}), ('9', {}), ('1234567', {'currency_code': 'KZT'})]:
+            with self.subTest(prefix=prefix, **currency):
+                self.assertIsNone(resolver.get_account(prefix, **currency))
+        self.assertIsNone(resolver.get_currency('EUR'))
+        self.assertEqual(resolver.get_currency('KZT'), self.kzt)
+
+    def test_lookups_need_no_queries(self):
+        resolver = ImportResolver(self.user)
+
+        with self.assertNumQueries(0):
+            resolver.get_account('1234', currency_code='KZT')
+            resolver.get_currency('USD')
+
+
+class BulkImportTests(MoneyTestCase):
+    def build_transaction(self, account=None, amount='-10.00', comment='', currency=None):
+        account = account or self.account
+        date = datetime.date(2025, 1, 2)
+        return Transaction(
+            user=account.user, account=account, transaction_type='expense', amount=Decimal(amount),
+            currency=currency or account.currency, original_currency=self.usd,
+            date=date, date_processing=date, comment=comment,
+        )
+
+    def import_rows(self, rows):
+        importer = TransactionBulkImporter(batch_size=2)
+        for n, (account, comment) in enumerate(rows):
+            importer.add(self.build_transaction(account, comment=comment), f'row {n}')
+        importer.flush()
+        return importer
+
+    def test_duplicates_in_the_file_and_in_the_database_are_skipped(self):
+        self.make_transaction(comment='stored')
+
+        importer = self.import_rows([(None, 'stored'), (None, 'new'), (None, 'new'), (None, 'other')])
+
+        self.assertEqual((importer.created_count, importer.skipped_count), (2, 2))
+        self.assertEqual(importer.errors, [
+            TransactionBulkImporter.DUPLICATE_MESSAGE.format(tx_data='row 0'),
+            TransactionBulkImporter.DUPLICATE_MESSAGE.format(tx_data='row 2'),
+        ])
+        self.assertEqual(Transaction.objects.count(), 3)
+
+
+class CurrencyConversionTests(SimpleTestCase):
+    day = datetime.date(2025, 1, 1)
+    # Currency id -> rate from the base currency (id 1)
+    rates = {1: Decimal(1), 2: Decimal('0.1'), 3: Decimal('0.15'), 4: Decimal('450.123456')}
+
+    def convert(self, amounts, currency_ids, target_id):
+        table = ExchangeRateTable((currency_id, self.day, rate) for currency_id, rate in self.rates.items() if currency_id != 1)
+        return convert(
+            amounts, currency_ids, np.array([self.day] * len(amounts), dtype='datetime64[D]'),
+            SimpleNamespace(id=target_id, code='XXX'), rates=table, base_currency_id=1,
+        )
+
+    def decimal_convert(self, amount, currency_id, target_id):
+        converted = Decimal(amount) * self.rates[target_id] / self.rates[currency_id]
+        return converted.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def test_halves_are_rounded_away_from_zero(self):
+        result = self.convert([0.07, 1.05, -0.07, -1.05], [2, 2, 2, 2], 3)
+
+        self.assertEqual(result.amounts(), [Decimal('0.11'), Decimal('1.58'), Decimal('-0.11'), Decimal('-1.58')])
+
+    def test_matches_decimal(self):
+        rnd = np.random.default_rng(0)
+        cents = rnd.integers(-10 ** 9, 10 ** 9, 20000)
+        currency_ids = rnd.choice(list(self.rates), len(cents))
+
+        for target_id in (3, 4):
+            expected = [
+                self.decimal_convert(Decimal(int(amount)).scaleb(-2), int(currency_id), target_id)
+                for amount, currency_id in zip(cents, currency_ids)
+            ]
+            self.assertEqual(self.convert(cents / 100, currency_ids, target_id).amounts(), expected)
+
+    def test_amounts_beyond_int64_are_exact(self):
+        result = self.convert([99999999.99], [2], 4)
+
+        self.assertEqual(result.amounts(), [self.decimal_convert('99999999.99', 2, 4)])
+
+
+@override_settings(S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, S3_MULTIPART_CHUNKSIZE=6 * 1024 * 1024, S3_MAX_CONCURRENCY=3)
+class S3ClientTests(MoneyTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        settings_override = override_settings(LOCAL_S3_ROOT=os.path.join(tmp_dir.name, 's3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Every test starts without a shared client
+        patcher = mock.patch.object(s3_utils, '_client', (None, None, None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_client_is_shared_within_a_process(self):
+        client = get_s3_client()
+
+        self.assertIsInstance(client, LocalS3Client)
+        self.assertIs(get_s3_client(), client)
+        # A forked worker has another pid and builds its own client
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            forked = get_s3_client()
+            self.assertIsNot(forked, client)
+            self.assertIs(get_s3_client(), forked)
+
+    def test_upload_uses_the_transfer_config(self):
+        client = mock.Mock(wraps=get_s3_client())
+        data = b'line;1\n' * 1000
+
+        sent = upload_fileobj(client, io.BytesIO(data), 'statements', 'statement.csv')
+
+        self.assertEqual(sent, len(data))
+        config = client.upload_fileobj.call_args.kwargs['Config']
+        self.assertIsInstance(config, TransferConfig)
+        self.assertEqual(
+            (config.multipart_threshold, config.multipart_chunksize, config.max_concurrency),
+            (5 * 1024 * 1024, 6 * 1024 * 1024, 3),
+        )
+        body = get_s3_client().get_object(Bucket='statements', Key='statement.csv')['Body']
+        self.addCleanup(body.close)
+        self.assertEqual(body.read(), data)
+
+    def test_upload_task_records_s3_metrics(self):
+        BankSource.objects.create(code='cb', name='CommBank', parser='CommbankStatementParser')
+        path = os.path.join(self.tmp_dir, 'statement.csv')
+        data = generate_commbank_csv(20, seed=1).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        tasks.upload_files.apply(kwargs={
+            'user_id': self.user.id, 'filename': 'statement.csv', 'bucket_name': 'statements',
+            'file_path': path, 'source_code': 'cb',
+        })
+
+        run = TaskRunLog.objects.get(task_name=tasks.upload_files.name)
+        self.assertEqual(run.status, TaskRunLog.Status.SUCCESS)
+        self.assertEqual(run.external_calls['s3']['count'], 1)
+        self.assertEqual(run.external_calls['s3']['bytes'], len(data))
+        self.assertTrue(BankExportFiles.objects.filter(s3_file_key='statement/statement.csv').exists())
+
+
+class IterObjectLinesTests(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.client = LocalS3Client(tmp_dir.name)
+
+    def lines(self, content, chunk_size):
+        self.client.upload_fileobj(io.BytesIO(content.encode('utf-8')), 'bucket', 'statement.csv')
+        body = self.client.get_object(Bucket='bucket', Key='statement.csv')['Body']
+        self.addCleanup(body.close)
+        return list(iter_object_lines(body, chunk_size=chunk_size))
+
+    def test_lines_match_stringio(self):
+        contents = {
+            # 'Кофейня' is two bytes per letter, chunks end inside characters too
+            'spanning chunks': 'first line;1\nКофейня на углу;-250,00\nlast;3\n',
+            'crlf': 'first;1\r\nsecond;2\r\n\r\nthird;3\r\n',
+            'no final newline': 'first;1\nsecond;2',
+            'empty': '',
+        }
+        for name, content in contents.items():
+            for chunk_size in [1, 3, 7, 64 * 1024]:
+                with self.subTest(name, chunk_size=chunk_size):
+                    self.assertEqual(self.lines(content, chunk_size), list(io.StringIO(content)))
+
+
+class BccLxmlParserTests(SimpleTestCase):
+    def test_records_match_the_beautifulsoup_parser(self):
+        statements = [
+            generate_bcc_html(30, seed=1),
+            '<?xml version="1.0" encoding="windows-1251"?>\n' + generate_bcc_html(30, seed=2),
+        ]
+        for content in statements:
+            with self.subTest(content=content[:40]):
+                expected = BccStatementParser(content).parse()
+                parsed = BccLxmlStatementParser(content).parse()
+                self.assertEqual(len(parsed['transactions']), 30)
+                self.assertEqual(parsed, expected)
+
+
+class TransactionAdminFormTests(MoneyTestCase):
+    def form_data(self, **values):
+        data = {
+            'user': self.user.id, 'account': self.account.id, 'transaction_type': 'expense',
+            'amount': '-10.00', 'original_amount': '-10.00', 'currency': self.usd.id, 'original_currency': self.usd.id,
+            'date': '2025-01-02', 'date_processing': '2025-01-02', 'comment': 'Coffee',
+        }
+        data.update(values)
+        return data
+
+    def test_duplicate_is_a_form_error(self):
+        self.make_transaction(comment='Coffee')
+
+        # The original amount is derived on save, the hash has to be built from it
+        form = TransactionAdminForm(data=self.form_data(original_amount=''))
+
+        self.assertFalse(form.is_valid())
+        self.assertIn("already exists", str(form.non_field_errors()))
+
+    def test_transaction_is_not_its_own_duplicate(self):
+        transaction = self.make_transaction(comment='Coffee')
+
+        form = TransactionAdminForm(data=self.form_data(place='Cafe'), instance=transaction)
+
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_missing_rate_is_a_form_error(self):
+        aud = Currency.objects.create(code='AUD', name='Australian Dollar')
+
+        form = TransactionAdminForm(data=self.form_data(currency=aud.id, original_amount=''))
+
+        self.assertFalse(form.is_valid())
+        self.assertIn("No exchange rate", str(form.non_field_errors()))
+
+    def make_unconverted(self):
+        aud = Currency.objects.create(code='AUD', name='Australian Dollar')
+        account = self.make_account(self.user, currency=aud, account_number='0002')
+        transaction = Transaction(
+            user=self.user, account=account, transaction_type='expense', amount=Decimal('-10.00'),
+            original_amount=0, currency=aud, original_currency=self.usd,
+            date=datetime.date(2025, 1, 2), date_processing=datetime.date(2025, 1, 2), comment='Coffee',
+        )
+        transaction.save(allow_missing_rate=True)
+        return transaction
+
+    def test_unconverted_transaction_can_be_edited(self):
+        transaction = self.make_unconverted()
+        category = ExpenseCategory.objects.create(name='Cafe', user=self.user)
+        data = self.form_data(
+            account=transaction.account.id, currency=transaction.currency.id, original_amount='0',
+            category=category.id,
+        )
+
+        form = TransactionAdminForm(data=data, instance=transaction)
+        self.assertTrue(form.is_valid(), form.errors)
+        admin.site._registry[Transaction].save_model(None, form.save(commit=False), form, True)
+
+        transaction.refresh_from_db()
+        self.assertEqual((transaction.category, transaction.exchange_rate), (category, None))
+
+    def test_unconverted_transaction_needs_a_rate_for_a_new_amount(self):
+        transaction = self.make_unconverted()
+        data = self.form_data(
+            account=transaction.account.id, currency=transaction.currency.id, original_amount='0', amount='-12.00',
+        )
+
+        form = TransactionAdminForm(data=data, instance=transaction)
+
+        self.assertFalse(form.is_valid())
+        self.assertIn("No exchange rate", str(form.non_field_errors()))
+
+
+@override_settings(STATEMENT_CLAIM_TIMEOUT=600)
+class ClaimStatementFilesTests(MoneyTestCase):
+    def make_file(self, status, claimed_at=None):
+        source, _ = BankSource.objects.get_or_create(code='bcc', defaults={'name': 'BCC'})
+        statement = BankExportFiles.objects.create(
+            user=self.user, source=source, s3_file_key=f'file-{BankExportFiles.objects.count()}',
+            status=status, claimed_at=claimed_at,
+        )
+        return statement.id
+
+    def test_stale_processing_files_are_claimed_again(self):
+        now = timezone.now()
+        pending = self.make_file(BankExportFiles.Status.PENDING)
+        stale = self.make_file(BankExportFiles.Status.PROCESSING, now - datetime.timedelta(seconds=601))
+        self.make_file(BankExportFiles.Status.PROCESSING, now - datetime.timedelta(seconds=60))
+        self.make_file(BankExportFiles.Status.COMPLETED, now - datetime.timedelta(days=1))
+
+        self.assertEqual(sorted(claim_pending_statement_files()), sorted([pending, stale]))
+        self.assertEqual(claim_pending_statement_files(), [])
+        self.assertTrue(BankExportFiles.objects.get(id=stale).claimed_at >= now)
+
+
+class StatementImportTests(MoneyTestCase):
+    bucket = 'statements'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(
+            LOCAL_S3_ROOT=os.path.join(tmp_dir.name, 's3'),
+            STATEMENT_CACHE_DIR=os.path.join(tmp_dir.name, 'cache'),
+            IMPORT_BULK_BATCH_SIZE=10,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.s3_root = os.path.join(tmp_dir.name, 's3')
+        self.source = BankSource.objects.create(code='cb', name='CommBank', parser='CommbankStatementParser')
+        self.make_account(self.user, account_number=CSV_ACCOUNT_NUMBER)
+
+    def upload(self, content, key='statement.csv', source=None):
+        LocalS3Client(self.s3_root).upload_fileobj(io.BytesIO(content.encode('utf-8')), self.bucket, key)
+        return BankExportFiles.objects.create(user=self.user, source=source or self.source, s3_file_key=key)
+
+    def baseline_counts(self, statement, content):
+        """Created and skipped counts of a row-by-row import, one savepoint per row."""
+        parser = tasks.PARSER_MAP[statement.source.parser](content)
+        header = parser.header()
+        resolver = ImportResolver(self.user)
+        account = None
+        if header.get('account_number') and header['account_number'] != 'FROM_CSV':
+            account = resolver.get_account(header['account_number'], currency_code=header.get('currency'))
+        rows = list(parser.iter_transactions())
+        place_categories = get_category_matcher(self.user).match_many(row.place for row in rows if row.place)
+        created = skipped = 0
+        for row in rows:
+            transaction = tasks._build_transaction(row, statement, resolver, account, place_categories)
+            try:
+                with db_transaction.atomic():
+                    transaction.save()
+                created += 1
+            except (AttributeError, IntegrityError):
+                # No account (None) or a duplicate
+                skipped += 1
+        return created, skipped
+
+    def assert_baseline_counts(self, content, source=None):
+        statement = self.upload(content, source=source)
+        tasks.process_statement_import.apply(args=[self.bucket, statement.id])
+        statement.refresh_from_db()
+        Transaction.objects.all().delete()
+
+        counts = (statement.created_count, statement.skipped_count)
+        self.assertEqual(counts, self.baseline_counts(statement, content))
+        self.assertGreater(statement.skipped_count, 0)
+        self.assertIn(f"New transactions: {counts[0]}. Skipped duplicates: {counts[1]}.", statement.notes)
+
+    def test_csv_counts_match_a_row_by_row_import(self):
+        content = generate_commbank_csv(30, seed=1)
+        # Rows repeated within the file are duplicates, as is a row of an unknown account
+        self.assert_baseline_counts(content + ''.join(content.splitlines(True)[:12]) + '01.Jan.20;9999;Unknown;-1.00;0.00\n')
+
+    def test_bcc_counts_match_a_row_by_row_import(self):
+        kzt = Currency.objects.create(code='KZT', name='Tenge')
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.create(source_currency=self.usd, target_currency=kzt, exchange_rate=450, date=datetime.date(2019, 1, 1))
+        # The rate table of the process must not outlive the rolled back rate
+        self.addCleanup(invalidate_exchange_rates)
+        self.make_account(self.user, currency=kzt, account_number=BCC_ACCOUNT_NUMBER)
+        source = BankSource.objects.create(code='bcc-test', name='BCC', parser='BccStatementParser')
+        content = generate_bcc_html(30, seed=1)
+        rows = [line for line in content.splitlines(True) if line.startswith('<tr><td>')][3:]
+        # The first rows of the transaction table are repeated at its end
+        content = content.replace('</table>\n</body>', ''.join(rows[:12]) + '</table>\n</body>')
+        self.assert_baseline_counts(content, source=source)
+
+    def test_retry_resumes_from_the_checkpoint(self):
+        statement = self.upload(generate_commbank_csv(45, seed=1))
+        flush = tasks.TransactionBulkImporter.flush
+        calls = []
+
+        def failing_flush(importer):
+            calls.append(importer)
+            if len(calls) == 3:
+                raise RuntimeError("Connection lost")
+            return flush(importer)
+
+        with mock.patch.object(tasks.TransactionBulkImporter, 'flush', failing_flush):
+            tasks.process_statement_import.apply(args=[self.bucket, statement.id])
+
+        statement.refresh_from_db()
+        self.assertEqual(statement.status, BankExportFiles.Status.COMPLETED)
+        self.assertEqual((statement.processed_rows, statement.created_count, statement.skipped_count), (45, 45, 0))
+        self.assertEqual(Transaction.objects.filter(statement_import=statement).count(), 45)
+
+    def test_reimport_without_rates_skips_rows_up_front(self):
+        aud = Currency.objects.create(code='AUD', name='Australian Dollar')
+        Account.objects.filter(account_number=CSV_ACCOUNT_NUMBER).update(currency=aud)
+        content = generate_commbank_csv(30, seed=1)
+        first = self.upload(content, key='first.csv')
+        second = self.upload(content, key='second.csv')
+
+        tasks.process_statement_import.apply(args=[self.bucket, first.id])
+        with CaptureQueriesContext(connection) as queries:
+            tasks.process_statement_import.apply(args=[self.bucket, second.id])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.created_count, first.missing_rate_count), (30, 30))
+        self.assertEqual((second.created_count, second.skipped_count, second.missing_rate_count), (0, 30, 0))
+        statements = [query['sql'] for query in queries.captured_queries]
+        # Every row is found by its hash, nothing falls back to row-by-row inserts
+        self.assertFalse([sql for sql in statements if sql.startswith('INSERT INTO "money_transaction"')])
+        # One savepoint per chunk of IMPORT_BULK_BATCH_SIZE rows
+        self.assertEqual(sum(sql.startswith('SAVEPOINT') for sql in statements), 3)
+
+    @override_settings(IMPORT_MAX_ERRORS=2)
+    def test_stored_errors_are_capped(self):
+        content = generate_commbank_csv(3, seed=1)
+        statement = self.upload(content * 3)
+
+        tasks.process_statement_import.apply(args=[self.bucket, statement.id])
+
+        statement.refresh_from_db()
+        self.assertEqual((statement.created_count, statement.skipped_count), (3, 6))
+        self.assertEqual(len(statement.import_errors.splitlines()), 2)
+        self.assertEqual(statement.omitted_errors, 4)
+        self.assertIn("and 4 more errors", statement.notes)
+
+    @override_settings(IMPORT_MAX_ERRORS=2)
+    def test_parsing_errors_are_capped(self):
+        statement = self.upload('malformed\n' * 25 + generate_commbank_csv(3, seed=1))
+
+        tasks.process_statement_import.apply(args=[self.bucket, statement.id])
+
+        statement.refresh_from_db()
+        self.assertEqual(statement.created_count, 3)
+        self.assertEqual(statement.notes.count("Malformed row"), 2)
+        self.assertIn("and 23 more errors", statement.notes)
+
+
+class MonthlyAggregateTests(MoneyTestCase):
+    def snapshot(self):
+        return sorted(MonthlyAggregate.objects.values_list(
+            'user_id', 'account_id', 'category_id', 'transaction_type', 'month', 'currency_id', 'amount', 'count',
+        ), key=repr)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        food = ExpenseCategory.objects.create(name='Food', user=self.user)
+        cafe = ExpenseCategory.objects.create(name='Cafe', user=self.user)
+        other_account = self.make_account(self.user, account_number='0002')
+
+        first = self.make_transaction(comment='first', category=food)
+        second = self.make_transaction(comment='second', amount='-5.25', category=food)
+        moved = self.make_transaction(comment='moved', amount='-7.00')
+        deleted = self.make_transaction(comment='deleted', amount='-1.00', category=cafe)
+        self.make_transaction(other_account, comment='income', amount='100.00', transaction_type='income')
+
+        # Edits of the amount, the month, the account and the category
+        first.amount = Decimal('-12.00')
+        first.save()
+        second.date = datetime.date(2025, 2, 1)
+        second.save()
+        moved.account = other_account
+        moved.save()
+        deleted.delete()
+        # Categorization writes with bulk_update and applies the aggregates itself
+        log = GptLog.objects.create(celery_task_id='test', model_name='fake', status=GptLog.Status.SUCCESS)
+        apply_answers([(Transaction.objects.get(id=moved.id), cafe.id, f'{cafe.id}-Main:Cafe', log)])
+        cafe.delete()
+
+        incremental = self.snapshot()
+        rebuild_monthly_aggregates(self.user)
+
+        self.assertEqual(incremental, self.snapshot())
+        # The moved transaction ended up uncategorized when its category was deleted
+        uncategorized = MonthlyAggregate.objects.get(account=other_account, transaction_type='expense')
+        self.assertEqual((uncategorized.category, uncategorized.amount, uncategorized.count), (None, Decimal('-7.00'), 1))
+
+    def test_apply_writes_all_groups_in_bulk(self):
+        categories = [ExpenseCategory.objects.create(name=f'Category {n}', user=self.user) for n in range(4)]
+        self.make_transaction(comment='existing', category=categories[0])
+        self.make_transaction(comment='emptied', category=categories[1])
+        delta = AggregateDelta()
+        for n, category in enumerate(categories):
+            transaction = Transaction(
+                user=self.user, account=self.account, category=category, transaction_type='expense',
+                amount=Decimal('-10.00'), currency=self.usd, date=datetime.date(2025, 1, 2),
+            )
+            delta.add(transaction, sign=-1 if category == categories[1] else 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            delta.apply()
+
+        statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        # One SELECT, one UPDATE, one DELETE and one INSERT whatever the number of groups
+        self.assertEqual([sql.split()[0] for sql in statements], ['SELECT', 'UPDATE', 'DELETE', 'INSERT'])
+        totals = MonthlyAggregate.objects.order_by('category_id').values_list('category_id', 'amount', 'count')
+        self.assertEqual(list(totals), [
+            (categories[0].id, Decimal('-20.00'), 2),
+            (categories[2].id, Decimal('-10.00'), 1),
+            (categories[3].id, Decimal('-10.00'), 1),
+        ])
+
+
+class TransactionListingTests(MoneyTestCase):
+    def setUp(self):
+        # Several transactions share a date, so the id breaks the ties
+        days = [1, 3, 3, 3, 2, 2, 5]
+        self.transactions = [
+            self.make_transaction(date=datetime.date(2025, 1, day), comment=f'{n}') for n, day in enumerate(days)
+        ]
+        bob = User.objects.create(username='bob')
+        self.make_transaction(self.make_account(bob, account_number='0002'), comment='not alice')
+
+    def expected_ids(self):
+        return [t.id for t in sorted(self.transactions, key=lambda t: (t.date, t.id), reverse=True)]
+
+    def test_pages_cover_every_transaction_once(self):
+        ids = []
+        params = {'limit': '3'}
+        while True:
+            page = transaction_page(self.user, params)
+            ids.extend(transaction.id for transaction in page.rows)
+            if page.next_cursor is None:
+                break
+            params = {'limit': '3', 'cursor': page.next_cursor}
+
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_api_pages(self):
+        self.client.force_login(self.user)
+        url = reverse('money:transactions_api')
+
+        first = self.client.get(url, {'limit': 4}).json()
+        second = self.client.get(url, {'limit': 4, 'cursor': first['next_cursor']}).json()
+
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], self.expected_ids())
+        self.assertIsNone(second['next_cursor'])
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('money:transactions_api'), {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ObjectCacheTests(SimpleTestCase):
+    bucket = 'statements'
+    key = 'statement.csv'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.s3 = LocalS3Client(os.path.join(tmp_dir.name, 's3'))
+        self.cache_dir = os.path.join(tmp_dir.name, 'cache')
+
+    def upload(self, content):
+        self.s3.upload_fileobj(io.BytesIO(content), self.bucket, self.key)
+
+    def read(self, cache):
+        with mock.patch.object(self.s3, 'get_object', wraps=self.s3.get_object) as get_object:
+            body = cache.get_body(self.s3, self.bucket, self.key)
+            content = body.read()
+            body.close()
+        return content, get_object.call_count
+
+    def test_unchanged_object_is_read_from_the_cache(self):
+        cache = ObjectCache(self.cache_dir, max_bytes=1024)
+        self.upload(b'first version')
+
+        self.assertEqual(self.read(cache), (b'first version', 1))
+        self.assertEqual(self.read(cache), (b'first version', 0))
+
+    def test_changed_etag_downloads_again(self):
+        cache = ObjectCache(self.cache_dir, max_bytes=1024)
+        self.upload(b'first version')
+        self.read(cache)
+
+        self.upload(b'second version')
+
+        self.assertEqual(self.read(cache), (b'second version', 1))
+        self.assertEqual(self.read(cache), (b'second version', 0))
+
+    def test_objects_larger_than_the_cache_are_streamed(self):
+        cache = ObjectCache(self.cache_dir, max_bytes=4)
+        self.upload(b'first version')
+
+        self.assertEqual(self.read(cache), (b'first version', 1))
+        self.assertEqual(self.read(cache), (b'first version', 1))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'blobs')))
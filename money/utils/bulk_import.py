@@ -0,0 +1,169 @@
+# money/utils/bulk_import.py
+from django.db import transaction as db_transaction, IntegrityError
+from money.models import Transaction
+from .exchange_rates import MissingExchangeRate, get_exchange_rate_table
+from .monthly_aggregates import AggregateDelta
+from .transaction_hash import dedup_key
+
+
+class TransactionBulkImporter:
+    """
+    Inserts parsed statement transactions with bulk_create instead of one
+    INSERT and one savepoint per row.
+
+    Rows are buffered and written in chunks. For every chunk the dedup hashes
+    of the rows that already exist in the database are fetched with a single
+    query on the unique hash index, and only the new rows are inserted.
+    Duplicates are counted and reported exactly like the per-row path did.
+
+    Rows without an exchange rate are imported unconverted and counted in
+    missing_rate_count. They are deduplicated by their hash like any other
+    row. Only if a dedup field stays NULL without the rate (no original
+    amount, so the hash is NULL and the unique index doesn't cover the row)
+    they are compared by their dedup fields instead.
+
+    At most `max_errors` messages are kept in `errors` (None keeps all), the
+    rest are only counted in omitted_errors.
+    """
+    DUPLICATE_MESSAGE = "Transaction already exists: {tx_data}. Skipping."
+    MISSING_RATE_MESSAGE = "{error} Transaction: {tx_data}. Imported without conversion."
+
+    def __init__(self, errors=None, batch_size=1000, max_errors=None):
+        self.batch_size = batch_size
+        self.errors = errors if errors is not None else []
+        self.max_errors = max_errors
+        self.omitted_errors = 0
+        self.created_count = 0
+        self.skipped_count = 0
+        self.missing_rate_count = 0
+        self._pending = []
+        self._seen_hashes = set()
+        self._seen_keys = set()
+        # One rate table for the whole import instead of a lookup per row
+        self.rates = get_exchange_rate_table()
+        # Inserted rows for MonthlyAggregate, written by the caller with aggregates.apply()
+        self.aggregates = AggregateDelta()
+
+        self._required_fields = [
+            field.attname for field in Transaction._meta.concrete_fields
+            if not field.null and not field.primary_key
+        ]
+
+    def add(self, instance, tx_data):
+        """Queues a prepared (not yet saved) Transaction for insertion."""
+        missing_rate = None
+        try:
+            instance.prepare_for_save(rates=self.rates)
+        except MissingExchangeRate as e:
+            # The row is kept unconverted rather than lost, the rate can be added later
+            instance.prepare_for_save(rates=self.rates, allow_missing_rate=True)
+            missing_rate = self.MISSING_RATE_MESSAGE.format(error=e, tx_data=tx_data)
+        self._pending.append((instance, tx_data, missing_rate))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def skip(self, message):
+        """Records a skipped row, keeping the errors in the original row order."""
+        self._pending.append((None, message, None))
+
+    def _error(self, message):
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append(message)
+        else:
+            self.omitted_errors += 1
+
+    def _existing_hashes(self, instances):
+        """Fetches the hashes of the already stored transactions in one query."""
+        hashes = {instance.dedup_hash for instance in instances if instance.dedup_hash is not None}
+        if not hashes:
+            return set()
+        return set(Transaction.objects.filter(dedup_hash__in=hashes).values_list('dedup_hash', flat=True))
+
+    def _existing_unconverted_keys(self, instances):
+        """Fetches the dedup keys of the stored unconverted transactions of the same accounts and dates."""
+        if not instances:
+            return set()
+        rows = Transaction.objects.filter(
+            dedup_hash__isnull=True, exchange_rate__isnull=True,
+            account_id__in={instance.account_id for instance in instances},
+            date__in={instance.date for instance in instances},
+        )
+        return {dedup_key(row) for row in rows}
+
+    def _insert(self, instances):
+        """
+        Inserts new rows in one statement. If a concurrent import has inserted
+        some of them in the meantime, falls back to row-by-row inserts for this
+        chunk so that only the conflicting rows are skipped.
+        """
+        try:
+            with db_transaction.atomic():
+                Transaction.objects.bulk_create([instance for instance, *_ in instances])
+            return [True] * len(instances)
+        except IntegrityError:
+            pass
+
+        results = []
+        for instance, *_ in instances:
+            instance.pk = None
+            try:
+                with db_transaction.atomic():
+                    Transaction.objects.bulk_create([instance])
+                results.append(True)
+            except IntegrityError:
+                results.append(False)
+        return results
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        candidates = [
+            (instance, missing_rate) for instance, _, missing_rate in pending
+            if instance is not None and all(getattr(instance, name) is not None for name in self._required_fields)
+        ]
+        existing_hashes = self._existing_hashes([instance for instance, _ in candidates])
+        existing_keys = self._existing_unconverted_keys([
+            instance for instance, missing_rate in candidates if missing_rate and instance.dedup_hash is None
+        ])
+
+        # Decide for every row whether it is new, keeping the original order
+        decisions = []
+        to_insert = []
+        for instance, tx_data, missing_rate in pending:
+            if instance is None:
+                decisions.append((False, tx_data))
+                continue
+            if not all(getattr(instance, name) is not None for name in self._required_fields):
+                # The database would reject the row, just like a duplicate
+                decisions.append((False, self.DUPLICATE_MESSAGE.format(tx_data=tx_data)))
+                continue
+            if missing_rate and instance.dedup_hash is None:
+                key = dedup_key(instance)
+                if key in existing_keys or key in self._seen_keys:
+                    decisions.append((False, self.DUPLICATE_MESSAGE.format(tx_data=tx_data)))
+                    continue
+                self._seen_keys.add(key)
+            # A NULL hash (a NULL dedup field) never collides, like NULLs in a unique index
+            dedup_hash = instance.dedup_hash
+            if dedup_hash is not None:
+                if dedup_hash in existing_hashes or dedup_hash in self._seen_hashes:
+                    decisions.append((False, self.DUPLICATE_MESSAGE.format(tx_data=tx_data)))
+                    continue
+                self._seen_hashes.add(dedup_hash)
+            decisions.append((True, len(to_insert)))
+            to_insert.append((instance, tx_data, missing_rate))
+
+        inserted = self._insert(to_insert) if to_insert else []
+
+        for is_new, value in decisions:
+            if is_new:
+                instance, tx_data, missing_rate = to_insert[value]
+                if inserted[value]:
+                    self.created_count += 1
+                    self.aggregates.add(instance)
+                    if missing_rate:
+                        self.missing_rate_count += 1
+                        self._error(missing_rate)
+                    continue
+                value = self.DUPLICATE_MESSAGE.format(tx_data=tx_data)
+            self.skipped_count += 1
+            self._error(value)
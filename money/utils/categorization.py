@@ -0,0 +1,306 @@
+# money/utils/categorization.py
+"""
+Categorization of transactions by an LLM.
+
+The prompt format and the parsing of the answers are shared by the per-batch
+Celery task and by CategorizationEngine, which runs the prompts of one large
+job concurrently and writes all results back in bulk.
+
+Transactions are grouped by user and normalized place: every unique place is
+sent to the model once, and its answer is kept in PlaceCategoryCache so later
+batches of the same user with the same place skip the model.
+"""
+import asyncio
+import re
+import time
+from django.db import transaction as db_transaction
+from money.models import ExpenseCategory, GptLog, PlaceCategoryCache, Transaction, TransactionCategoryLog
+from .task_metrics import external_call, record_rows
+from .monthly_aggregates import AggregateDelta, aggregate_key
+
+# Category assigned when the model returns a line without a category id
+FALLBACK_CATEGORY_ID = 1
+
+# Bump when the prompt template or the list of categories changes meaningfully,
+# answers cached for older versions are then ignored
+PROMPT_TEMPLATE_VERSION = 1
+
+# Standalone numbers and card/terminal markers, e.g. the store number in 'WOOLWORTHS 1234 SYDNEY'
+_PLACE_NOISE = re.compile(r'(?<!\S)[\d#*]+(?!\S)')
+
+
+def normalize_place(place):
+    """Returns the cache key of a place: lowercased, without standalone numbers and extra spaces."""
+    return ' '.join(_PLACE_NOISE.sub(' ', (place or '').casefold()).split())
+
+
+def group_by_place(transactions):
+    """Returns {(user id, normalized place): [transactions]} keeping the order of the transactions."""
+    groups = {}
+    for transaction in transactions:
+        groups.setdefault((transaction.user_id, normalize_place(transaction.place)), []).append(transaction)
+    return groups
+
+
+def cached_places(places):
+    """
+    Returns {(user id, normalized place): PlaceCategoryCache} for the places
+    of group_by_place answered with the current prompt.
+    """
+    places = set(places)
+    entries = PlaceCategoryCache.objects.filter(
+        prompt_version=PROMPT_TEMPLATE_VERSION,
+        user_id__in={user_id for user_id, _ in places},
+        place__in={place for _, place in places},
+    )
+    return {
+        (entry.user_id, entry.place): entry for entry in entries
+        if (entry.user_id, entry.place) in places
+    }
+
+
+def cached_answers(groups, cache, gpt_log):
+    """Answers for every transaction of the cached places, in the format of apply_answers."""
+    return [
+        (transaction, entry.category_id, entry.category_log, gpt_log)
+        for place, entry in cache.items()
+        for transaction in groups[place]
+    ]
+
+
+def place_answers(parsed, groups, gpt_log):
+    """Spreads the answers parsed per place to every transaction sharing the place."""
+    return [
+        (transaction, category_id, category_log, gpt_log)
+        for place, category_id, category_log in parsed
+        for transaction in groups[place]
+    ]
+
+
+def categories_for_prompt():
+    """Returns the categories available to the model as '<id>-<parent>:<name>' joined by ';'."""
+    categories = ExpenseCategory.objects.filter(for_categorized=True).select_related('parent_category')
+
+    categories_list = []
+    for category in categories:
+        if category.parent_category:
+            categories_list.append(f'{category.id}-{category.parent_category.name}:{category.name}')
+        else:
+            categories_list.append(f'{category.id}-Main:{category.name}')
+    return ';'.join(categories_list)
+
+
+def build_prompt(categories_str, places):
+    """Builds the prompt asking the model to categorize the places."""
+    prompt = (
+        f"Вот список категорий транзакций разделенных знаком \";\" каждая и в формате <id категории>-<название родительсой категории>:<название категории>: {categories_str}.\n"
+        f"Для каждой строки определи, к какой категории из списка она относится. "
+        "Ответ верни в формате: <номер строки>. <категория>.\n\n"
+    )
+    for i, place in enumerate(places, 1):
+        prompt += f"{i}. {place} \n"
+
+    prompt += "\nТолько категории, никаких комментариев."
+    return prompt
+
+
+def parse_answers(result, items):
+    """
+    Parses the model answer '<номер строки>. <id категории>-...' line by line,
+    the n-th line answers the n-th of `items`.
+    Returns a list of (item, category_id, category_log).
+    """
+    answers = []
+    for line, item in zip(result.splitlines(), items):
+        category_id = FALLBACK_CATEGORY_ID
+        parts = line.split('.')
+        if len(parts) >= 2:
+            raw_category_id = parts[1].strip().split('-')[0].strip()
+            if raw_category_id:
+                category_id = int(raw_category_id)
+        answers.append((item, category_id, parts[1].strip()))
+    return answers
+
+
+def apply_answers(answers, place_results=()):
+    """
+    Writes parsed answers back with a fixed number of queries.
+    `answers` is a list of (transaction, category_id, category_log, gpt_log),
+    `place_results` lists ((user id, place), category_id, category_log, gpt_log)
+    of the new model answers to remember in the cache.
+    """
+    # All referenced categories are loaded with one query, the results are written in bulk
+    categories_by_id = ExpenseCategory.objects.in_bulk({category_id for _, category_id, _, _ in answers})
+    category_logs = []
+    aggregates = AggregateDelta()
+    for transaction, category_id, category_log, gpt_log in answers:
+        old_key = aggregate_key(transaction)
+        transaction.category = categories_by_id.get(category_id)
+        aggregates.move(transaction, old_key)
+        category_logs.append(TransactionCategoryLog(
+            transaction=transaction,
+            category_log=category_log,
+            gpt_log=gpt_log
+        ))
+
+    # The fallback category, unknown ids and other users' categories are not cached,
+    # such places are asked again next time
+    cache_entries = [
+        PlaceCategoryCache(user_id=user_id, place=place, prompt_version=PROMPT_TEMPLATE_VERSION,
+                           category_id=category_id, category_log=category_log, gpt_log=gpt_log)
+        for (user_id, place), category_id, category_log, gpt_log in place_results
+        if category_id != FALLBACK_CATEGORY_ID and category_id in categories_by_id
+        and categories_by_id[category_id].user_id == user_id
+    ]
+
+    with db_transaction.atomic():
+        Transaction.objects.bulk_update([transaction for transaction, _, _, _ in answers], ['category'], batch_size=1000)
+        TransactionCategoryLog.objects.bulk_create(category_logs, batch_size=1000)
+        # Another task may have cached the same place in the meantime
+        PlaceCategoryCache.objects.bulk_create(cache_entries, batch_size=1000, ignore_conflicts=True)
+        aggregates.apply()
+    record_rows(categorized=len(answers))
+
+
+class ThreadedBackend:
+    """Runs a blocking model call (e.g. _ya_model) in a worker thread."""
+    def __init__(self, model_name, model_func):
+        self.model_name = model_name
+        self.model_func = model_func
+
+    async def complete(self, prompt):
+        return await asyncio.to_thread(self.model_func, prompt)
+
+
+class FakeBackend:
+    """
+    Offline model for tests and benchmarks: puts every line of the prompt
+    into the same category, optionally after a simulated latency.
+    """
+    model_name = 'fake'
+
+    def __init__(self, category_id=FALLBACK_CATEGORY_ID, latency=0.0):
+        self.category_id = category_id
+        self.latency = latency
+
+    async def complete(self, prompt):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        numbers = [line.split('.')[0] for line in prompt.splitlines() if line[:1].isdigit()]
+        return "\n".join(f"{number}. {self.category_id}-Fake:Fake" for number in numbers)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for one event loop: `rate` requests per second
+    with bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CategorizationEngine:
+    """
+    Categorizes a large set of transactions in one job.
+
+    Transactions are split into prompts of `batch_size` places, the prompts are sent
+    to the backend concurrently (at most `concurrency` in flight and at most
+    `rate_limit` per second, None disables the limit), and the results of all
+    prompts are written back in bulk. A failed prompt is logged in GptLog and its
+    transactions stay uncategorized, so the next run picks them up again.
+    """
+    def __init__(self, backend, concurrency=8, rate_limit=None, batch_size=10):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.batch_size = batch_size
+
+    async def _complete(self, prompt, semaphore, limiter):
+        """Returns (result, error) of one prompt."""
+        async with semaphore:
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                with external_call('gpt'):
+                    return await self.backend.complete(prompt), None
+            except Exception as e:
+                return None, e
+
+    async def _complete_all(self, prompts):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = TokenBucket(self.rate_limit) if self.rate_limit else None
+        return await asyncio.gather(*(self._complete(prompt, semaphore, limiter) for prompt in prompts))
+
+    def run(self, transaction_ids, log_prefix):
+        """
+        Categorizes the uncategorized transactions among `transaction_ids`.
+        GptLog entries are named '<log_prefix>-<prompt number>', places answered
+        from the cache are logged in '<log_prefix>-cache'.
+        Returns (number of categorized transactions, number of failed prompts).
+        """
+        transactions = list(Transaction.objects.filter(category__isnull=True, id__in=transaction_ids).order_by('id'))
+        if not transactions:
+            return 0, 0
+
+        groups = group_by_place(transactions)
+        cache = cached_places(groups)
+        gpt_logs = []
+        answers = []
+        place_results = []
+        if cache:
+            cache_log = GptLog(
+                celery_task_id=f'{log_prefix}-cache', model_name=self.backend.model_name,
+                result=f"Answered from the cache: {len(cache)} places.",
+                status=GptLog.Status.SUCCESS, cache_hits=len(cache),
+            )
+            gpt_logs.append(cache_log)
+            answers.extend(cached_answers(groups, cache, cache_log))
+
+        # Every place missing from the cache is sent once, in the words of its first transaction
+        missing = [place for place in groups if place not in cache]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        prompts = []
+        if batches:
+            categories_str = categories_for_prompt()
+            prompts = [build_prompt(categories_str, [groups[place][0].place for place in batch]) for batch in batches]
+
+        # Only the model calls run in the event loop, the ORM is used before and after it
+        results = asyncio.run(self._complete_all(prompts)) if prompts else []
+
+        failed = 0
+        for n, (batch, prompt, (result, error)) in enumerate(zip(batches, prompts, results)):
+            log_entry = GptLog(celery_task_id=f'{log_prefix}-{n}', model_name=self.backend.model_name,
+                               prompt=prompt, cache_misses=len(batch))
+            gpt_logs.append(log_entry)
+            if error is None:
+                log_entry.result = result
+                try:
+                    parsed = parse_answers(result, batch)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                log_entry.status = GptLog.Status.FAILED
+                log_entry.error_message = str(error)
+                failed += 1
+                continue
+            log_entry.status = GptLog.Status.SUCCESS
+            answers.extend(place_answers(parsed, groups, log_entry))
+            place_results.extend((place, category_id, category_log, log_entry) for place, category_id, category_log in parsed)
+
+        with db_transaction.atomic():
+            GptLog.objects.bulk_create(gpt_logs, batch_size=1000)
+            apply_answers(answers, place_results)
+        return len(answers), failed
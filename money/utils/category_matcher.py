@@ -0,0 +1,108 @@
+# money/utils/category_matcher.py
+import re
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from money.models import PlaceCategoryMapping
+
+# Bump when the layout of CategoryMatcher changes, so stale pickles are ignored
+CACHE_FORMAT_VERSION = 1
+CACHE_KEY_PREFIX = 'category_matcher'
+
+
+class CategoryMatcher:
+    """
+    A compiled form of a user's PlaceCategoryMapping rules.
+
+    EXACT rules are kept in a dict keyed by the lowercased keyword. CONTAINS
+    rules are compiled into one regex with an alternation per rule inside a
+    lookahead, so a single scan over a place finds, at every position, the
+    highest-priority keyword starting there. Priority follows the model's
+    `-id` ordering, the same order the rules were checked in one by one.
+    """
+    def __init__(self, rules):
+        """
+        `rules` is an iterable of (place_keyword, match_type, category_id)
+        tuples, ordered by priority (newest rule first).
+        """
+        self.exact = {}
+        self.contains = []
+        for keyword, match_type, category_id in rules:
+            if match_type == PlaceCategoryMapping.MatchType.EXACT:
+                self.exact.setdefault(keyword.lower(), category_id)
+            elif match_type == PlaceCategoryMapping.MatchType.CONTAINS:
+                self.contains.append((keyword.lower(), category_id))
+
+        self._pattern = None
+        self._priority = {}
+        if self.contains:
+            for priority, (keyword, _) in enumerate(self.contains):
+                self._priority.setdefault(keyword, priority)
+            alternation = '|'.join(re.escape(keyword) for keyword, _ in self.contains)
+            self._pattern = re.compile(f'(?=({alternation}))', re.DOTALL)
+
+    @classmethod
+    def for_user(cls, user):
+        """Builds a matcher from the user's rules with a single query."""
+        rules = PlaceCategoryMapping.objects.filter(user=user).values_list('place_keyword', 'match_type', 'category_id')
+        return cls(rules)
+
+    def match(self, place):
+        """Returns the category id for the place, or None if no rule matches."""
+        if not place:
+            return None
+
+        place = place.lower()
+        category_id = self.exact.get(place)
+        if category_id is not None:
+            return category_id
+
+        if self._pattern is None:
+            return None
+        best = None
+        for found in self._pattern.finditer(place):
+            priority = self._priority[found.group(1)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self.contains[best][1] if best is not None else None
+
+    def match_many(self, places):
+        """
+        Matches a batch of places, each distinct place is matched only once.
+        Returns a dict place -> category id (or None).
+        """
+        results = {}
+        for place in places:
+            if place not in results:
+                results[place] = self.match(place)
+        return results
+
+
+def _version_key(user_id):
+    return f'{CACHE_KEY_PREFIX}:version:{user_id}'
+
+
+def get_category_matcher(user):
+    """
+    Returns the compiled matcher of the user from the shared cache, building
+    and storing it on a miss. The key includes a per-user version token that
+    invalidate_category_matcher() replaces whenever the rules change.
+    """
+    version = cache.get(_version_key(user.id))
+    if version is None:
+        cache.add(_version_key(user.id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user.id))
+
+    key = f'{CACHE_KEY_PREFIX}:{CACHE_FORMAT_VERSION}:{user.id}:{version}'
+    matcher = cache.get(key)
+    if matcher is None:
+        matcher = CategoryMatcher.for_user(user)
+        cache.set(key, matcher, timeout=settings.CATEGORY_MATCHER_CACHE_TIMEOUT)
+    return matcher
+
+
+def invalidate_category_matcher(user_id):
+    """Makes the next get_category_matcher() call for the user rebuild the matcher."""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
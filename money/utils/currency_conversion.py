@@ -0,0 +1,147 @@
+# money/utils/currency_conversion.py
+"""
+Vectorized conversion of transaction amounts to one reporting currency.
+
+Amounts are handled as integer cents and rates as integer millionths
+(ExchangeRate stores six decimal places, so both are exact). For every row
+the rates of its currency and of the target currency are joined by date with
+np.searchsorted against the rate series of ExchangeRateTable (the nearest
+previous date when the day is missing). The converted amount
+cents * target rate / source rate is divided in integers and rounded half away
+from zero, so it is exactly what Decimal ROUND_HALF_UP gives; only the results
+are turned back into Decimal.
+"""
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+from money.models import Currency
+from .exchange_rates import BASE_CURRENCY_CODE, MissingExchangeRate, get_exchange_rate_table
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Rates are integers in millionths, ExchangeRate.exchange_rate has six decimal places
+RATE_SCALE = 10 ** 6
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+def _to_days(dates):
+    """Days since 1970-01-01 as int64 from datetime64 values or date objects."""
+    return np.asarray(dates).astype('datetime64[D]').astype(np.int64)
+
+
+class ConversionResult:
+    """
+    Converted amounts in cents of the target currency. Rows without a rate are
+    marked in `missing` and converted to 0.
+    """
+    def __init__(self, cents, missing, currency_ids, days):
+        self.cents = cents
+        self.missing = missing
+        self._currency_ids = currency_ids
+        self._days = days
+
+    def total(self):
+        """Sum of the converted amounts as Decimal, rows without a rate excluded."""
+        return Decimal(int(self.cents.sum())).scaleb(-2)
+
+    def amounts(self):
+        """Converted amounts as a list of Decimal, None for rows without a rate."""
+        return [
+            None if missing else Decimal(cents).scaleb(-2)
+            for cents, missing in zip(self.cents.tolist(), self.missing.tolist())
+        ]
+
+    def check(self, currencies=None):
+        """
+        Raises MissingExchangeRate for the first row without a rate.
+        `currencies` ({id: Currency}) gives the currency code for the message.
+        """
+        if self.missing.any():
+            i = int(np.argmax(self.missing))
+            currency_id = int(self._currency_ids[i])
+            if currency_id == -1:
+                code = None
+            elif currencies and currency_id in currencies:
+                code = currencies[currency_id].code
+            else:
+                code = currency_id
+            raise MissingExchangeRate(code, date.fromordinal(int(self._days[i]) + _EPOCH_ORDINAL))
+
+
+def _scaled_rate(rate):
+    """A rate (Decimal or float) as an integer number of millionths."""
+    if not isinstance(rate, Decimal):
+        rate = Decimal(rate)
+    return int(rate.scaleb(6).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _rates_on(table, currency_id, days):
+    """Rates from the base currency to the currency on the days in millionths, 0 where there is none."""
+    series = table.series(currency_id)
+    if series is None or not len(series.days):
+        return np.zeros(len(days), dtype=np.int64)
+    rate_days = np.asarray(series.days, dtype=np.int64) - _EPOCH_ORDINAL
+    rates = np.array([_scaled_rate(rate) for rate in series.rates], dtype=np.int64)
+    positions = np.searchsorted(rate_days, days, side='right') - 1
+    result = rates[np.maximum(positions, 0)]
+    result[positions < 0] = 0
+    return result
+
+
+def _divide_half_up(numerators, denominators):
+    """Integer division rounded half away from zero, like Decimal ROUND_HALF_UP."""
+    return np.sign(numerators) * ((2 * np.abs(numerators) + denominators) // (2 * denominators))
+
+
+def convert(amounts, currency_ids, dates, target_currency, rates=None, base_currency_id=None):
+    """
+    Converts columns of amounts (in units of their currency), currency ids and
+    dates to `target_currency` in one pass. `rates` is the ExchangeRateTable to
+    use, the shared one by default. `base_currency_id` is the id of the base
+    currency, its rate is always 1. Returns a ConversionResult.
+    """
+    if rates is None:
+        rates = get_exchange_rate_table()
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if isinstance(currency_ids, np.ndarray):
+        currency_ids = currency_ids.astype(np.int64)
+    else:
+        # Currency ids may be None for transactions without a currency
+        currency_ids = np.array([-1 if currency_id is None else currency_id for currency_id in currency_ids], dtype=np.int64)
+    days = _to_days(dates)
+
+    cents = np.rint(amounts * 100).astype(np.int64)
+    source_rates = np.zeros(len(cents), dtype=np.int64)
+    for currency_id in np.unique(currency_ids).tolist():
+        mask = currency_ids == currency_id
+        if currency_id == base_currency_id:
+            source_rates[mask] = RATE_SCALE
+        elif currency_id != -1:
+            source_rates[mask] = _rates_on(rates, currency_id, days[mask])
+
+    if target_currency.code == BASE_CURRENCY_CODE:
+        target_rates = np.full(len(cents), RATE_SCALE, dtype=np.int64)
+    else:
+        target_rates = _rates_on(rates, target_currency.id, days)
+
+    missing = (source_rates == 0) | (target_rates == 0)
+    cents[missing] = 0
+    denominators = np.where(missing, 1, source_rates)
+    largest = 2 * int(np.abs(cents).max(initial=0)) * int(target_rates.max(initial=0)) + int(denominators.max(initial=0))
+    if largest > _INT64_MAX:
+        # Too large for int64, the same division in Python integers
+        cents, target_rates, denominators = cents.astype(object), target_rates.astype(object), denominators.astype(object)
+    converted_cents = _divide_half_up(cents * target_rates, denominators).astype(np.int64)
+    return ConversionResult(converted_cents, missing, currency_ids, days)
+
+
+def convert_queryset(queryset, target_currency, amount_field='amount', currency_field='currency_id', date_field='date', rates=None):
+    """Converts the amounts of a Transaction queryset to `target_currency`, fetching only three columns."""
+    rows = list(queryset.values_list(amount_field, currency_field, date_field))
+    if not rows:
+        return ConversionResult(np.empty(0, dtype=np.int64), np.empty(0, dtype=bool), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    amounts, currency_ids, dates = zip(*rows)
+    base_currency_id = Currency.objects.filter(code=BASE_CURRENCY_CODE).order_by('id').values_list('id', flat=True).first()
+    return convert(
+        [float(amount) for amount in amounts], currency_ids, np.array(dates, dtype='datetime64[D]'),
+        target_currency, rates=rates, base_currency_id=base_currency_id,
+    )
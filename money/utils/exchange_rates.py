@@ -0,0 +1,112 @@
+# money/utils/exchange_rates.py
+"""
+In-memory exchange-rate table.
+
+Rates are fetched from Fixer with USD as the base, so a table holds one
+series per target currency: the dates as ordinals in an array and the rates
+in a parallel list, both sorted by date. A lookup is a binary search for the
+rate of the date or, if that day is missing, of the nearest previous day.
+
+Every process keeps the loaded table and reloads it when the version token in
+the shared cache changes, which happens whenever rates are written.
+"""
+import uuid
+from array import array
+from bisect import bisect_right
+from decimal import Decimal
+from django.core.cache import cache
+from money.models import ExchangeRate
+
+BASE_CURRENCY_CODE = 'USD'
+CACHE_VERSION_KEY = 'exchange_rates:version'
+
+
+class MissingExchangeRate(ValueError):
+    """There is no rate for the currency on the date or any day before it."""
+    def __init__(self, currency_code, on_date):
+        self.currency_code = currency_code
+        self.on_date = on_date
+        if on_date is None:
+            super().__init__(f"No exchange rate {BASE_CURRENCY_CODE} -> {currency_code}: the transaction has no date.")
+        else:
+            super().__init__(f"No exchange rate {BASE_CURRENCY_CODE} -> {currency_code} on or before {on_date}.")
+
+
+class RateSeries:
+    """Rates of one currency ordered by date."""
+    __slots__ = ('days', 'rates')
+
+    def __init__(self):
+        self.days = array('l')
+        self.rates = []
+
+    def append(self, on_date, rate):
+        """Adds a rate, dates must come in ascending order."""
+        self.days.append(on_date.toordinal())
+        self.rates.append(rate)
+
+    def on_or_before(self, on_date):
+        """Returns the rate of the date or of the nearest previous date, None if there is none."""
+        i = bisect_right(self.days, on_date.toordinal()) - 1
+        return self.rates[i] if i >= 0 else None
+
+
+class ExchangeRateTable:
+    """Rates from the base currency to every other currency, by currency id."""
+    def __init__(self, rows):
+        """`rows` is an iterable of (target currency id, date, rate) ordered by date."""
+        self._series = {}
+        for currency_id, on_date, rate in rows:
+            series = self._series.get(currency_id)
+            if series is None:
+                series = self._series[currency_id] = RateSeries()
+            series.append(on_date, rate)
+
+    @classmethod
+    def load(cls):
+        """Loads all rates from the base currency with a single query."""
+        rows = (
+            ExchangeRate.objects.filter(source_currency__code=BASE_CURRENCY_CODE)
+            .order_by('date', 'id')
+            .values_list('target_currency_id', 'date', 'exchange_rate')
+        )
+        return cls(rows)
+
+    def series(self, currency_id):
+        """Returns the RateSeries of the currency, None if it has no rates."""
+        return self._series.get(currency_id)
+
+    def rate(self, currency, on_date):
+        """
+        Returns the rate from the base currency to `currency` on the date, falling
+        back to the nearest previous date. Raises MissingExchangeRate if there is none.
+        """
+        if currency is not None and currency.code == BASE_CURRENCY_CODE:
+            return Decimal(1)
+        series = self._series.get(currency.id) if currency is not None else None
+        rate = series.on_or_before(on_date) if series is not None and on_date is not None else None
+        if rate is None:
+            raise MissingExchangeRate(currency.code if currency is not None else None, on_date)
+        return rate
+
+
+# (version, table) loaded by this process
+_loaded = (None, None)
+
+
+def get_exchange_rate_table():
+    """Returns the rate table, reloading it if the rates changed since it was loaded."""
+    global _loaded
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(CACHE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(CACHE_VERSION_KEY)
+    # Without a working cache (version stays None) the table is loaded on every call
+    if version is None or _loaded[0] != version:
+        _loaded = (version, ExchangeRateTable.load())
+    return _loaded[1]
+
+
+def invalidate_exchange_rates():
+    """Makes every process reload the rate table on its next lookup."""
+    cache.set(CACHE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
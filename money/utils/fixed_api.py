@@ -1,26 +1,96 @@
+import logging
 import requests
 from datetime import date, timedelta
 from django.conf import settings
+from django.db import transaction as db_transaction
 from money.models import Currency, ExchangeRate  # replace 'your_app' with your app's name
+from .task_metrics import external_call, record_rows
+from .exchange_rates import invalidate_exchange_rates
 
-def fetch_historical_exchange_rates(start_date: date, end_date: date, base_currency_code='USD'):
+TARGET_CURRENCY_CODES = ['RUB', 'KZT', 'AUD']
+
+logger = logging.getLogger(__name__)
+
+
+class FixerAPIError(Exception):
+    """Fixer answered with success: false, `error` holds the details it gave."""
+    def __init__(self, message, error):
+        self.error = error
+        super().__init__(f"{message}: {error}")
+
+
+def _symbols(extra_currency=None, only_extra=False):
+    if only_extra:
+        return extra_currency
+    symbols = ','.join(TARGET_CURRENCY_CODES)
+    if extra_currency:
+        symbols += f',{extra_currency}'
+    return symbols
+
+
+def _resolve_currencies(codes):
+    """Returns {code: Currency} with one query, the oldest currency wins for a duplicated code."""
+    currencies = {}
+    for currency in Currency.objects.filter(code__in=codes).order_by('-id'):
+        currencies[currency.code] = currency
+    missing = set(codes) - set(currencies)
+    if missing:
+        raise Currency.DoesNotExist(f"Currencies not found: {', '.join(sorted(missing))}")
+    return currencies
+
+
+def save_exchange_rates(base_currency_code, rates_by_date):
+    """
+    Writes {date: {currency code: rate}} with a single upsert: a rate already stored
+    for the same currencies and date is updated, so re-running a range adds no duplicates.
+    """
+    codes = {base_currency_code}
+    for rates in rates_by_date.values():
+        codes.update(rates)
+    currencies = _resolve_currencies(codes)
+    base_currency = currencies[base_currency_code]
+
+    exchange_rates = [
+        ExchangeRate(
+            source_currency=base_currency,
+            target_currency=currencies[target_currency_code],
+            exchange_rate=exchange_rate,
+            date=rate_date,
+        )
+        for rate_date, rates in rates_by_date.items()
+        for target_currency_code, exchange_rate in rates.items()
+    ]
+    ExchangeRate.objects.bulk_create(
+        exchange_rates,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['source_currency', 'target_currency', 'date'],
+        update_fields=['exchange_rate'],
+    )
+    # bulk_create sends no post_save, so the rate tables are invalidated here
+    db_transaction.on_commit(invalidate_exchange_rates)
+    record_rows(exchange_rates=len(exchange_rates))
+
+
+def fetch_historical_exchange_rates(start_date: date, end_date: date, base_currency_code='USD', symbols=None):
     access_key = settings.FIXER_API_KEY  # replace with your actual API key
 
-    target_currency_codes = ['RUB', 'KZT', 'AUD']
-    symbols = ','.join(target_currency_codes)
+    if symbols is None:
+        symbols = _symbols()
 
     try:
-        response = requests.get(f'{settings.FIXER_API_URL}timeseries', params={
-            'access_key': access_key,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'base': base_currency_code,
-            'symbols': symbols,
-        })
+        with external_call('fixer'):
+            response = requests.get(f'{settings.FIXER_API_URL}timeseries', params={
+                'access_key': access_key,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'base': base_currency_code,
+                'symbols': symbols,
+            })
         
         response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xx
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while fetching exchange rates: {e}")
+        logger.warning("An error occurred while fetching exchange rates: %s", e)
         # Here you can decide how you want to handle the exception, for example:
         # - You might want to re-raise the exception.
         # - You could return from the function.
@@ -31,63 +101,55 @@ def fetch_historical_exchange_rates(start_date: date, end_date: date, base_curre
     data = response.json()
 
     if data['success']:
-        base_currency = Currency.objects.get(code=base_currency_code)
-
-        for date_str, rates in data['rates'].items():
-            for target_currency_code, exchange_rate in rates.items():
-                target_currency = Currency.objects.get(code=target_currency_code)
-                ExchangeRate.objects.create(
-                    source_currency=base_currency,
-                    target_currency=target_currency,
-                    exchange_rate=exchange_rate,
-                    date=date.fromisoformat(date_str),
-                )
+        save_exchange_rates(base_currency_code, {
+            date.fromisoformat(date_str): rates for date_str, rates in data['rates'].items()
+        })
         return 
     else:
         error_info = data.get('error', {})  # The API might provide error details under 'error'
-        print(f"Failed to fetch historical exchange rates: {error_info}")
+        # Raised, so the task retries instead of reporting a range it didn't save
+        raise FixerAPIError(f"Failed to fetch historical exchange rates from {start_date} to {end_date}", error_info)
 
 
 def fetch_exchange_rates_for_date(target_date: date, extra_currency=None, only_extra=False, base_currency_code='USD'):
     access_key = settings.FIXER_API_KEY  # replace with your actual API key
 
-    target_currency_codes = ['RUB', 'KZT', 'AUD']
-    if only_extra:
-        symbols = extra_currency
-    else:
-        symbols = ','.join(target_currency_codes)
-        if extra_currency:
-            symbols += f',{extra_currency}'
+    symbols = _symbols(extra_currency, only_extra)
 
     try:
-        response = requests.get(f'{settings.FIXER_API_URL}{target_date.isoformat()}', params={
-            'access_key': access_key,
-            'base': base_currency_code,
-            'symbols': symbols,
-        })
+        with external_call('fixer'):
+            response = requests.get(f'{settings.FIXER_API_URL}{target_date.isoformat()}', params={
+                'access_key': access_key,
+                'base': base_currency_code,
+                'symbols': symbols,
+            })
 
         response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xx
     except requests.exceptions.RequestException as e:
-        print(f"An error occurred while fetching exchange rates: {e}")
+        logger.warning("An error occurred while fetching exchange rates: %s", e)
         raise e
 
     data = response.json()
 
     if data['success']:
-        base_currency = Currency.objects.get(code=base_currency_code)
-
-        for target_currency_code, exchange_rate in data['rates'].items():
-            target_currency = Currency.objects.get(code=target_currency_code)
-            ExchangeRate.objects.create(
-                source_currency=base_currency,
-                target_currency=target_currency,
-                exchange_rate=exchange_rate,
-                date=target_date,
-            )
+        save_exchange_rates(base_currency_code, {target_date: data['rates']})
     else:
         error_info = data.get('error', {})  # The API might provide error details under 'error'
-        print(f"Failed to fetch exchange rates for {target_date}: {error_info}")
+        raise FixerAPIError(f"Failed to fetch exchange rates for {target_date}", error_info)
     
 def date_range(start_date, end_date):
     for n in range(int((end_date - start_date).days) + 1):
-        yield start_date + timedelta(n)
\ No newline at end of file
+        yield start_date + timedelta(n)
+
+
+def fetch_exchange_rates_range(start_date: date, end_date: date, extra_currency=None, only_extra=False, base_currency_code='USD'):
+    """
+    Fetches a range with one timeseries request per FIXER_TIMESERIES_MAX_DAYS days
+    instead of one request per day.
+    """
+    symbols = _symbols(extra_currency, only_extra)
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(end_date, chunk_start + timedelta(days=settings.FIXER_TIMESERIES_MAX_DAYS - 1))
+        fetch_historical_exchange_rates(chunk_start, chunk_end, base_currency_code=base_currency_code, symbols=symbols)
+        chunk_start = chunk_end + timedelta(days=1)
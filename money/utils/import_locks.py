@@ -0,0 +1,80 @@
+# money/utils/import_locks.py
+"""
+Coordination of concurrent statement imports.
+
+The dispatcher claims PENDING files with SELECT ... FOR UPDATE SKIP LOCKED,
+so overlapping calls never enqueue the same file twice. A claim stamps
+claimed_at and the import refreshes it with every committed chunk; a file
+left in PROCESSING without progress for STATEMENT_CLAIM_TIMEOUT seconds (its
+worker died) is claimed again and imported anew; the rows the dead worker
+committed are then skipped as duplicates.
+
+Imports of different accounts run in parallel. Imports into the same account
+are serialized chunk by chunk with PostgreSQL transaction-level advisory
+locks: every chunk takes the lock in its own transaction, looks up the
+existing rows and inserts the new ones before committing. Two imports into
+one account may therefore interleave their chunks, but a chunk always sees
+the rows committed by the other import's chunks as existing duplicates, so
+no row is inserted twice and no insert fails on the unique index. Holding
+the lock for the whole import would need a session-level lock, which does
+not survive between transactions behind a transaction-pooling PgBouncer.
+
+Statements with the account in the header lock that account. Statements with
+the account in every row (header 'FROM_CSV') are only known to touch some
+accounts of the user, so they lock the whole user. Account locks also take
+the user lock in shared mode, so the two kinds exclude each other, and the
+locks are always taken user first, which keeps them free of deadlocks.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+from money.models import BankExportFiles
+
+# First key of the two-key advisory locks, the second one is the user or account id
+USER_IMPORT_LOCK = 7301
+ACCOUNT_IMPORT_LOCK = 7302
+
+
+def claim_pending_statement_files():
+    """
+    Moves the PENDING files and the stale PROCESSING ones to PROCESSING and
+    returns their ids. Files locked by a concurrent claim are skipped, so
+    every file is claimed once.
+    """
+    now = timezone.now()
+    stale = Q(status=BankExportFiles.Status.PROCESSING, claimed_at__lt=now - timedelta(seconds=settings.STATEMENT_CLAIM_TIMEOUT))
+    with db_transaction.atomic():
+        ids = list(
+            BankExportFiles.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=BankExportFiles.Status.PENDING) | stale)
+            .order_by('uploaded_at', 'id')
+            .values_list('id', flat=True)
+        )
+        BankExportFiles.objects.filter(id__in=ids).update(status=BankExportFiles.Status.PROCESSING, claimed_at=now)
+    return ids
+
+
+def release_statement_files(file_ids):
+    """Returns claimed files that could not be enqueued to PENDING."""
+    BankExportFiles.objects.filter(id__in=file_ids, status=BankExportFiles.Status.PROCESSING).update(status=BankExportFiles.Status.PENDING)
+
+
+def lock_import_accounts(user_id, account_id=None):
+    """
+    Waits for the chunks of the other imports into the account (or, without
+    `account_id`, into any account of the user) and holds the lock until the
+    end of the current transaction. Does nothing on databases without
+    advisory locks.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    if not connection.in_atomic_block:
+        raise RuntimeError("Import locks are released on commit and must be taken inside a transaction.")
+    with connection.cursor() as cursor:
+        if account_id is None:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [USER_IMPORT_LOCK, user_id])
+        else:
+            cursor.execute('SELECT pg_advisory_xact_lock_shared(%s, %s)', [USER_IMPORT_LOCK, user_id])
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ACCOUNT_IMPORT_LOCK, account_id])
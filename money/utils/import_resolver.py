@@ -0,0 +1,59 @@
+# money/utils/import_resolver.py
+from money.models import Account, Currency
+
+# Marks a lookup that is not restricted by currency
+_ANY_CURRENCY = object()
+
+
+class _AccountTrieNode:
+    __slots__ = ('children', 'accounts')
+
+    def __init__(self):
+        self.children = {}
+        # Accounts whose number starts with the prefix of this node, ordered by id
+        self.accounts = []
+
+
+class ImportResolver:
+    """
+    Resolves accounts and currencies for a single statement import.
+
+    All accounts of the user and all currencies are loaded once, after that
+    the lookups are answered from memory. The results are the same as the
+    `.filter(...).first()` queries they replace: when several objects match,
+    the one with the lowest id wins.
+    """
+    def __init__(self, user):
+        self.user = user
+        self._account_trie = _AccountTrieNode()
+        self._currencies = {}
+
+        for account in Account.objects.filter(user=user).select_related('currency').order_by('id'):
+            node = self._account_trie
+            node.accounts.append(account)
+            for char in account.account_number:
+                node = node.children.setdefault(char, _AccountTrieNode())
+                node.accounts.append(account)
+
+        for currency in Currency.objects.order_by('id'):
+            self._currencies.setdefault(currency.code, currency)
+
+    def get_account(self, account_number_prefix, currency_code=_ANY_CURRENCY):
+        """
+        Returns the first account whose number starts with the given prefix,
+        optionally restricted to accounts in the given currency.
+        """
+        node = self._account_trie
+        for char in account_number_prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+
+        for account in node.accounts:
+            if currency_code is _ANY_CURRENCY or account.currency.code == currency_code:
+                return account
+        return None
+
+    def get_currency(self, code):
+        """Returns the currency with the given code or None."""
+        return self._currencies.get(code)
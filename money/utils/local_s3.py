@@ -0,0 +1,64 @@
+# money/utils/local_s3.py
+import hashlib
+import os
+
+
+class LocalStreamingBody:
+    """A file-backed stand-in for botocore's StreamingBody."""
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+
+    def read(self, amt=None):
+        return self._file.read() if amt is None else self._file.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self._file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class LocalS3Client:
+    """
+    A filesystem-backed stand-in for the subset of the boto3 S3 client we use.
+    Objects are stored as files under <root>/<bucket>/<key>. Used for local
+    development and benchmarks, see settings.LOCAL_S3_ROOT.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def _etag(self, path):
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return f'"{md5.hexdigest()}"'
+
+    def upload_fileobj(self, fileobj, bucket, key, Callback=None, **kwargs):
+        """Like boto3's upload_fileobj: the transfer Config is ignored, Callback gets the copied bytes."""
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                f.write(chunk)
+                if Callback is not None:
+                    Callback(len(chunk))
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        return {'ContentLength': os.path.getsize(path), 'ETag': self._etag(path)}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        return {
+            'Body': LocalStreamingBody(path),
+            'ContentLength': os.path.getsize(path),
+            'ETag': self._etag(path),
+        }
@@ -0,0 +1,158 @@
+# money/utils/monthly_aggregates.py
+"""
+Incremental maintenance of MonthlyAggregate.
+
+Changes to transactions are collected in an AggregateDelta (the amount and
+count to add or subtract per aggregate key) and applied with a few bulk
+queries, so an import of thousands of rows touches only the few
+(account, category, month) groups it changed.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from money.models import MonthlyAggregate, Transaction
+
+_CENT = Decimal('0.01')
+
+
+def aggregate_key(transaction):
+    """(user, account, category, type, month, currency) of a transaction, None if it has no date."""
+    if transaction.date is None:
+        return None
+    return (
+        transaction.user_id,
+        transaction.account_id,
+        transaction.category_id,
+        transaction.transaction_type,
+        transaction.date.replace(day=1),
+        transaction.currency_id,
+    )
+
+
+def _amount(value):
+    """The amount as stored in the database, save() may leave a float in it."""
+    if value is None:
+        return Decimal(0)
+    return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+class AggregateDelta:
+    """Changes to MonthlyAggregate collected in memory and written by apply()."""
+    def __init__(self):
+        self._changes = defaultdict(lambda: [Decimal(0), 0])
+
+    def add(self, transaction, sign=1):
+        """Counts a new transaction in (sign=1) or a removed one out (sign=-1)."""
+        self.add_key(aggregate_key(transaction), sign * _amount(transaction.amount), sign)
+
+    def add_key(self, key, amount, count):
+        """Adds `amount` and `count` (negative to subtract) to the group `key`."""
+        if key is None:
+            return
+        change = self._changes[key]
+        change[0] += amount
+        change[1] += count
+
+    def move(self, transaction, old_key, old_amount=None):
+        """Moves a transaction from the group `old_key` (where it had `old_amount`) to its current group."""
+        amount = _amount(transaction.amount)
+        self.add_key(old_key, -(amount if old_amount is None else _amount(old_amount)), -1)
+        self.add_key(aggregate_key(transaction), amount, 1)
+
+    def apply(self):
+        """
+        Writes the collected changes: the touched groups are read with one SELECT
+        and written with one bulk UPDATE, one bulk INSERT and one DELETE of the
+        groups left empty.
+        """
+        changes, self._changes = self._changes, defaultdict(lambda: [Decimal(0), 0])
+        changes = {key: change for key, change in changes.items() if change[0] or change[1]}
+        if not changes:
+            return
+        with db_transaction.atomic():
+            rows = MonthlyAggregate.objects.select_for_update().filter(
+                account_id__in={key[1] for key in changes},
+                month__in={key[4] for key in changes},
+            )
+            updated, emptied = [], []
+            for row in rows:
+                change = changes.pop(_row_key(row), None)
+                if change is None:
+                    continue
+                row.amount += change[0]
+                row.count += change[1]
+                (updated if row.count > 0 else emptied).append(row)
+            if updated:
+                MonthlyAggregate.objects.bulk_update(updated, ['amount', 'count'])
+            if emptied:
+                MonthlyAggregate.objects.filter(id__in=[row.id for row in emptied]).delete()
+            # A group that is not there to subtract from needs a rebuild of the table
+            created = [(key, amount, count) for key, (amount, count) in changes.items() if count > 0]
+            if not created:
+                return
+            try:
+                with db_transaction.atomic():
+                    MonthlyAggregate.objects.bulk_create([
+                        MonthlyAggregate(**_key_lookup(key), amount=amount, count=count)
+                        for key, amount, count in created
+                    ])
+            except IntegrityError:
+                # Another process has just created some of the groups
+                for key, amount, count in created:
+                    _apply_change(_key_lookup(key), amount, count)
+
+
+def _row_key(row):
+    return (row.user_id, row.account_id, row.category_id, row.transaction_type, row.month, row.currency_id)
+
+
+def _key_lookup(key):
+    user_id, account_id, category_id, transaction_type, month, currency_id = key
+    return {
+        'user_id': user_id, 'account_id': account_id, 'category_id': category_id,
+        'transaction_type': transaction_type, 'month': month, 'currency_id': currency_id,
+    }
+
+
+def _apply_change(lookup, amount, count):
+    rows = MonthlyAggregate.objects.filter(**lookup)
+    if rows.update(amount=F('amount') + amount, count=F('count') + count):
+        return
+    try:
+        with db_transaction.atomic():
+            MonthlyAggregate.objects.create(**lookup, amount=amount, count=count)
+    except IntegrityError:
+        rows.update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def rebuild_monthly_aggregates(user=None):
+    """
+    Recomputes the aggregates (of one user or of everybody) from Transaction with
+    one grouped query and returns the number of groups.
+    """
+    transactions = Transaction.objects.all()
+    aggregates = MonthlyAggregate.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        aggregates = aggregates.filter(user=user)
+
+    groups = (
+        transactions.annotate(month=TruncMonth('date'))
+        .values('user_id', 'account_id', 'category_id', 'transaction_type', 'month', 'currency_id')
+        .annotate(total=Sum('amount'), rows=Count('id'))
+        .order_by()
+    )
+    rows = [
+        MonthlyAggregate(
+            user_id=group['user_id'], account_id=group['account_id'], category_id=group['category_id'],
+            transaction_type=group['transaction_type'], month=group['month'], currency_id=group['currency_id'],
+            amount=group['total'], count=group['rows'],
+        )
+        for group in groups
+    ]
+    with db_transaction.atomic():
+        aggregates.delete()
+        MonthlyAggregate.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
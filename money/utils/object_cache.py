@@ -0,0 +1,181 @@
+# money/utils/object_cache.py
+"""
+On-disk cache of downloaded S3 objects.
+
+Blobs are stored by the SHA-256 of their content under
+STATEMENT_CACHE_DIR/blobs, so equal files are kept once. A small ref file per
+(bucket, key) remembers the ETag and the digest of the last download. Before
+reading from the cache the ETag is validated with a HEAD request, so a
+replaced object is downloaded again, and a hit costs one HEAD instead of the
+whole body.
+
+Hits touch the blob's mtime and the oldest blobs are removed once the cache
+grows over STATEMENT_CACHE_MAX_BYTES (LRU). Every write is a rename of a
+complete temporary file, so the directory can be shared by several workers.
+"""
+import hashlib
+import json
+import mmap
+import os
+import uuid
+from django.conf import settings
+from .task_metrics import external_call, record_transfer
+
+
+class MappedBody:
+    """
+    A cached blob with the interface of botocore's StreamingBody (read,
+    iter_chunks, close), read through a memory-mapped file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # Empty files can't be mapped
+            if os.fstat(f.fileno()).st_size:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = b''
+        self._position = 0
+
+    def read(self, amt=None):
+        end = len(self._data) if amt is None else self._position + amt
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+class ObjectCache:
+    """Content-addressed blobs under `root`, at most `max_bytes` in total."""
+    def __init__(self, root, max_bytes):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._blobs = os.path.join(self.root, 'blobs')
+        self._refs = os.path.join(self.root, 'refs')
+
+    def _ref_path(self, bucket, key):
+        return os.path.join(self._refs, hashlib.sha256(f'{bucket}/{key}'.encode('utf-8')).hexdigest())
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blobs, digest)
+
+    def _write_atomic(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                result = write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return result
+
+    def _read_ref(self, bucket, key):
+        try:
+            with open(self._ref_path(bucket, key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, body, chunk_size=1024 * 1024):
+        """Writes a body to a temporary file while hashing it and moves it to its blob path."""
+        os.makedirs(self._blobs, exist_ok=True)
+        tmp_path = os.path.join(self._blobs, f'{uuid.uuid4().hex}.tmp')
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in body.iter_chunks(chunk_size):
+                    digest.update(chunk)
+                    f.write(chunk)
+            path = self._blob_path(digest.hexdigest())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            body.close()
+        return digest.hexdigest(), path
+
+    def get_body(self, s3_client, bucket, key):
+        """
+        Returns the body of the object, from the cache if its ETag is unchanged,
+        otherwise downloaded into the cache first. Objects larger than the
+        whole cache are streamed from S3 as they are.
+        """
+        with external_call('s3'):
+            head = s3_client.head_object(Bucket=bucket, Key=key)
+        etag = head.get('ETag')
+
+        ref = self._read_ref(bucket, key)
+        if etag and ref and ref.get('etag') == etag:
+            path = self._blob_path(ref['digest'])
+            try:
+                # The mtime is the last use for the LRU eviction
+                os.utime(path)
+                return MappedBody(path)
+            except FileNotFoundError:
+                pass
+
+        if head.get('ContentLength', 0) > self.max_bytes:
+            with external_call('s3'):
+                return s3_client.get_object(Bucket=bucket, Key=key)['Body']
+
+        with external_call('s3'):
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            digest, path = self._store(response['Body'])
+        record_transfer('s3', os.path.getsize(path))
+        etag = response.get('ETag', etag)
+        if etag:
+            self._write_atomic(
+                self._ref_path(bucket, key),
+                lambda f: f.write(json.dumps({'etag': etag, 'digest': digest}).encode('utf-8')),
+            )
+        body = MappedBody(path)
+        self.evict()
+        return body
+
+    def evict(self):
+        """Removes the least recently used blobs until the cache fits into max_bytes."""
+        try:
+            entries = [entry for entry in os.scandir(self._blobs) if entry.is_file() and not entry.name.endswith('.tmp')]
+        except FileNotFoundError:
+            return
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+            try:
+                # An open mapping of the file stays valid after the unlink
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_object_body(s3_client, bucket, key):
+    """
+    Returns the body of an S3 object through the local cache, or straight from
+    S3 when the cache is disabled (STATEMENT_CACHE_MAX_BYTES = 0).
+    """
+    if not settings.STATEMENT_CACHE_MAX_BYTES:
+        with external_call('s3'):
+            return s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    return ObjectCache(settings.STATEMENT_CACHE_DIR, settings.STATEMENT_CACHE_MAX_BYTES).get_body(s3_client, bucket, key)
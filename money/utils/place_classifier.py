@@ -0,0 +1,177 @@
+# money/utils/place_classifier.py
+"""
+Local place -> category classifier used before the LLM.
+
+A multinomial naive Bayes model over character n-grams of the normalized
+place. The model is a handful of NumPy arrays, so it is trained by the
+train_place_classifier command, saved to PLACE_CLASSIFIER_PATH and predicts
+whole batches of places at once. Transactions it is confident about are
+categorized locally, only the rest is sent to the model.
+"""
+import os
+import uuid
+import numpy as np
+from django.conf import settings
+from money.models import ExpenseCategory, GptLog, Transaction
+from .categorization import apply_answers, normalize_place
+
+# GptLog.model_name of the categorizations made by the classifier
+CLASSIFIER_MODEL_NAME = 'place-classifier'
+NGRAM_SIZES = (3, 4, 5)
+
+
+def place_ngrams(place):
+    """Character n-grams of the normalized place, padded with spaces at the edges."""
+    text = f' {normalize_place(place)} '
+    return [text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)]
+
+
+class PlaceClassifier:
+    """
+    Naive Bayes weights as arrays: `feature_log_prob[ngram, class]` and
+    `class_log_prior[class]`, classes are `category_ids`.
+
+    The log-likelihood of a place is averaged over its known n-grams instead of
+    summed. Overlapping n-grams are far from independent, and the plain sum
+    makes almost every prediction look certain; the average keeps the
+    confidence usable with a threshold.
+    """
+    def __init__(self, vocabulary, category_ids, class_log_prior, feature_log_prob):
+        self.vocabulary = list(vocabulary)
+        self.category_ids = np.asarray(category_ids, dtype=np.int64)
+        self.class_log_prior = np.asarray(class_log_prior, dtype=np.float32)
+        # An extra zero row stands for "no known n-grams" in predict()
+        self.feature_log_prob = np.vstack([
+            np.asarray(feature_log_prob, dtype=np.float32),
+            np.zeros((1, len(self.category_ids)), dtype=np.float32),
+        ])
+        self._index = {ngram: i for i, ngram in enumerate(self.vocabulary)}
+
+    @classmethod
+    def train(cls, places, category_ids, alpha=0.1):
+        """Trains the classifier on parallel lists of places and their category ids."""
+        classes, y = np.unique(np.asarray(category_ids, dtype=np.int64), return_inverse=True)
+
+        vocabulary = {}
+        rows = []
+        cols = []
+        for place, class_index in zip(places, y):
+            for ngram in place_ngrams(place):
+                rows.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                cols.append(class_index)
+
+        counts = np.zeros((len(vocabulary), len(classes)), dtype=np.float64)
+        np.add.at(counts, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1)
+        feature_log_prob = np.log(counts + alpha) - np.log(counts.sum(axis=0) + alpha * len(vocabulary))
+        class_log_prior = np.log(np.bincount(y, minlength=len(classes)) / len(y))
+        return cls(vocabulary, classes, class_log_prior, feature_log_prob)
+
+    def predict(self, places, min_ngrams=1):
+        """
+        Predicts a batch of places.
+        Returns (category ids, confidences) as arrays parallel to `places`.
+        Places with fewer than `min_ngrams` known n-grams get confidence 0:
+        their score is mostly the class prior, which says nothing about them.
+        """
+        if not len(places):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        empty_row = len(self.vocabulary)
+        indices = []
+        offsets = []
+        lengths = []
+        for place in places:
+            known = [self._index[ngram] for ngram in place_ngrams(place) if ngram in self._index]
+            offsets.append(len(indices))
+            lengths.append(len(known))
+            indices.extend(known or [empty_row])
+
+        # Sums of the n-gram rows of every place in one pass
+        sums = np.add.reduceat(self.feature_log_prob[np.asarray(indices, dtype=np.int64)], np.asarray(offsets, dtype=np.int64), axis=0)
+        scores = self.class_log_prior + sums / np.maximum(np.asarray(lengths, dtype=np.float32), 1)[:, None]
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(best)), best]
+        confidences[np.asarray(lengths) < max(min_ngrams, 1)] = 0
+        return self.category_ids[best], confidences
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the target and renamed, so workers never load a half-written file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            category_ids=self.category_ids,
+            class_log_prior=self.class_log_prior,
+            feature_log_prob=self.feature_log_prob[:-1],
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vocabulary'].tolist(), data['category_ids'], data['class_log_prior'], data['feature_log_prob'])
+
+
+# (path, modification time, classifier) of the last loaded model file
+_loaded = (None, None, None)
+
+
+def get_place_classifier():
+    """Returns the trained classifier, reloaded when the file changes, or None if there is none."""
+    global _loaded
+    path = str(settings.PLACE_CLASSIFIER_PATH)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _loaded[:2] != (path, mtime):
+        _loaded = (path, mtime, PlaceClassifier.load(path))
+    return _loaded[2]
+
+
+def categorize_confident(transaction_ids, threshold=None):
+    """
+    Categorizes the transactions the classifier is at least `threshold` sure
+    about (PLACE_CLASSIFIER_THRESHOLD by default) and returns the ids of the
+    remaining ones, which still need the model.
+    """
+    classifier = get_place_classifier()
+    if classifier is None or not transaction_ids:
+        return list(transaction_ids)
+    if threshold is None:
+        threshold = settings.PLACE_CLASSIFIER_THRESHOLD
+
+    transactions = list(Transaction.objects.filter(id__in=transaction_ids, category__isnull=True).order_by('id'))
+    category_ids, confidences = classifier.predict(
+        [transaction.place for transaction in transactions], min_ngrams=settings.PLACE_CLASSIFIER_MIN_NGRAMS,
+    )
+
+    # Only categories still offered to the model are assigned, and only to their own user:
+    # the classifier is trained on the transactions of all users
+    category_users = dict(
+        ExpenseCategory.objects.filter(for_categorized=True, id__in=set(category_ids.tolist())).values_list('id', 'user_id')
+    )
+    confident = [
+        (transaction, int(category_id), float(confidence))
+        for transaction, category_id, confidence in zip(transactions, category_ids, confidences)
+        if confidence >= threshold and category_users.get(int(category_id)) == transaction.user_id
+    ]
+    if confident:
+        log_entry = GptLog.objects.create(
+            celery_task_id=f'{CLASSIFIER_MODEL_NAME}-{uuid.uuid4().hex}',
+            model_name=CLASSIFIER_MODEL_NAME,
+            result=f"Categorized locally: {len(confident)} of {len(transactions)} transactions, threshold {threshold}.",
+            status=GptLog.Status.SUCCESS,
+        )
+        apply_answers([
+            (transaction, category_id, f'{category_id}-Classifier:{confidence:.2f}', log_entry)
+            for transaction, category_id, confidence in confident
+        ])
+
+    confident_ids = {transaction.id for transaction, _, _ in confident}
+    return [transaction.id for transaction in transactions if transaction.id not in confident_ids]
@@ -0,0 +1,94 @@
+# money/utils/place_rules.py
+"""
+Learning of EXACT PlaceCategoryMapping rules from past categorizations.
+
+Every categorized expense is a vote of its place for its current category.
+That category is what the model answered (TransactionCategoryLog), unless
+somebody corrected it in the admin afterwards, in which case the correction
+wins. A place whose votes consistently agree becomes an EXACT rule, so the
+rule matcher categorizes it at import time and it never reaches the model.
+The fallback category is what the model answers when it doesn't know, so it
+is no vote at all.
+"""
+from collections import Counter, defaultdict
+from typing import NamedTuple
+from django.db import transaction as db_transaction
+from money.models import PlaceCategoryMapping, Transaction, TransactionCategoryLog
+from .categorization import FALLBACK_CATEGORY_ID
+from .category_matcher import CategoryMatcher, invalidate_category_matcher
+
+# PlaceCategoryMapping.place_keyword is limited to 255 characters
+MAX_KEYWORD_LENGTH = 255
+
+
+class PlaceRuleProposal(NamedTuple):
+    place: str
+    category_id: int
+    support: int  # categorized transactions with the place
+    share: float  # part of them in category_id
+    corrections: int  # of them, model answers corrected by hand
+
+
+def _model_category_id(category_log):
+    """Category id of a logged model answer '<id>-<parent>:<name>', None if there is none."""
+    raw_category_id = category_log.split('-')[0].strip()
+    return int(raw_category_id) if raw_category_id.isdigit() else None
+
+
+def mine_place_rules(user, min_support=3, min_share=0.9):
+    """
+    Returns PlaceRuleProposal for the user's places not covered by any rule yet
+    whose categorized transactions are at least `min_support` and agree on one
+    category in at least `min_share` of the cases. Places are compared
+    lowercased, the way the matcher compares EXACT rules.
+    """
+    expenses = Transaction.objects.filter(
+        user=user, transaction_type='expense', category__isnull=False, place__isnull=False,
+    ).exclude(place='').exclude(category_id=FALLBACK_CATEGORY_ID)
+
+    # The latest model answer of every transaction, to tell corrections apart
+    model_answers = {}
+    logs = TransactionCategoryLog.objects.filter(transaction__in=expenses).order_by('id')
+    for transaction_id, category_log in logs.values_list('transaction_id', 'category_log'):
+        model_answers[transaction_id] = _model_category_id(category_log)
+
+    votes = defaultdict(Counter)
+    corrections = Counter()
+    for transaction_id, place, category_id in expenses.values_list('id', 'place', 'category_id'):
+        place = place.lower()
+        votes[place][category_id] += 1
+        model_category_id = model_answers.get(transaction_id, category_id)
+        if model_category_id != category_id:
+            corrections[place, category_id] += 1
+
+    matcher = CategoryMatcher.for_user(user)
+    proposals = []
+    for place, counter in votes.items():
+        if len(place) > MAX_KEYWORD_LENGTH or matcher.match(place) is not None:
+            continue
+        support = sum(counter.values())
+        category_id, count = counter.most_common(1)[0]
+        share = count / support
+        if support >= min_support and share >= min_share:
+            proposals.append(PlaceRuleProposal(place, category_id, support, share, corrections[place, category_id]))
+
+    proposals.sort(key=lambda proposal: (-proposal.support, proposal.place))
+    return proposals
+
+
+def create_place_rules(user, proposals):
+    """Creates EXACT rules for the proposals and returns the number of rules that did not exist yet."""
+    rules = [
+        PlaceCategoryMapping(
+            user=user, place_keyword=proposal.place, category_id=proposal.category_id,
+            match_type=PlaceCategoryMapping.MatchType.EXACT,
+        )
+        for proposal in proposals
+    ]
+    user_rules = PlaceCategoryMapping.objects.filter(user=user)
+    with db_transaction.atomic():
+        before = user_rules.count()
+        PlaceCategoryMapping.objects.bulk_create(rules, ignore_conflicts=True)
+        # bulk_create sends no post_save, so the cached matcher is invalidated here
+        db_transaction.on_commit(lambda: invalidate_category_matcher(user.id))
+        return user_rules.count() - before
@@ -1,16 +1,92 @@
 # money/utils/s3_utils.py
+import codecs
+import os
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from django.conf import settings
+from .local_s3 import LocalS3Client
+from .task_metrics import external_call, record_transfer
+
+# (process id, settings the client was built with, client) of the shared client
+_client = (None, None, None)
+_client_lock = threading.Lock()
+
+
+def _create_s3_client():
+    if settings.LOCAL_S3_ROOT:
+        return LocalS3Client(settings.LOCAL_S3_ROOT)
 
-def get_s3_client():
-    """
-    Initializes and returns an S3 client.
-    """
     session = boto3.session.Session()
-    s3_client = session.client(
+    return session.client(
         service_name='s3',
         endpoint_url=settings.YANDEX_ENDPOINT,
         aws_access_key_id=settings.YANDEX_ACCESS_KEY,
         aws_secret_access_key=settings.YANDEX_SECRET_KEY,
+        config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS),
+    )
+
+def get_s3_client():
+    """
+    Returns the S3 client of this process, created on the first call.
+    boto3 clients are thread-safe, so one client and its connection pool are
+    shared by all tasks of a worker process. A forked process builds its own.
+    If settings.LOCAL_S3_ROOT is set, returns a filesystem-backed stand-in instead.
+    """
+    global _client
+    client_settings = (settings.LOCAL_S3_ROOT, settings.YANDEX_ENDPOINT, settings.YANDEX_ACCESS_KEY, settings.S3_MAX_POOL_CONNECTIONS)
+    pid, built_with, client = _client
+    if pid != os.getpid() or built_with != client_settings:
+        with _client_lock:
+            pid, built_with, client = _client
+            if pid != os.getpid() or built_with != client_settings:
+                client = _create_s3_client()
+                _client = (os.getpid(), client_settings, client)
+    return client
+
+def get_transfer_config():
+    """Multipart settings of uploads: parts of S3_MULTIPART_CHUNKSIZE sent by S3_MAX_CONCURRENCY threads."""
+    return TransferConfig(
+        multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=settings.S3_MAX_CONCURRENCY,
     )
-    return s3_client
\ No newline at end of file
+
+class TransferProgress:
+    """boto3 transfer callback, counts the bytes sent by the transfer threads."""
+    def __init__(self):
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.bytes += bytes_amount
+
+def upload_fileobj(s3_client, fileobj, bucket, key):
+    """
+    Uploads a file object with the multipart transfer settings and records
+    the call and the uploaded bytes in the task metrics. Returns the bytes sent.
+    """
+    progress = TransferProgress()
+    with external_call('s3'):
+        s3_client.upload_fileobj(fileobj, bucket, key, Config=get_transfer_config(), Callback=progress)
+    record_transfer('s3', progress.bytes)
+    return progress.bytes
+
+def iter_object_lines(body, encoding='utf-8', chunk_size=64 * 1024):
+    """
+    Decodes an S3 object body incrementally and yields it line by line.
+    Lines are split on '\n' only and keep their line ending, exactly like
+    iterating over io.StringIO, so csv.reader gets the same input.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tail = ''
+    for chunk in body.iter_chunks(chunk_size):
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
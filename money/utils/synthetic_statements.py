@@ -0,0 +1,98 @@
+# money/utils/synthetic_statements.py
+"""
+Generators of synthetic bank statements in the formats our parsers read.
+Used by the benchmark commands; the output is deterministic for a given seed.
+"""
+import random
+from datetime import date, timedelta
+
+PLACES = [
+    'WOOLWORTHS 1234 SYDNEY', 'COLES EXPRESS', 'MAGNUM SUPERMARKET', 'SMALL', 'YANDEX GO',
+    'SPOTIFY', 'Coffee Shop', 'KFC ALMATY', 'APTEKA PLUS', 'SHELL FUEL', 'UBER TRIP', 'AMAZON MARKETPLACE',
+]
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+BCC_ACCOUNT_NUMBER = 'KZ00722S000000000001'
+CSV_ACCOUNT_NUMBER = '0623'
+TRANSFER_ACCOUNT_NUMBER = 'KZ00722S000000000002'
+
+
+def _dates(rows, start=date(2020, 1, 1)):
+    """Spreads `rows` dates evenly over a few years, oldest first."""
+    days = max(1, min(rows, 5 * 365))
+    for i in range(rows):
+        yield start + timedelta(days=i * days // rows)
+
+
+def generate_bcc_html(rows, seed=0):
+    """Returns a BCC HTML statement with `rows` transactions."""
+    rnd = random.Random(seed)
+    parts = [
+        '<html><head><meta charset="utf-8"></head><body>\n',
+        '<table width="90%">\n',
+        f'<tr><td>Выписка по счету:</td><td>:{BCC_ACCOUNT_NUMBER}</td></tr>\n',
+        '<tr><td>Ф.И.О. клиента:</td><td>Test Client</td></tr>\n',
+        '<tr><td>Валюта депозита:</td><td>KZT</td></tr>\n',
+        '</table>\n',
+        '<table cellpadding="2" cellspacing="1"><tr><td>Входящий остаток</td><td>0,00</td></tr></table>\n',
+        '<table cellpadding="2" cellspacing="1">\n',
+        '<tr><th>№</th><th>Дата</th><th>Дебет</th><th>Кредит</th><th>Описание</th></tr>\n',
+    ]
+    for i, day in enumerate(_dates(rows), 1):
+        real_day = day - timedelta(days=rnd.randint(0, 2))
+        amount = f'{rnd.randint(100, 500000):,}'.replace(',', ' ') + f',{rnd.randint(0, 99):02d}'
+        debit, credit = (amount, '') if rnd.random() < 0.85 else ('', amount)
+        description = (
+            f'Retail. Номер устройства в ПЦ, {real_day:%d.%m.%Y} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00, '
+            f'{rnd.choice(PLACES)}, Карта: 4400***{rnd.randint(1000, 9999)}'
+        )
+        if rnd.random() < 0.2:
+            description += f' Валюты:KZT-USD| IPS: {rnd.uniform(400, 550):.2f}'
+        parts.append(
+            f'<tr><td>{i}</td><td>{day:%d.%m.%Y}</td><td>{debit}</td><td>{credit}</td><td>{description}</td></tr>\n'
+        )
+    parts.append('</table>\n</body></html>\n')
+    return ''.join(parts)
+
+
+def generate_generic_csv(rows, seed=0):
+    """Returns a generic (and Freedom Finance) CSV statement with `rows` lines."""
+    rnd = random.Random(seed)
+    lines = []
+    for day in _dates(rows):
+        amount = f'{rnd.randint(1, 200000)}.{rnd.randint(0, 99):02d}'
+        kind = rnd.random()
+        if kind < 0.75:
+            debit, credit, to_account = amount, '', ''
+        elif kind < 0.9:
+            debit, credit, to_account = '', amount, ''
+        else:
+            debit, credit, to_account = amount, '', TRANSFER_ACCOUNT_NUMBER
+        lines.append(f'{day:%d.%m.%Y};{CSV_ACCOUNT_NUMBER};{debit};{credit};{to_account};{rnd.choice(PLACES)} {rnd.randint(1, 999)}\n')
+    return ''.join(lines)
+
+
+def generate_commbank_csv(rows, seed=0):
+    """Returns a CommBank CSV statement with `rows` lines."""
+    rnd = random.Random(seed)
+    lines = []
+    balance = 10000.0
+    for day in _dates(rows):
+        amount = round(rnd.uniform(-300, 150), 2)
+        balance += amount
+        value_day = day - timedelta(days=rnd.randint(0, 3))
+        details = f'{rnd.choice(PLACES)} Card xx{rnd.randint(1000, 9999)} Value Date: {value_day:%d/%m/%Y}'
+        lines.append(
+            f'{day.day:02d}.{MONTHS[day.month - 1]}.{day:%y};{CSV_ACCOUNT_NUMBER};{details};{amount:.2f};{balance:.2f}\n'
+        )
+    return ''.join(lines)
+
+
+# Parser class name -> generator of statements it can read
+GENERATORS = {
+    'BccStatementParser': generate_bcc_html,
+    'BccLxmlStatementParser': generate_bcc_html,
+    'GenericCsvParser': generate_generic_csv,
+    'FFStatementParser': generate_generic_csv,
+    'CommbankStatementParser': generate_commbank_csv,
+}
@@ -0,0 +1,111 @@
+# money/utils/task_metrics.py
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from celery.exceptions import Retry
+from django.db import connection
+from money.models import TaskRunLog
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the task run in progress, None outside of instrumented tasks
+_current_run = ContextVar('task_metrics_current_run', default=None)
+
+
+class _TaskRun:
+    """Counters collected while a task runs."""
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.external_calls = {}
+        self.rows = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        """Django execute_wrapper: counts and times every SQL query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+@contextmanager
+def external_call(service):
+    """
+    Times a call to an external service (S3, Fixer, GPT) for the current task.
+    Does nothing outside of instrumented tasks.
+    """
+    run = _current_run.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if run is not None:
+            stats = run.external_calls.setdefault(service, {'count': 0, 'time': 0.0})
+            stats['count'] += 1
+            stats['time'] += time.perf_counter() - started
+
+
+def record_transfer(service, bytes_amount):
+    """Adds transferred bytes to the external call stats of the service for the current task."""
+    run = _current_run.get()
+    if run is not None:
+        stats = run.external_calls.setdefault(service, {'count': 0, 'time': 0.0})
+        stats['bytes'] = stats.get('bytes', 0) + bytes_amount
+
+
+def record_rows(**counts):
+    """Adds row counters (e.g. created=10) to the current task run."""
+    run = _current_run.get()
+    if run is not None:
+        for name, count in counts.items():
+            run.rows[name] = run.rows.get(name, 0) + count
+
+
+def track_task_metrics(task_func):
+    """
+    Records wall time, CPU time, SQL queries and their time, external calls
+    and row counters of every run of a bound Celery task in TaskRunLog.
+    Put it below @shared_task(bind=True).
+    """
+    @wraps(task_func)
+    def _wrapped_task(self, *args, **kwargs):
+        run = _TaskRun()
+        token = _current_run.set(run)
+        status = TaskRunLog.Status.SUCCESS
+        error_message = ''
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            with connection.execute_wrapper(run):
+                return task_func(self, *args, **kwargs)
+        except Retry as e:
+            status = TaskRunLog.Status.RETRY
+            error_message = str(e.exc or e)
+            raise
+        except Exception as e:
+            status = TaskRunLog.Status.FAILED
+            error_message = str(e)
+            raise
+        finally:
+            _current_run.reset(token)
+            try:
+                TaskRunLog.objects.create(
+                    celery_task_id=self.request.id or '',
+                    task_name=self.name,
+                    status=status,
+                    wall_time=time.perf_counter() - wall_started,
+                    cpu_time=time.thread_time() - cpu_started,
+                    db_queries=run.db_queries,
+                    db_time=run.db_time,
+                    external_calls=run.external_calls,
+                    rows=run.rows,
+                    error_message=error_message,
+                )
+            except Exception:
+                # Metrics must never break the task itself
+                logger.exception("Could not save metrics of task %s", self.request.id)
+    return _wrapped_task
@@ -0,0 +1,49 @@
+# money/utils/transaction_hash.py
+"""
+Content hash identifying a transaction for deduplication.
+
+Transaction.dedup_hash is the SHA-256 of the fields that used to form the
+nine-column unique_together key, so one fixed-width unique index replaces
+the wide one over the unbounded comment text. The module does not import
+the models, so migrations can use it with historical models as well.
+"""
+import hashlib
+import json
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models
+
+DEDUP_FIELDS = (
+    'account', 'transaction_type', 'date', 'date_processing', 'amount',
+    'currency', 'original_amount', 'original_currency', 'comment',
+)
+
+
+def normalize_value(field, value):
+    """Brings a value to the form the database stores it in."""
+    if value is None:
+        return None
+    value = field.to_python(value)
+    if isinstance(field, models.DecimalField):
+        # PostgreSQL rounds numeric values half away from zero
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    return value
+
+
+def dedup_key(instance):
+    """Tuple of the normalized dedup fields of a (possibly unsaved) transaction, NULLs included."""
+    meta = instance._meta
+    return tuple(
+        normalize_value(meta.get_field(name), getattr(instance, meta.get_field(name).attname))
+        for name in DEDUP_FIELDS
+    )
+
+
+def transaction_dedup_hash(instance):
+    """
+    Hex SHA-256 of the dedup fields of a (possibly unsaved) transaction, None
+    if any of them is NULL: like in the old unique index, such rows never collide.
+    """
+    values = dedup_key(instance)
+    if any(value is None for value in values):
+        return None
+    return hashlib.sha256(json.dumps([str(value) for value in values], ensure_ascii=False).encode('utf-8')).hexdigest()
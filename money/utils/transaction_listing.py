@@ -0,0 +1,119 @@
+# money/utils/transaction_listing.py
+"""
+Transaction listing shared by the transactions page and the JSON API.
+
+Pages are cut with keyset (seek) pagination on (date, id) instead of OFFSET:
+the cursor is the (date, id) of the last row shown, and the next page is
+"rows before it in the (-date, -id) order". With the (user, date, id) index
+every page costs the same index range scan, however deep it is.
+"""
+import datetime
+from typing import NamedTuple
+from django.conf import settings
+from django.db.models import Q
+from money.models import Transaction
+
+
+class TransactionPage(NamedTuple):
+    rows: list
+    # Cursor of the next page, None on the last one
+    next_cursor: str
+
+
+def encode_cursor(transaction):
+    """Cursor pointing after `transaction`: its date and id, e.g. '2025-01-31.1234'."""
+    return f'{transaction.date.isoformat()}.{transaction.id}'
+
+
+def decode_cursor(cursor):
+    """(date, id) of a cursor. Raises ValueError if it is malformed."""
+    date_part, _, id_part = cursor.partition('.')
+    return datetime.date.fromisoformat(date_part), int(id_part)
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+def _id(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected an id.")
+
+
+def filter_transactions(user, params):
+    """
+    Transactions of `user` filtered by the query parameters: account, category
+    (an id or 'none' for uncategorized), transaction_type, date_from and
+    date_to (YYYY-MM-DD, inclusive). Raises ValueError on a malformed value.
+    """
+    transactions = Transaction.objects.filter(user=user)
+    if params.get('account'):
+        transactions = transactions.filter(account_id=_id(params['account'], 'account'))
+    if params.get('category') == 'none':
+        transactions = transactions.filter(category__isnull=True)
+    elif params.get('category'):
+        transactions = transactions.filter(category_id=_id(params['category'], 'category'))
+    if params.get('transaction_type'):
+        if params['transaction_type'] not in dict(Transaction.TRANSACTION_TYPE):
+            raise ValueError(f"Invalid transaction_type '{params['transaction_type']}'.")
+        transactions = transactions.filter(transaction_type=params['transaction_type'])
+    if params.get('date_from'):
+        transactions = transactions.filter(date__gte=_date(params['date_from']))
+    if params.get('date_to'):
+        transactions = transactions.filter(date__lte=_date(params['date_to']))
+    return transactions
+
+
+def transaction_page(user, params):
+    """
+    One page of the user's transactions, newest first. Besides the filters of
+    filter_transactions, `params` may hold `cursor` (the next_cursor of the
+    previous page) and `limit` (capped at TRANSACTIONS_PAGE_SIZE_MAX).
+    Raises ValueError on a malformed parameter.
+    """
+    limit = settings.TRANSACTIONS_PAGE_SIZE
+    if params.get('limit'):
+        limit = min(max(_id(params['limit'], 'limit'), 1), settings.TRANSACTIONS_PAGE_SIZE_MAX)
+
+    transactions = filter_transactions(user, params)
+    if params.get('cursor'):
+        try:
+            cursor_date, cursor_id = decode_cursor(params['cursor'])
+        except ValueError:
+            raise ValueError(f"Invalid cursor '{params['cursor']}'.")
+        # date <= cursor date bounds the index range scan, the OR only trims the cursor's day
+        transactions = transactions.filter(Q(date__lte=cursor_date), Q(date__lt=cursor_date) | Q(id__lt=cursor_id))
+
+    # One extra row tells whether there is a next page
+    rows = list(
+        transactions
+        .select_related('currency', 'original_currency', 'category', 'income_category', 'account__currency', 'to_account')
+        .order_by('-date', '-id')[:limit + 1]
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return TransactionPage(rows[:limit], next_cursor)
+
+
+def serialize_transaction(transaction):
+    """JSON representation of a transaction of a page."""
+    return {
+        'id': transaction.id,
+        'date': transaction.date.isoformat(),
+        'transaction_type': transaction.transaction_type,
+        'amount': str(transaction.amount),
+        'currency': transaction.currency.code if transaction.currency else None,
+        'original_amount': str(transaction.original_amount) if transaction.original_amount is not None else None,
+        'original_currency': transaction.original_currency.code if transaction.original_currency else None,
+        'exchange_rate': str(transaction.exchange_rate) if transaction.exchange_rate is not None else None,
+        'category': transaction.category.name if transaction.category else None,
+        'income_category': transaction.income_category.name if transaction.income_category else None,
+        'account': transaction.account.name,
+        'to_account': transaction.to_account.name if transaction.to_account else None,
+        'place': transaction.place,
+        'comment': transaction.comment,
+    }
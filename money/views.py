@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.views import generic
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
@@ -16,12 +16,14 @@ import requests
 import boto3
 import json
 import tempfile
-from .models import Transaction, User, IncomeCategory, ExpenseCategory, Currency, Account, BankExportFiles, ExchangeRate, TransactionCashback
+from .models import Transaction, User, IncomeCategory, ExpenseCategory, Currency, Account, ExchangeRate, TransactionCashback, MonthlyAggregate
 from .forms import BankExportFilesForm, DateCurrencyExchangeForm
 from .decorators import token_required
 from .utils.halyk_parser import normalize_halyk_csv
 from .utils.s3_utils import get_s3_client
-from .tasks import process_statement_import, categorize_transactions_batch, upload_files, fetch_exchange_rates_task
+from .utils.transaction_listing import transaction_page, serialize_transaction
+from .utils.import_locks import claim_pending_statement_files, release_statement_files
+from .tasks import process_statement_import, categorize_transactions_batch, categorize_transactions_job, upload_files, fetch_exchange_rates_task
 
 
 from .parsers.bcc_parser import BccStatementParser
@@ -32,13 +34,78 @@ class TransactionView(LoginRequiredMixin, generic.ListView):
     template_name = 'money/tranlist.html'
     context_object_name = 'latest_transaction_list'
 
+    def get(self, request, *args, **kwargs):
+        try:
+            self.page = transaction_page(request.user, request.GET)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        """Return the last five published questions."""
-        return Transaction.objects.order_by('-date')[:10]
+        """One keyset page of the user's transactions, see utils/transaction_listing.py."""
+        return self.page.rows
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        filters = self.request.GET.copy()
+        filters.pop('cursor', None)
+        context['filters'] = filters
+        context['filter_query'] = filters.urlencode()
+        context['next_cursor'] = self.page.next_cursor
+        context['accounts'] = Account.objects.filter(user=self.request.user).order_by('name')
+        context['categories'] = ExpenseCategory.objects.filter(user=self.request.user).order_by('name')
+        context['transaction_types'] = Transaction.TRANSACTION_TYPE
+        return context
 
 def index(request):
     return render(request, 'money/index.html')
 
+@login_required
+def monthly_summary(request):
+    """
+    Monthly sums per account, category and type of the current user, read from
+    the precomputed MonthlyAggregate rows. Optional filters: month_from and
+    month_to (YYYY-MM), account (id), transaction_type.
+    """
+    rows = MonthlyAggregate.objects.filter(user=request.user).select_related('account', 'category', 'currency')
+    try:
+        if request.GET.get('month_from'):
+            rows = rows.filter(month__gte=datetime.datetime.strptime(request.GET['month_from'], '%Y-%m').date())
+        if request.GET.get('month_to'):
+            rows = rows.filter(month__lte=datetime.datetime.strptime(request.GET['month_to'], '%Y-%m').date())
+        if request.GET.get('account'):
+            rows = rows.filter(account_id=int(request.GET['account']))
+    except ValueError:
+        return JsonResponse({'error': 'month_from and month_to must be in the YYYY-MM format, account must be an id'}, status=400)
+    if request.GET.get('transaction_type'):
+        rows = rows.filter(transaction_type=request.GET['transaction_type'])
+
+    results = [{
+        'month': row.month.strftime('%Y-%m'),
+        'account': row.account.name,
+        'category': row.category.name if row.category else None,
+        'transaction_type': row.transaction_type,
+        'currency': row.currency.code if row.currency else None,
+        'amount': str(row.amount),
+        'count': row.count,
+    } for row in rows.order_by('-month', 'account_id', 'transaction_type', 'category_id')]
+    return JsonResponse({'results': results}, status=200)
+
+@login_required
+def transactions_api(request):
+    """
+    A page of the current user's transactions as JSON, with the filters and
+    the cursor of the transactions page. `next_cursor` is null on the last page.
+    """
+    try:
+        page = transaction_page(request.user, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [serialize_transaction(row) for row in page.rows],
+        'next_cursor': page.next_cursor,
+    }, status=200)
+
 @login_required
 def upload_file(request):
     if request.method == 'POST':
@@ -148,12 +215,17 @@ def upload_external_file(request):
 def parse_statement_files(request):
     results = []
     try:
-        files_pending = BankExportFiles.objects.filter(status=BankExportFiles.Status.PENDING)
+        # Files are claimed (moved to PROCESSING) atomically, overlapping calls never enqueue a file twice
+        file_ids = claim_pending_statement_files()
         
         task_ids = []
 
-        for file in files_pending:
-            task = process_statement_import.delay(settings.YANDEX_BUCKET, file.id)
+        for i, file_id in enumerate(file_ids):
+            try:
+                task = process_statement_import.delay(settings.YANDEX_BUCKET, file_id)
+            except Exception:
+                release_statement_files(file_ids[i:])
+                raise
             task_ids.append(task.id)
 
         results.append({'status': 'success', 'message': 'Tasks started successfully', 'celery_task_ids': task_ids})
@@ -190,3 +262,20 @@ def run_batch_categorization(request):
         "message": f"Task started successfully: {len(batches)} batches created. Transaction to be categorized: {len(ids)}",
         "celery_task_ids": task_ids
     }}, status=200)
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def run_categorization_job(request):
+    # All transactions without a category are categorized by a single job
+    qs = Transaction.objects.filter(category__isnull = True, transaction_type = 'expense', place__isnull = False).order_by('id')
+    ids = list(qs.values_list('id', flat=True))
+
+    task = categorize_transactions_job.delay(ids)
+
+    return JsonResponse({'results': {
+        "status": "success",
+        "message": f"Task started successfully. Transaction to be categorized: {len(ids)}",
+        "celery_task_id": task.id
+    }}, status=200)